@@ -0,0 +1,64 @@
+"""Micro-benchmark of decoding raw lines: extractors.parse_json vs decoder.Decoder.
+
+Usage: python benchmarks/bench_decoder.py data/2019-06-01-0.json.gz [--types PullRequestEvent] [--repeat 3]
+
+Every line of the sample file is decoded by parse_json, which parses them all with the standard library, and by a
+Decoder with each JSON library installed, once for every event type and once for just --types, where lines of other
+types are sniffed and skipped. Lines/sec is reported for each.
+"""
+import argparse
+import gzip
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from decoder import Decoder, json_library
+from extractors import parse_json
+
+
+def load_sample(path):
+    """The lines of a gharchive.org hourly file"""
+    with gzip.open(path, 'rt', encoding='utf-8') as f:
+        return [line for line in f if line.strip()]
+
+
+def run(decode, lines):
+    """Decode every line, returning elapsed seconds"""
+    start = time.perf_counter()
+    for line in lines:
+        decode(line)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('sample', help='a gharchive.org .json.gz hourly file')
+    parser.add_argument('--types', default='PullRequestEvent', help='comma separated event types to decode')
+    parser.add_argument('--repeat', type=int, default=3, help='runs per decoder, the best is reported')
+    args = parser.parse_args()
+
+    lines = load_sample(args.sample)
+    types = args.types.split(',')
+    wanted = sum(1 for line in lines if Decoder().decode(line)[0] in types)
+    print('{:,} lines, {:,} of {}'.format(len(lines), wanted, ', '.join(types)))
+
+    decoders = [('parse_json', parse_json)]
+    for library in ['json', 'orjson']:
+        try:
+            json_library(library)
+        except ImportError:
+            continue
+        decoders.append(('{} all types'.format(library), Decoder(None, library).decode))
+        decoders.append(('{} {} only'.format(library, args.types), Decoder(types, library).decode))
+
+    baseline = None
+    for name, decode in decoders:
+        seconds = min(run(decode, lines) for _ in range(args.repeat))
+        baseline = baseline or seconds
+        print('{:>40}: {:>12,.0f} lines/sec {:>6.1f}x'.format(name, len(lines) / seconds, baseline / seconds))
+
+
+if __name__ == '__main__':
+    main()
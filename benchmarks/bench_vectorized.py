@@ -0,0 +1,142 @@
+"""Benchmark of PullRequests extraction: the extract_pull row path vs the vectorized path.
+
+Usage: python benchmarks/bench_vectorized.py --events 50000 [--batch-rows 10000] [--spark]
+
+The row path is what the Python mode runs per event on the workers: rebuild the event dict from the event cache, run
+extract_pull and fit the row to the schema. The vectorized path only runs Python for the columns that need it, the
+timestamps and licenses, over pandas Series of --batch-rows values as the Arrow batches of a pandas UDF arrive. Both
+are timed over synthetic PullRequestEvents and reported in records/sec. With --spark the whole table is also extracted
+on a local SparkSession in the python, native and vectorized modes, writing Parquet.
+"""
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from event_cache import cache_row, event_of_row
+from extractors import extract_pull
+from schemas import coerce_row, columns
+from synthetic_events import EventGenerator
+
+
+def cache_rows(events):
+    """Synthetic PullRequestEvents as rows of the event cache, by column name"""
+    names = columns('Events')
+    return [dict(zip(names, coerce_row('Events', cache_row(json.loads(line), 'PullRequestEvent')))) for line in events]
+
+
+def hard_columns(rows):
+    """The timestamp and license values of the vectorized path, one list per column, as the UDFs receive them"""
+    timestamps, licenses = {}, {}
+    for row in rows:
+        pull_request = json.loads(row['payload'])['pull_request']
+        values = {}
+        for field in ['created_at', 'updated_at', 'closed_at', 'merged_at']:
+            values['pull_request.' + field] = pull_request.get(field)
+        for side in ['base', 'head']:
+            repo = pull_request[side].get('repo') or {}
+            for field in ['created_at', 'updated_at', 'pushed_at']:
+                values['{}.repo.{}'.format(side, field)] = repo.get(field)
+            license = repo.get('license')
+            licenses.setdefault(side, []).append(json.dumps(license) if license is not None else None)
+        for name, value in values.items():
+            timestamps.setdefault(name, []).append(value)
+    return timestamps, licenses
+
+
+def row_path(rows):
+    """Seconds to extract every row as the Python mode does"""
+    start = time.perf_counter()
+    for row in rows:
+        coerce_row('PullRequests', extract_pull(event_of_row(row)))
+    return time.perf_counter() - start
+
+
+def vectorized_path(timestamps, licenses, batch_rows):
+    """Seconds to compute the hard columns in batches as the vectorized mode's UDFs do"""
+    import pandas as pd
+
+    from vectorized_extract import license_values, parse_timestamps
+
+    start = time.perf_counter()
+    for values in timestamps.values():
+        for i in range(0, len(values), batch_rows):
+            parse_timestamps(pd.Series(values[i:i + batch_rows], dtype=object))
+    for values in licenses.values():
+        for i in range(0, len(values), batch_rows):
+            batch = pd.Series(values[i:i + batch_rows], dtype=object)
+            for key in ['key', 'name']:
+                license_values(batch, pd.Series([key] * len(batch)))
+    return time.perf_counter() - start
+
+
+def spark_paths(rows, work):
+    """Seconds to write PullRequests from a local event cache in each extraction mode"""
+    from pyspark.sql import SparkSession
+
+    from native_extract import extract_table
+    from schemas import spark_schema
+
+    spark = SparkSession.builder.master('local[*]').appName('bench_vectorized').getOrCreate()
+    cache = os.path.join(work, '_events')
+    names = columns('Events')
+    spark.createDataFrame([tuple(row[name] for name in names) for row in rows], spark_schema('Events')) \
+        .write.partitionBy('type', 'created_date').parquet(cache)
+
+    seconds = {}
+    try:
+        for mode in ['python', 'native', 'vectorized']:
+            if mode == 'python':
+                events = spark.read.parquet(cache).where("type = 'PullRequestEvent'").rdd.map(event_of_row)
+                df = spark.createDataFrame(
+                    events.map(lambda event: coerce_row('PullRequests', extract_pull(event))),
+                    spark_schema('PullRequests'), verifySchema=False
+                )
+            else:
+                df = extract_table(spark, cache, 'PullRequests', vectorized=mode == 'vectorized')
+            start = time.perf_counter()
+            df.write.mode('overwrite').parquet(os.path.join(work, mode))
+            seconds[mode] = time.perf_counter() - start
+    finally:
+        spark.stop()
+    return seconds
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--events', type=int, default=20000, help='synthetic PullRequestEvents')
+    parser.add_argument('--batch-rows', type=int, default=10000, help='rows per Arrow batch, as maxRecordsPerBatch')
+    parser.add_argument('--repeat', type=int, default=3, help='runs per path, the best is reported')
+    parser.add_argument('--spark', action='store_true', help='also extract on a local SparkSession in each mode')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    generator = EventGenerator(args.seed, {'PullRequestEvent': 1.0})
+    rows = cache_rows(generator.lines(args.events, datetime(2019, 6, 1)))
+    timestamps, licenses = hard_columns(rows)
+
+    before = min(row_path(rows) for _ in range(args.repeat))
+    after = min(vectorized_path(timestamps, licenses, args.batch_rows) for _ in range(args.repeat))
+    for name, seconds in [('extract_pull', before), ('vectorized udfs', after)]:
+        print('{:>16}: {:>12,.0f} records/sec'.format(name, len(rows) / seconds))
+    print('{:>16}: {:.1f}x'.format('speedup', before / after))
+
+    if args.spark:
+        work = tempfile.mkdtemp(prefix='bench-vectorized-')
+        try:
+            for mode, seconds in sorted(spark_paths(rows, work).items()):
+                print('{:>16}: {:>12,.0f} records/sec on Spark'.format(mode, len(rows) / seconds))
+        finally:
+            shutil.rmtree(work, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,212 @@
+"""Benchmark the pipeline on synthetic gharchive.org events.
+
+Measures records/sec and peak RSS for parse_json and every extractor, then runs the single-node engine end to end and,
+with --spark, the Spark job on a local SparkSession, reporting records/sec and bytes written per table. Results are
+saved as JSON, by default to benchmarks/results/<UTC time>.json, and --compare prints the change against an earlier
+results file.
+
+Usage: python benchmarks/run_benchmarks.py --events 50000 [--spark] [--compare benchmarks/results/old.json]
+"""
+import argparse
+import json
+import os
+import platform
+import resource
+import runpy
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from extractors import (
+    extract_create, extract_delete, extract_fork, extract_issue, extract_member, extract_pull, extract_push, parse_json
+)
+from synthetic_events import DEFAULT_MIX, EventGenerator, parse_mix
+
+EXTRACTORS = [
+    ('extract_create', 'CreateEvent', extract_create),
+    ('extract_delete', 'DeleteEvent', extract_delete),
+    ('extract_fork', 'ForkEvent', extract_fork),
+    ('extract_issue', 'IssuesEvent', extract_issue),
+    ('extract_member', 'MemberEvent', extract_member),
+    ('extract_push', 'PushEvent', extract_push),
+    ('extract_pull', 'PullRequestEvent', extract_pull),
+]
+
+
+def peak_rss_mb(who=resource.RUSAGE_SELF):
+    """Peak resident set size so far, in MB (ru_maxrss is KB on Linux, bytes on macOS)"""
+    maxrss = resource.getrusage(who).ru_maxrss
+    return round(maxrss / (1024.0 * 1024.0 if sys.platform == 'darwin' else 1024.0), 1)
+
+
+def timed(fn, items):
+    """Run fn over items, returning records/sec"""
+    start = time.perf_counter()
+    for item in items:
+        fn(item)
+    elapsed = time.perf_counter() - start
+    return round(len(items) / elapsed) if elapsed else None
+
+
+def table_bytes(output):
+    """Bytes written per table directory under an output path"""
+    sizes = {}
+    for table in sorted(os.listdir(output)):
+        path = os.path.join(output, table)
+        if not os.path.isdir(path) or table.startswith('_'):
+            continue
+        sizes[table] = sum(
+            os.path.getsize(os.path.join(d, f)) for d, _, files in os.walk(path) for f in files
+            if not f.startswith('.') and not f.startswith('_')
+        )
+    return sizes
+
+
+def bench_extractors(generator, events):
+    """records/sec of parse_json and each extractor over events generated in memory"""
+    lines = list(generator.lines(events, datetime(2019, 6, 1)))
+    results = {'parse_json': {'records': len(lines), 'records_per_sec': timed(parse_json, lines),
+                              'peak_rss_mb': peak_rss_mb()}}
+
+    parsed = [json.loads(line) for line in lines]
+    for name, event_type, extractor in EXTRACTORS:
+        records = [r for r in parsed if r['type'] == event_type]
+        results[name] = {
+            'records': len(records),
+            'records_per_sec': timed(extractor, records) if records else None,
+            'peak_rss_mb': peak_rss_mb(),
+        }
+    return results
+
+
+def bench_local_engine(input_dir, output, workers, lines):
+    """Run build_parquet_tables.local.py end to end"""
+    start = time.perf_counter()
+    subprocess.check_call(
+        [sys.executable, os.path.join(ROOT, 'build_parquet_tables.local.py'), os.path.join(input_dir, '*.json.gz'),
+         '--output', output, '--workers', str(workers)],
+        stdout=subprocess.DEVNULL
+    )
+    elapsed = time.perf_counter() - start
+    return {
+        'seconds': round(elapsed, 2),
+        'records_per_sec': round(lines / elapsed),
+        'peak_rss_mb': peak_rss_mb(resource.RUSAGE_CHILDREN),
+        'bytes_per_table': table_bytes(output),
+    }
+
+
+def bench_spark(input_dir, output, lines, extraction_mode):
+    """Run build_parquet_tables.spark.py on a local SparkSession, as the pyspark shell would"""
+    from pyspark.sql import SparkSession
+
+    spark = SparkSession.builder.master('local[*]').appName('benchmark').getOrCreate()
+    os.environ.update({
+        'GITHUB_INPUT_PATH': os.path.join(input_dir, '*.json.gz'),
+        'GITHUB_OUTPUT_PATH': output,
+        'GITHUB_EXTRACTION_MODE': extraction_mode,
+    })
+    start = time.perf_counter()
+    try:
+        runpy.run_path(os.path.join(ROOT, 'build_parquet_tables.spark.py'),
+                       init_globals={'sc': spark.sparkContext, 'spark': spark})
+    finally:
+        spark.stop()
+    elapsed = time.perf_counter() - start
+    return {
+        'extraction_mode': extraction_mode,
+        'seconds': round(elapsed, 2),
+        'records_per_sec': round(lines / elapsed),
+        'driver_peak_rss_mb': peak_rss_mb(),
+        'bytes_per_table': table_bytes(output),
+    }
+
+
+def compare(results, previous):
+    """Print records/sec now against an earlier results file"""
+    def rates(r, prefix=''):
+        for key, value in sorted(r.items()):
+            if isinstance(value, dict) and 'records_per_sec' in value:
+                yield prefix + key, value['records_per_sec']
+            elif isinstance(value, dict):
+                for item in rates(value, prefix + key + '.'):
+                    yield item
+
+    before = dict(rates(previous))
+    for key, rate in rates(results):
+        if before.get(key) and rate:
+            print('{:<40} {:>12,} -> {:>12,} records/sec ({:+.1%})'.format(
+                key, before[key], rate, float(rate) / before[key] - 1
+            ))
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], cwd=ROOT).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--events', type=int, default=20000, help='synthetic events per hour and for the extractors')
+    parser.add_argument('--hours', type=int, default=2, help='hourly files for the end to end runs')
+    parser.add_argument('--mix', type=parse_mix, default=None, help='event type weights, i.e. PushEvent=0.6,...')
+    parser.add_argument('--text-bytes', type=int, default=200, help='mean size of free text fields')
+    parser.add_argument('--mean-commits', type=float, default=3.0, help='mean commits per push')
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help='local engine processes')
+    parser.add_argument('--spark', action='store_true', help='also run the Spark job on a local SparkSession')
+    parser.add_argument('--extraction-mode', default='python', help='Spark extraction mode, python, native or vectorized')
+    parser.add_argument('--results', default=None, help='where to save the results JSON')
+    parser.add_argument('--compare', default=None, help='an earlier results JSON to compare with')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    config = {k: v for k, v in vars(args).items() if k not in ('results', 'compare')}
+    config['mix'] = args.mix or DEFAULT_MIX
+    results = {
+        'started_at': datetime.utcnow().isoformat() + 'Z',
+        'git_commit': git_commit(),
+        'python': platform.python_version(),
+        'machine': platform.platform(),
+        'config': config,
+    }
+
+    generator = EventGenerator(args.seed, args.mix, args.text_bytes, args.mean_commits)
+    results['extractors'] = bench_extractors(generator, args.events)
+
+    work = tempfile.mkdtemp(prefix='gharchive-bench-')
+    try:
+        input_dir = os.path.join(work, 'input')
+        generator.write_hours(input_dir, datetime(2019, 6, 1), args.hours, args.events)
+        lines = args.hours * args.events
+
+        results['local_engine'] = bench_local_engine(input_dir, os.path.join(work, 'local'), args.workers, lines)
+        if args.spark:
+            results['spark'] = bench_spark(input_dir, os.path.join(work, 'spark'), lines, args.extraction_mode)
+    finally:
+        shutil.rmtree(work, ignore_errors=True)
+
+    path = args.results or os.path.join(
+        ROOT, 'benchmarks', 'results', '{:%Y%m%dT%H%M%S}.json'.format(datetime.utcnow())
+    )
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, 'w') as f:
+        json.dump(results, f, indent=2, sort_keys=True)
+
+    print(json.dumps(results, indent=2, sort_keys=True))
+    print('Saved to ' + path)
+    if args.compare:
+        with open(args.compare) as f:
+            compare(results, json.load(f))
+
+
+if __name__ == '__main__':
+    main()
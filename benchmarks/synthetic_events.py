@@ -0,0 +1,294 @@
+"""Synthetic gharchive.org events for benchmarks.
+
+Generates events shaped like the real archive's for every event type the pipeline reads, plus the high volume ones it
+skips, with a configurable mix of types, free text sizes and number of commits per push. Output is deterministic for
+a seed.
+
+Usage: python benchmarks/synthetic_events.py --output /tmp/gharchive --hours 4 --events-per-hour 50000 \
+    --mix PushEvent=0.6,PullRequestEvent=0.2,IssuesEvent=0.2
+"""
+import argparse
+import gzip
+import json
+import os
+import random
+import string
+from datetime import datetime, timedelta
+
+# Roughly the share of each event type in the 2019 archive
+DEFAULT_MIX = {
+    'PushEvent': 0.50,
+    'CreateEvent': 0.12,
+    'WatchEvent': 0.10,
+    'IssueCommentEvent': 0.08,
+    'PullRequestEvent': 0.07,
+    'IssuesEvent': 0.04,
+    'DeleteEvent': 0.03,
+    'ForkEvent': 0.03,
+    'GollumEvent': 0.01,
+    'MemberEvent': 0.005,
+    'ReleaseEvent': 0.015,
+}
+
+LANGUAGES = ['Java', 'Python', 'JavaScript', 'Go', 'Scala', 'C++', 'Ruby', None]
+LICENSES = [{'key': 'apache-2.0', 'name': 'Apache License 2.0'}, {'key': 'mit', 'name': 'MIT License'}, None]
+
+
+def parse_mix(value):
+    """A mix like PushEvent=0.6,IssuesEvent=0.4 as a dict of weights"""
+    mix = {}
+    for part in value.split(','):
+        event_type, weight = part.split('=')
+        mix[event_type.strip()] = float(weight)
+    return mix
+
+
+class EventGenerator(object):
+    """Makes random but realistically shaped gharchive.org events"""
+
+    def __init__(self, seed=0, mix=None, text_bytes=200, mean_commits=3.0, max_commits=20, repos=10000,
+                 users=50000, apache_share=0.01):
+        self.random = random.Random(seed)
+        self.mix = mix or DEFAULT_MIX
+        self.types = sorted(self.mix)
+        self.weights = [self.mix[t] for t in self.types]
+        self.text_bytes = text_bytes
+        self.mean_commits = mean_commits
+        self.max_commits = max_commits
+        self.repos = repos
+        self.users = users
+        self.apache_share = apache_share
+        self.next_id = 10000000000
+
+    def text(self, mean_bytes):
+        """Free text of about mean_bytes, exponentially distributed like real bodies and messages"""
+        size = int(self.random.expovariate(1.0 / mean_bytes)) if mean_bytes else 0
+        words = []
+        while sum(len(w) + 1 for w in words) < size:
+            words.append(''.join(self.random.choice(string.ascii_lowercase) for _ in range(self.random.randint(2, 9))))
+        return ' '.join(words)
+
+    def sha(self):
+        return '%040x' % self.random.getrandbits(160)
+
+    def timestamp(self, when):
+        return when.strftime('%Y-%m-%dT%H:%M:%SZ')
+
+    def user(self, user_id=None):
+        user_id = user_id or self.random.randint(1, self.users)
+        return {
+            'login': 'user%d' % user_id,
+            'id': user_id,
+            'node_id': 'MDQ6VXNlcj%d' % user_id,
+            'avatar_url': 'https://avatars.githubusercontent.com/u/%d?' % user_id,
+            'gravatar_id': '',
+            'url': 'https://api.github.com/users/user%d' % user_id,
+            'type': 'User',
+            'site_admin': False,
+        }
+
+    def repo_name(self, repo_id):
+        owner = 'apache' if repo_id % int(1 / self.apache_share) == 0 else 'owner%d' % (repo_id % 997)
+        return '%s/project%d' % (owner, repo_id)
+
+    def repo(self, repo_id, when):
+        """A full repository object, like a ForkEvent's forkee or a pull request's base.repo"""
+        name = self.repo_name(repo_id)
+        owner = self.user(repo_id % self.users + 1)
+        owner['login'] = name.split('/')[0]
+        return {
+            'id': repo_id,
+            'node_id': 'MDEwOlJlcG9zaXRvcnk%d' % repo_id,
+            'name': name.split('/')[1],
+            'full_name': name,
+            'private': False,
+            'owner': owner,
+            'html_url': 'https://github.com/' + name,
+            'description': self.text(self.text_bytes // 2),
+            'fork': False,
+            'url': 'https://api.github.com/repos/' + name,
+            # Repository creation dates repeat across events, as they do in the archive
+            'created_at': self.timestamp(datetime(2010, 1, 1) + timedelta(days=repo_id % 3000)),
+            'updated_at': self.timestamp(when - timedelta(minutes=self.random.randint(0, 600))),
+            'pushed_at': self.timestamp(when - timedelta(minutes=self.random.randint(0, 60))),
+            'homepage': None,
+            'size': self.random.randint(0, 500000),
+            'stargazers_count': self.random.randint(0, 5000),
+            'watchers_count': self.random.randint(0, 5000),
+            'language': self.random.choice(LANGUAGES),
+            'has_issues': True,
+            'forks_count': self.random.randint(0, 1000),
+            'open_issues_count': self.random.randint(0, 300),
+            'license': self.random.choice(LICENSES),
+            'forks': self.random.randint(0, 1000),
+            'open_issues': self.random.randint(0, 300),
+            'watchers': self.random.randint(0, 5000),
+            'default_branch': 'master',
+        }
+
+    def commits(self):
+        """Commits for a push: geometrically distributed around mean_commits, capped like the archive at 20"""
+        count = 1
+        while count < self.max_commits and self.random.random() > 1.0 / self.mean_commits:
+            count += 1
+        return [{
+            'sha': self.sha(),
+            'author': {'email': 'dev@example.com', 'name': 'Developer %d' % self.random.randint(1, 1000)},
+            'message': self.text(self.text_bytes),
+            'distinct': True,
+            'url': 'https://api.github.com/repos/x/y/commits/' + self.sha(),
+        } for _ in range(count)]
+
+    def pull_request(self, repo_id, when):
+        merged = self.random.random() < 0.3
+        closed = merged or self.random.random() < 0.2
+        number = self.random.randint(1, 5000)
+        head_repo = None if self.random.random() < 0.02 else self.repo(self.random.randint(1, self.repos), when)
+        return {
+            'url': 'https://api.github.com/repos/x/y/pulls/%d' % number,
+            'id': self.random.randint(1, 300000000),
+            'number': number,
+            'state': 'closed' if closed else 'open',
+            'locked': False,
+            'title': self.text(40),
+            'user': self.user(),
+            'body': self.text(self.text_bytes * 3),
+            'created_at': self.timestamp(when - timedelta(hours=self.random.randint(0, 500))),
+            'updated_at': self.timestamp(when),
+            'closed_at': self.timestamp(when) if closed else None,
+            'merged_at': self.timestamp(when) if merged else None,
+            'merge_commit_sha': self.sha(),
+            'assignee': None,
+            'assignees': [self.user() for _ in range(self.random.randint(0, 2))],
+            'requested_reviewers': [self.user() for _ in range(self.random.randint(0, 2))],
+            'requested_teams': [],
+            'labels': [],
+            'milestone': None,
+            'head': {'label': 'x:branch', 'ref': 'branch', 'sha': self.sha(), 'user': self.user(), 'repo': head_repo},
+            'base': {'label': 'y:master', 'ref': 'master', 'sha': self.sha(), 'user': self.user(),
+                     'repo': self.repo(repo_id, when)},
+            'author_association': self.random.choice(['MEMBER', 'CONTRIBUTOR', 'NONE', 'OWNER']),
+            'merged': merged,
+            'mergeable': None,
+            'rebaseable': None,
+            'mergeable_state': 'unknown',
+            'merged_by': self.user() if merged else None,
+            'comments': self.random.randint(0, 20),
+            'review_comments': self.random.randint(0, 20),
+            'maintainer_can_modify': False,
+            'commits': self.random.randint(1, 30),
+            'additions': self.random.randint(0, 5000),
+            'deletions': self.random.randint(0, 5000),
+            'changed_files': self.random.randint(1, 100),
+        }
+
+    def issue(self, when):
+        closed = self.random.random() < 0.3
+        return {
+            'id': self.random.randint(1, 400000000),
+            'number': self.random.randint(1, 5000),
+            'title': self.text(40),
+            'user': self.user(),
+            'labels': [{'id': self.random.randint(1, 10 ** 9), 'name': 'bug', 'color': 'ee0701', 'default': True}
+                       for _ in range(self.random.randint(0, 2))],
+            'state': 'closed' if closed else 'open',
+            'locked': False,
+            'assignee': self.user() if self.random.random() < 0.2 else None,
+            'assignees': [],
+            'milestone': None,
+            'comments': self.random.randint(0, 30),
+            'created_at': self.timestamp(when - timedelta(hours=self.random.randint(0, 500))),
+            'updated_at': self.timestamp(when),
+            'closed_at': self.timestamp(when) if closed else None,
+            'author_association': 'NONE',
+            'body': self.text(self.text_bytes * 2),
+        }
+
+    def payload(self, event_type, repo_id, when):
+        if event_type == 'PushEvent':
+            commits = self.commits()
+            return {'push_id': self.random.randint(1, 4000000000), 'size': len(commits),
+                    'distinct_size': len(commits), 'ref': 'refs/heads/master', 'head': self.sha(),
+                    'before': self.sha(), 'commits': commits}
+        if event_type in ('CreateEvent', 'DeleteEvent'):
+            return {'ref': 'branch', 'ref_type': 'branch', 'master_branch': 'master', 'description': None,
+                    'pusher_type': 'user'}
+        if event_type == 'ForkEvent':
+            return {'forkee': self.repo(self.random.randint(1, self.repos), when)}
+        if event_type == 'PullRequestEvent':
+            return {'action': self.random.choice(['opened', 'closed', 'reopened']),
+                    'number': self.random.randint(1, 5000), 'pull_request': self.pull_request(repo_id, when)}
+        if event_type == 'IssuesEvent':
+            return {'action': self.random.choice(['opened', 'closed', 'reopened']), 'issue': self.issue(when)}
+        if event_type == 'IssueCommentEvent':
+            return {'action': 'created', 'issue': self.issue(when),
+                    'comment': {'id': self.random.randint(1, 10 ** 9), 'user': self.user(),
+                                'created_at': self.timestamp(when), 'updated_at': self.timestamp(when),
+                                'author_association': 'NONE', 'body': self.text(self.text_bytes)}}
+        if event_type == 'MemberEvent':
+            return {'member': self.user(), 'action': 'added'}
+        if event_type == 'WatchEvent':
+            return {'action': 'started'}
+        return {'action': 'published', 'pages': [{'page_name': 'Home', 'action': 'edited', 'sha': self.sha()}]}
+
+    def event(self, when):
+        """One event of a type drawn from the mix, at time when"""
+        event_type = self.random.choices(self.types, self.weights)[0]
+        repo_id = self.random.randint(1, self.repos)
+        self.next_id += 1
+        event = {
+            'id': str(self.next_id),
+            'type': event_type,
+            'actor': {'id': self.random.randint(1, self.users), 'login': 'user%d' % self.random.randint(1, self.users),
+                      'display_login': 'user', 'gravatar_id': '', 'url': 'https://api.github.com/users/user',
+                      'avatar_url': 'https://avatars.githubusercontent.com/u/1?'},
+            'repo': {'id': repo_id, 'name': self.repo_name(repo_id), 'url': 'https://api.github.com/repos/x/y'},
+            'payload': self.payload(event_type, repo_id, when),
+            'public': True,
+            'created_at': self.timestamp(when),
+        }
+        if self.repo_name(repo_id).startswith('apache/') or self.random.random() < 0.2:
+            org = self.repo_name(repo_id).split('/')[0]
+            event['org'] = {'id': repo_id % 9973, 'login': org, 'gravatar_id': '',
+                            'url': 'https://api.github.com/orgs/' + org, 'avatar_url': ''}
+        return event
+
+    def lines(self, count, hour):
+        """count events spread over one hour, as JSON lines"""
+        for i in range(count):
+            yield json.dumps(self.event(hour + timedelta(seconds=3600.0 * i / count)), separators=(',', ':'))
+
+    def write_hours(self, output, start, hours, events_per_hour):
+        """Write hourly files named like the archive's, returning their paths"""
+        os.makedirs(output, exist_ok=True)
+        paths = []
+        for h in range(hours):
+            hour = start + timedelta(hours=h)
+            path = os.path.join(output, '{:%Y-%m-%d}-{}.json.gz'.format(hour, hour.hour))
+            with gzip.open(path, 'wt', encoding='utf-8') as f:
+                for line in self.lines(events_per_hour, hour):
+                    f.write(line + '\n')
+            paths.append(path)
+        return paths
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--output', required=True, help='directory for the hourly .json.gz files')
+    parser.add_argument('--start', default='2019-06-01', help='first hour, YYYY-MM-DD')
+    parser.add_argument('--hours', type=int, default=1)
+    parser.add_argument('--events-per-hour', type=int, default=10000)
+    parser.add_argument('--mix', type=parse_mix, default=None, help='event type weights, i.e. PushEvent=0.6,...')
+    parser.add_argument('--text-bytes', type=int, default=200, help='mean size of commit messages and bodies')
+    parser.add_argument('--mean-commits', type=float, default=3.0, help='mean commits per push')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    generator = EventGenerator(args.seed, args.mix, args.text_bytes, args.mean_commits)
+    for path in generator.write_hours(args.output, datetime.strptime(args.start, '%Y-%m-%d'), args.hours,
+                                      args.events_per_hour):
+        print(path)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,219 @@
+"""Build the Parquet tables on a single machine, without a Spark cluster.
+
+Runs the same extractors as build_parquet_tables.spark.py over local `.json.gz` hourly files, one file per task in a
+process pool. Each task streams its file through gzip line by line and writes every table it produces with pyarrow in
+record batches, so memory stays bounded however large the file. Tables get the schemas declared in schemas.py, written
+the way Spark writes them, so the output can be read alongside the Spark job's.
+
+Usage: python build_parquet_tables.local.py 'data/2019-06-*.json.gz' --output parquet/ --workers 32
+
+Set GITHUB_REPO_ALLOWLIST and GITHUB_REPO_IDS to keep only some repositories, GITHUB_TEXT_MODE, GITHUB_TEXT_CHARS and
+GITHUB_TEXT_CODEC (or GITHUB_COMMIT_MESSAGE_*) to trim or offload the free text columns, GITHUB_TOLERANT=1 to write
+events that can't be extracted to DeadLetters rather than fail and GITHUB_JSON_LIBRARY to pick the JSON library, as with
+the Spark job. Each part file gets its index entries beside it under <table>/_index, see file_index.py, unless
+GITHUB_FILE_INDEX=0. The tables the Spark job only extracts natively, IssueComments, Stars, Gists and PublicEvents,
+aren't written.
+"""
+import argparse
+import glob
+import gzip
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from column_profiles import TEXT_COLUMNS, arrow_options, side_row, text_policies, trim_row
+from decoder import Decoder, json_library
+from extractors import (
+    dead_letter, extract_create, extract_delete, extract_fork, extract_issue, extract_leniently, extract_member,
+    extract_pull, extract_push
+)
+from file_index import index_file, write_index
+from prefilter import RepoAllowlist
+from schemas import TABLE_FILES, TABLE_SCHEMAS, arrow_schema, coerce
+
+# The extractor for each event type, which returns a row dict or a list of them
+EXTRACTORS = {
+    'CreateEvent': extract_create,
+    'DeleteEvent': extract_delete,
+    'ForkEvent': extract_fork,
+    'IssuesEvent': extract_issue,
+    'MemberEvent': extract_member,
+    'PushEvent': extract_push,
+    'PullRequestEvent': extract_pull,
+}
+
+# The table each row goes to, by the row's type
+ROW_TABLES = {
+    'CreateEvent': 'Creates',
+    'DeleteEvent': 'Deletes',
+    'ForkEvent': 'ForkEvents',
+    'IssuesEvent': 'Issues',
+    'MemberEvent': 'Members',
+    'PushEvent': 'PushEvents',
+    'Commit': 'Commits',
+    'PullRequestEvent': 'PullRequests',
+}
+
+
+class TableWriter(object):
+    """Buffers rows for one table and writes them to a Parquet file in record batches, with the column profiles in
+    column_profiles.py: text compressed with `text_codec`, the rest with `compression`
+    """
+
+    def __init__(self, table, path, batch_rows, compression='snappy', text_codec='gzip'):
+        self.table = table
+        self.path = path
+        self.batch_rows = batch_rows
+        self.schema = arrow_schema(table)
+        self.options = arrow_options(self.schema, compression, text_codec)
+        self.types = TABLE_SCHEMAS[table]
+        self.buffer = []
+        self.writer = None
+        self.rows = 0
+
+    def append(self, row):
+        self.buffer.append(row)
+        if len(self.buffer) >= self.batch_rows:
+            self.flush()
+
+    def flush(self):
+        if not self.buffer:
+            return
+        arrays = [
+            pa.array([coerce(row.get(name), type_string, map_items=True) for row in self.buffer], type=field.type)
+            for (name, type_string), field in zip(self.types, self.schema)
+        ]
+        batch = pa.RecordBatch.from_arrays(arrays, schema=self.schema)
+
+        if self.writer is None:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            self.writer = pq.ParquetWriter(self.path + '.tmp', self.schema, flavor='spark', **self.options)
+        self.writer.write_batch(batch)
+        self.rows += len(self.buffer)
+        self.buffer = []
+
+    def close(self):
+        """Write what is left and move the finished file into place"""
+        self.flush()
+        if self.writer is not None:
+            self.writer.close()
+            os.replace(self.path + '.tmp', self.path)
+
+
+def convert_file(path, output, batch_rows, allowlist, policies=None, tolerant=False, json_library_name=None,
+                 index=True):
+    """Extract every table from one hourly file, returning the file's stats"""
+    start = time.time()
+    name = os.path.basename(path)
+    part = 'part-{}.parquet'.format(name[:-len('.json.gz')] if name.endswith('.json.gz') else name)
+    writers = {}
+    policies = policies or {}
+
+    def append(table, row, compression='snappy'):
+        if table not in writers:
+            text_codec = policies[table].codec if table in policies else compression
+            writers[table] = TableWriter(table, os.path.join(output, TABLE_FILES[table], part), batch_rows,
+                                         compression, text_codec)
+        writers[table].append(row)
+
+    stats = {
+        'file': path, 'lines': 0, 'parse_errors': 0, 'filtered_out': 0, 'dead_letters': 0, 'records_per_type': {}
+    }
+
+    # Only the types we extract are parsed, see decoder.py
+    decoder = Decoder(EXTRACTORS, json_library_name)
+
+    with gzip.open(path, 'rt', encoding='utf-8') as lines:
+        for line in lines:
+            stats['lines'] += 1
+            if allowlist.enabled and not allowlist.line_may_match(line):
+                stats['filtered_out'] += 1
+                continue
+
+            event_type, record, error = decoder.decode(line)
+            if error is not None:
+                stats['parse_errors'] += 1
+                continue
+            if record is not None and allowlist.enabled and not allowlist.record_matches(record):
+                stats['filtered_out'] += 1
+                continue
+
+            stats['records_per_type'][event_type] = stats['records_per_type'].get(event_type, 0) + 1
+            if record is None:
+                continue
+
+            if tolerant:
+                rows, error = extract_leniently(EXTRACTORS[event_type], record)
+                if error:
+                    stats['dead_letters'] += 1
+                    append('DeadLetters', dead_letter(ROW_TABLES[event_type], record, error, path, stats['lines']))
+                    continue
+            else:
+                rows = EXTRACTORS[event_type](record)
+            for row in rows if isinstance(rows, list) else [rows]:
+                table = ROW_TABLES[row['type']]
+                if table in policies:
+                    if policies[table].offloads:
+                        append(TEXT_COLUMNS[table][1], side_row(table, row), policies[table].codec)
+                    row = trim_row(table, row, policies[table])
+                append(table, row)
+
+    for table, writer in writers.items():
+        writer.close()
+        if index and writer.rows:
+            table_path = os.path.abspath(os.path.join(output, TABLE_FILES[table]))
+            write_index(table_path, index_file(table_path, part), part)
+
+    stats['tables'] = {table: writer.rows for table, writer in writers.items()}
+    stats['seconds'] = time.time() - start
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('inputs', nargs='+', help='hourly .json.gz files or globs')
+    parser.add_argument('--output', required=True, help='directory to write the tables under')
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help='processes, one hourly file each')
+    parser.add_argument('--batch-rows', type=int, default=10000, help='rows buffered per table before writing')
+    args = parser.parse_args()
+
+    paths = sorted(set(p for pattern in args.inputs for p in glob.glob(pattern)))
+    if not paths:
+        parser.error('no input files match {}'.format(' '.join(args.inputs)))
+    allowlist = RepoAllowlist.from_environ()
+    policies = text_policies()
+    tolerant = os.environ.get('GITHUB_TOLERANT', '') == '1'
+    library = os.environ.get('GITHUB_JSON_LIBRARY')
+    index = os.environ.get('GITHUB_FILE_INDEX', '1') != '0'
+
+    start = time.time()
+    summary = {'input_files': len(paths), 'input_bytes': sum(os.path.getsize(p) for p in paths),
+               'json_library': json_library(library)[0],
+               'lines': 0, 'parse_errors': 0, 'filtered_out': 0, 'dead_letters': 0, 'records_per_type': {}, 'tables': {}}
+
+    with ProcessPoolExecutor(max_workers=args.workers) as executor:
+        futures = [
+            executor.submit(convert_file, p, args.output, args.batch_rows, allowlist, policies, tolerant, library,
+                            index)
+            for p in paths
+        ]
+        for future in as_completed(futures):
+            stats = future.result()
+            for key in ['lines', 'parse_errors', 'filtered_out', 'dead_letters']:
+                summary[key] += stats[key]
+            for key in ['records_per_type', 'tables']:
+                for k, v in stats[key].items():
+                    summary[key][k] = summary[key].get(k, 0) + v
+
+    summary['seconds'] = round(time.time() - start, 2)
+    summary['records_per_sec'] = round(summary['lines'] / summary['seconds']) if summary['seconds'] else None
+    sys.stdout.write(json.dumps(summary, indent=2, sort_keys=True) + '\n')
+
+
+if __name__ == '__main__':
+    main()
@@ -1,45 +1,443 @@
 import sys, os, re
 import json
 
-from dateutil.parser import parse as duparse
-from pyspark.sql import Row
+from pyspark import StorageLevel
+from pyspark.sql.functions import col, input_file_name, least, lit, sum as sum_
+
+import decoder
+import dedupe
+import column_profiles
+import dimensions
+import event_cache
+import extractors
+import file_index
+import metrics
+import prefilter
+import schemas
+import timestamps
+from column_profiles import TEXT_COLUMNS, side_tables, spark_options, split_text, text_policies, trim_row
+from decoder import Decoder, json_library
+from dedupe import dedupe_events, dedupe_table, new_events, overlapping_dates
+from dimensions import DIMENSION_KEYS, FACT_DIMENSIONS, attribute_columns, latest, normalize, sightings
+from event_cache import cache_row, event_of_row, numbered_lines, source_of_row
+from extractors import (
+    dead_letter, extract_create, extract_delete, extract_fork, extract_issue, extract_leniently, extract_member,
+    extract_pull, extract_push_commits
+)
+from file_index import index_files, table_files
+from layout import OutputLayout, estimate_row_bytes
+from manifest import (
+    Manifest, delete, exists, glob_status, has_parquet, hour_key, list_files, list_hourly_files, new_run_id, publish,
+    replace, write_text
+)
+from metrics import CountsParam, RunMetrics
+import native_extract
+import vectorized_extract
+from native_extract import NATIVE_ONLY_TABLES, NATIVE_TABLES, explode_commits, extract_table
+from prefilter import RepoAllowlist
+from rollups import ROLLUP_SOURCES, ROLLUP_TABLES, in_months, rollup
+from schemas import TABLE_FILES, coerce_push_commits, coerce_row, push_commits_schema, spark_schema, violations
 
 sc, spark # in attendence?
 
-# Load all Github events for the year spanning 04-01-2018 to 03-31-2019
-github_lines = sc.textFile('s3://github-dataset/*.json.gz') # Change me to entire bucket!
+# Ship our modules to the Python workers
+sc.addPyFile(column_profiles.__file__)
+sc.addPyFile(decoder.__file__)
+sc.addPyFile(dedupe.__file__)
+sc.addPyFile(dimensions.__file__)
+sc.addPyFile(event_cache.__file__)
+sc.addPyFile(extractors.__file__)
+sc.addPyFile(file_index.__file__)
+sc.addPyFile(metrics.__file__)
+sc.addPyFile(native_extract.__file__)
+sc.addPyFile(prefilter.__file__)
+sc.addPyFile(schemas.__file__)
+sc.addPyFile(timestamps.__file__)
+sc.addPyFile(vectorized_extract.__file__)
+
+# Where the raw events come from and where the tables go
+INPUT_PATH  = os.environ.get('GITHUB_INPUT_PATH', 's3://github-dataset/*.json.gz') # Change me to entire bucket!
+OUTPUT_PATH = os.environ.get('GITHUB_OUTPUT_PATH', 's3://github-superset-parquet')
+
+# The columnar cache of the raw events, partitioned by type and created_date, that every extractor reads, see
+# event_cache.py. GITHUB_FROM_CACHE=1 rebuilds the tables from the cache without reading the raw events at all.
+CACHE_PATH = os.environ.get('GITHUB_EVENT_CACHE_PATH', OUTPUT_PATH + '/_events')
+FROM_CACHE = os.environ.get('GITHUB_FROM_CACHE', '') == '1'
+
+# 'python' extracts with the functions in extractors.py, 'native' with the schema-driven column expressions in
+# native_extract.py, which keep every record inside the JVM. 'vectorized' uses the same expressions but parses
+# timestamps and licenses like the Python extractors do, with the pandas UDFs in vectorized_extract.py.
+EXTRACTION_MODE = os.environ.get('GITHUB_EXTRACTION_MODE', 'python')
+if EXTRACTION_MODE not in ('python', 'native', 'vectorized'):
+    raise ValueError('GITHUB_EXTRACTION_MODE must be python, native or vectorized, not {}'.format(EXTRACTION_MODE))
+NATIVE = EXTRACTION_MODE in ('native', 'vectorized')
+VECTORIZED = EXTRACTION_MODE == 'vectorized'
+
+# Count the values the Python extractors produce that don't fit the declared schemas, which are otherwise nulled,
+# and keep the rows they came from as JSON under OUTPUT_PATH/_schema_violations/<Table>
+VALIDATE_SCHEMA = os.environ.get('GITHUB_VALIDATE_SCHEMA', '') == '1'
+
+# Only keep events of these repositories, i.e. GITHUB_REPO_ALLOWLIST='apache/*' for just the Apache projects
+ALLOWLIST = RepoAllowlist.from_environ()
+
+# Incremental runs only convert the hourly files not yet in the manifest, appending them to tables partitioned by
+# created_date. Otherwise every table is rebuilt from the whole input.
+INCREMENTAL   = os.environ.get('GITHUB_INCREMENTAL', '') == '1'
+MANIFEST_PATH = os.environ.get('GITHUB_MANIFEST_PATH', OUTPUT_PATH + '/_manifest')
+RUN_ID        = new_run_id()
+STAGING_PATH  = '{}/_staging/{}'.format(OUTPUT_PATH, RUN_ID)
+
+# Partitioning, sort order and file size of the tables, see layout.py. Incremental runs append by partition, so
+# they partition by date unless told to by month.
+LAYOUT = OutputLayout.from_environ(default_partition_by='date' if INCREMENTAL else 'none')
+if INCREMENTAL and not LAYOUT.partition_columns:
+    raise ValueError('Incremental runs append into partitions, set GITHUB_PARTITION_BY to date or month')
+if INCREMENTAL and FROM_CACHE:
+    raise ValueError('Incremental runs convert new hourly files, GITHUB_FROM_CACHE only rebuilds whole tables')
+
+# Incremental runs cache their events in staging, and publish them into the cache with the tables
+EVENTS_PATH = STAGING_PATH + '/_events' if INCREMENTAL else CACHE_PATH
+
+# Only events of these types are parsed and cached, the others are counted and skipped without parsing them, see
+# decoder.py. By default the types some table is extracted from, GITHUB_EVENT_TYPES='*' for all of them.
+# GITHUB_JSON_LIBRARY picks orjson or json, rather than orjson when the workers have it.
+EVENT_TYPES = os.environ.get('GITHUB_EVENT_TYPES', ','.join(sorted(set(t for t, _, _ in NATIVE_TABLES.values()))))
+EVENT_TYPES = None if EVENT_TYPES == '*' else EVENT_TYPES.split(',')
+DECODER = Decoder(EVENT_TYPES, os.environ.get('GITHUB_JSON_LIBRARY'))
+
+# Events repeated in the input are cached once, and Commits and PullRequests rows repeating their natural keys are
+# dropped, see dedupe.py. GITHUB_DEDUPE=0 keeps every copy.
+DEDUPE = os.environ.get('GITHUB_DEDUPE', '1') != '0'
+
+# Each table gets a sidecar index of its row groups' created_at ranges and repo_id, repo_name and actor_id bloom
+# filters under <table>/_index, so lookups of one repository or user only open the files holding it, see
+# file_index.py. GITHUB_FILE_INDEX=0 leaves it out.
+FILE_INDEX = os.environ.get('GITHUB_FILE_INDEX', '1') != '0'
+
+# Commit messages, issue and pull request bodies and repository descriptions are most of the bytes of their tables.
+# GITHUB_TEXT_MODE=truncate keeps GITHUB_TEXT_CHARS characters of each, drop nulls them, and offload moves them whole
+# into side tables like CommitMessages.parquet and IssueTexts.parquet, compressed with GITHUB_TEXT_CODEC, keeping
+# GITHUB_TEXT_CHARS in the main tables. GITHUB_COMMIT_MESSAGE_CHARS and GITHUB_COMMIT_MESSAGE_TABLE=1 still set the
+# policy of Commits alone, see column_profiles.py.
+TEXT_POLICIES = text_policies()
+
+TABLES = ['Creates.parquet', 'Deletes.parquet', 'ForkEvents.parquet', 'PushEvents.Parquet',
+          'Commits.parquet', 'Issues.parquet', 'Members.parquet', 'PullRequests.parquet',
+          'IssueComments.parquet', 'Stars.parquet', 'Gists.parquet', 'PublicEvents.parquet']
+TABLES += [TABLE_FILES[table] for table in side_tables(TEXT_POLICIES)]
+
+# GITHUB_TOLERANT=1 fills the fields older events lack with nulls rather than failing the job, and writes the events
+# that still can't be extracted to DeadLetters.parquet with the error
+TOLERANT = os.environ.get('GITHUB_TOLERANT', '') == '1'
+if TOLERANT:
+    TABLES.append('DeadLetters.parquet')
+
+# GITHUB_DIMENSIONS=add also writes Repos, Users and Orgs tables with the latest attributes seen of each, see
+# dimensions.py. GITHUB_DIMENSIONS=normalize writes them too, and leaves only the ids of repositories, users and
+# organizations in the other tables.
+DIMENSIONS = os.environ.get('GITHUB_DIMENSIONS', '')
+if DIMENSIONS not in ('', 'add', 'normalize'):
+    raise ValueError('GITHUB_DIMENSIONS must be add or normalize, not {}'.format(DIMENSIONS))
+DIMENSION_TABLES = [TABLE_FILES[d] for d in sorted(DIMENSION_KEYS)] if DIMENSIONS else []
+TABLE_NAMES = {f: t for t, f in TABLE_FILES.items()}
+
+# GITHUB_ROLLUPS=1 writes the daily and monthly rollups per repository in rollups.py after the tables. Incremental runs
+# recompute only the months of their hours.
+ROLLUPS = os.environ.get('GITHUB_ROLLUPS', '') == '1'
+ROLLUP_FILES = [TABLE_FILES[t] for t, _ in ROLLUP_TABLES] if ROLLUPS else []
+
+# A JSON report of every run is written under GITHUB_REPORT_PATH, see metrics.py. GITHUB_PROFILE=1 also samples the
+# Python workers' stacks into a <run id>.profile.txt beside it, for flamegraph.pl.
+REPORT_PATH = os.environ.get('GITHUB_REPORT_PATH', OUTPUT_PATH + '/_reports')
+PROFILE = os.environ.get('GITHUB_PROFILE', '') == '1'
+METRICS = RunMetrics(sc, PROFILE)
+
+if FROM_CACHE:
+    if not exists(sc, CACHE_PATH):
+        raise ValueError('GITHUB_FROM_CACHE is set but there is no event cache at {}'.format(CACHE_PATH))
+    input_files = []
+elif INCREMENTAL:
+    manifest = Manifest(sc, MANIFEST_PATH)
+    
+    # Take back anything a failed run left half published, then pick up every hour not yet converted
+    recovered_runs = manifest.recover([OUTPUT_PATH + '/' + table for table in TABLES] + [CACHE_PATH])
+    processed = manifest.processed()
+    input_files = [(f, size) for f, size in list_hourly_files(sc, INPUT_PATH) if f not in processed]
+    
+    if not input_files:
+        print('No new hourly files under {}, nothing to do'.format(INPUT_PATH))
+        sys.exit(0)
+    
+    github_text = spark.read.text([f for f, size in input_files])
+else:
+    input_files = [(status.getPath().toString(), status.getLen()) for status in glob_status(sc, INPUT_PATH)]
+    
+    # Load all Github events for the year spanning 04-01-2018 to 03-31-2019
+    github_text = spark.read.text(INPUT_PATH)
+
+# Every line with the file it came from and its number there, so dead letters can point back at their input
+if not FROM_CACHE:
+    github_lines = github_text.withColumn('file', input_file_name()).rdd.mapPartitions(numbered_lines)
+
+bytes_read = sc.accumulator(0)
+type_counts = sc.accumulator({}, CountsParam())
+filtered_out = sc.accumulator(0)
+parse_errors = sc.accumulator({}, CountsParam())
+skipped = sc.accumulator({}, CountsParam())
+dead_letters = sc.accumulator({}, CountsParam())
+schema_violations = sc.accumulator({}, CountsParam())
+
+def route_event(numbered):
+    """Parse a raw line once into a row of the event cache, counting bytes and records as we go"""
+    
+    source_file, source_line, line = numbered
+    bytes_read.add(len(line.encode('utf-8')) + 1)
+    
+    # Drop events outside the allowlist as early as we can, before paying for parsing when possible
+    if ALLOWLIST.enabled and not ALLOWLIST.line_may_match(line):
+        filtered_out.add(1)
+        return []
+    
+    event_type, record, error = DECODER.decode(line)
+    if ALLOWLIST.enabled and record is not None and not ALLOWLIST.record_matches(record):
+        filtered_out.add(1)
+        return []
+    type_counts.add({event_type: 1})
+    
+    # Lines that don't parse are kept whole as the payload of a ParseError
+    if error is not None:
+        parse_errors.add({error: 1})
+        return [coerce_row('Events', dict(cache_row({}, 'ParseError', source_file, source_line), payload=line))]
+    if record is None:
+        skipped.add({event_type: 1})
+        return []
+    
+    return [coerce_row('Events', cache_row(record, event_type, source_file, source_line))]
+
+# Scan the pile exactly once into the event cache, one directory per type and date, so that every extractor below
+# only reads the events of its own type and never the gzipped JSON. Each task writes whole partitions, rather than
+# every task a file in each of them, and drops the repeats of its events as it goes.
+if FROM_CACHE:
+    counts = spark.read.parquet(CACHE_PATH).groupBy('type').count().collect()
+    type_counts.add({row['type']: row['count'] for row in counts})
+else:
+    with METRICS.stage('route'):
+        routed = github_lines.flatMap(METRICS.timed('route', route_event, flat=True))
+        events = spark.createDataFrame(routed, spark_schema('Events'), verifySchema=False) \
+            .repartition('type', 'created_date')
+        if DEDUPE:
+            events = dedupe_events(events)
+        if DEDUPE and INCREMENTAL and exists(sc, CACHE_PATH):
+            dates = overlapping_dates(hour_key(f) for f, size in input_files)
+            events = new_events(events, spark.read.parquet(CACHE_PATH), dates).repartition('type', 'created_date')
+        events.write.partitionBy('type', 'created_date').mode('overwrite').parquet(EVENTS_PATH)
+
+run_summary = {
+    'input_path': CACHE_PATH if FROM_CACHE else INPUT_PATH,
+    'input_files': len(input_files),
+    'input_bytes': sum(size for f, size in input_files),
+    'bytes_read': bytes_read.value,
+    'records_per_type': type_counts.value,
+    'filtered_out': filtered_out.value,
+    'parse_errors': parse_errors.value,
+    'skipped_per_type': skipped.value,
+    'json_library': json_library(DECODER.library)[0],
+    'duplicates': {},
+    'tables': {}
+}
+
+# The events of each type cached for the tables, none at all when every one was filtered out or a repeat
+cached_counts = {}
+if has_parquet(sc, EVENTS_PATH):
+    cached_counts = spark.read.parquet(EVENTS_PATH).groupBy('type').count().collect()
+    cached_counts = {row['type']: row['count'] for row in cached_counts}
+
+# Events routed, not skipped and yet not cached were repeats
+if DEDUPE and not FROM_CACHE:
+    routed_counts = {t: n - skipped.value.get(t, 0) for t, n in type_counts.value.items()}
+    run_summary['duplicates']['events'] = {
+        t: n - cached_counts.get(t, 0) for t, n in sorted(routed_counts.items()) if n > cached_counts.get(t, 0)
+    }
 
-# Apply the function to every record
-def parse_json(line):
-    record = None
-    try:
-        record = json.loads(line)
-    except json.JSONDecodeError as e:
-        sys.stderr.write(str(e))
-        record = {'error': 'Parse error'}
-    return record
+def events_of_type(t):
+    """Event dicts of one type, read from the event cache rather than the whole pile"""
+    
+    if not event_rows(t):
+        return sc.emptyRDD()
+    cached = spark.read.parquet(EVENTS_PATH).where(col('type') == t)
+    return cached.rdd.map(METRICS.timed('parse.' + t, event_of_row))
 
-github_events = github_lines.map(parse_json)
-github_events = github_events.filter(lambda x: 'error' not in x)
+sighting_paths = {}
 
-# Note there are all kinds of events in the pile
-[x['type'] for x in github_events.take(10) if 'type' in x]
+def write_table(df, table, rows, date_column='created_at', compression=None):
+    """Write a table of about `rows` rows in the configured layout, to staging when running incrementally"""
+    
+    name = TABLE_NAMES[table]
+    path = (STAGING_PATH if INCREMENTAL else OUTPUT_PATH) + '/' + table
+    
+    policy = TEXT_POLICIES.get(name)
+    with METRICS.stage('write.' + name):
+        
+        # Compute the table only once for the dimension tables, the side table of its text and the table itself
+        persisted = None
+        if (DIMENSIONS and name in FACT_DIMENSIONS) or (policy is not None and policy.offloads):
+            df = persisted = df.persist(StorageLevel.MEMORY_AND_DISK)
+        
+        # Keep the entities this table mentions for the dimension tables, with their whole descriptions
+        if DIMENSIONS and name in FACT_DIMENSIONS:
+            for dimension, seen in sightings(df, name).items():
+                sighting_path = '{}/_sightings/{}/{}'.format(STAGING_PATH, name, dimension)
+                latest(seen, dimension).write.mode('overwrite').parquet(sighting_path)
+                sighting_paths.setdefault(dimension, []).append(sighting_path)
+        
+        # Offload or trim the free text, see column_profiles.py
+        side = None
+        if policy is not None:
+            df, side = split_text(df, name, policy)
+        if DIMENSIONS == 'normalize' and name in FACT_DIMENSIONS:
+            df = normalize(df, name)
+        
+        # Size files using how big this table's rows turned out last time
+        row_bytes = estimate_row_bytes(spark, OUTPUT_PATH + '/' + table)
+        LAYOUT.write(df, path, date_column, rows, row_bytes, compression, spark_options(df.columns))
+    
+    if side is not None:
+        write_table(side, TABLE_FILES[TEXT_COLUMNS[name][1]], rows, date_column, policy.codec)
+    if persisted is not None:
+        persisted.unpersist()
+    
+    # Incremental runs index the files they append once they are published
+    if FILE_INDEX and not INCREMENTAL:
+        with METRICS.stage('index.' + name):
+            index_files(sc, path, table_files(sc, path), RUN_ID)
+    
+    METRICS.bytes_written[name] = sum(status.getLen() for status in list_files(sc, path))
+
+def write_dimensions():
+    """Merge the entities seen by this run, and when appending the dimension tables so far, into new dimension tables"""
+    
+    for dimension, paths in sorted(sighting_paths.items()):
+        table = TABLE_FILES[dimension]
+        seen = spark.read.parquet(*paths)
+        if INCREMENTAL and exists(sc, OUTPUT_PATH + '/' + table):
+            seen = seen.union(spark.read.parquet(OUTPUT_PATH + '/' + table).select(seen.columns))
+        
+        path = (STAGING_PATH if INCREMENTAL else OUTPUT_PATH) + '/' + table
+        latest(seen, dimension).write.mode('overwrite').parquet(path)
 
-# Split our events out by type
-split_types = lambda x, t: 'type' in x and x['type'] == t 
+def write_rollups():
+    """Roll up the published tables per repository by day and month, only the months of this run's hours if appending"""
+    
+    tables = {
+        name: spark.read.parquet(OUTPUT_PATH + '/' + TABLE_FILES[name])
+        for name in ROLLUP_SOURCES if has_parquet(sc, OUTPUT_PATH + '/' + TABLE_FILES[name])
+    }
+    if INCREMENTAL:
+        months = sorted(set('{:04d}-{:02d}'.format(*hour_key(f)[:2]) for f, size in input_files))
+        tables = {name: in_months(df, name, months) for name, df in tables.items()}
+    
+    # Appending only replaces the months recomputed, a full run replaces everything
+    spark.conf.set('spark.sql.sources.partitionOverwriteMode', 'dynamic' if INCREMENTAL else 'static')
+    for table, period in ROLLUP_TABLES:
+        rollup(tables, table).repartition(period).write.mode('overwrite').partitionBy(period) \
+            .parquet(OUTPUT_PATH + '/' + TABLE_FILES[table])
+
+def check_row(table, row):
+    """Count the columns of a row dict that don't fit its table's schema"""
+    
+    bad = violations(table, row)
+    if bad:
+        schema_violations.add({table + '.' + column: 1 for column in bad})
+    return row
+
+def to_table(rows, table):
+    """DataFrame of a table from our extractors' row dicts, on the table's declared schema rather than one inferred"""
+    
+    if VALIDATE_SCHEMA:
+        spark.createDataFrame(
+            rows.filter(lambda row: violations(table, row)).map(lambda row: (json.dumps(row, default=str),)), 'value string'
+        ).write.mode('overwrite').text('{}/_schema_violations/{}'.format(OUTPUT_PATH, table))
+        rows = rows.map(lambda row: check_row(table, row))
+    
+    # Shed the text the table won't keep before the rows leave the Python workers, unless a side table or the
+    # dimension tables take it
+    policy = TEXT_POLICIES.get(table)
+    if policy is not None and policy.trims and not policy.offloads and \
+            not (DIMENSIONS and attribute_columns(table) & set(TEXT_COLUMNS[table][0])):
+        rows = rows.map(lambda row: trim_row(table, row, policy))
+    
+    conform = METRICS.timed('conform.' + table, lambda row: coerce_row(table, row))
+    return spark.createDataFrame(rows.map(conform), spark_schema(table), verifySchema=False)
+
+extractions = {}
+
+def extracted(events, extractor, table):
+    """Row dicts of a table from its events, timing the extractor and counting its exceptions"""
+    
+    extractions[table] = extractor
+    if not TOLERANT:
+        return events.map(METRICS.timed('extract.' + table, extractor))
+    
+    def extract(record):
+        rows, error = extract_leniently(extractor, record)
+        if error:
+            dead_letters.add({table: 1})
+        return rows
+    
+    return events.map(METRICS.timed('extract.' + table, extract)).filter(lambda rows: rows is not None)
+
+def write_dead_letters():
+    """Extract the events of the tables that had dead letters again, writing the ones that fail with their errors"""
+    
+    def failures(extractor, table):
+        def fail(row):
+            record = event_of_row(row)
+            rows, error = extract_leniently(extractor, record)
+            return [dead_letter(table, record, error, *source_of_row(row))] if error else []
+        return fail
+    
+    # From the cached rows rather than the event dicts, which leave out the file and line each event came from
+    letters = sc.emptyRDD()
+    for table in sorted(dead_letters.value):
+        extractor = extractions[table]
+        cached = spark.read.parquet(EVENTS_PATH).where(col('type') == NATIVE_TABLES[table][0])
+        letters = letters.union(cached.rdd.flatMap(failures(extractor, table)))
+    
+    write_table(to_table(letters, 'DeadLetters'), 'DeadLetters.parquet', sum(dead_letters.value.values()))
+
+def event_rows(t):
+    """How many events of a type the routing stage cached"""
+    
+    return cached_counts.get(t, 0)
+
+def skip_table(table):
+    """Leave out a table this run has no events for, removing what a full run would otherwise leave of it stale"""
+    
+    if INCREMENTAL:
+        return
+    name = TABLE_NAMES[table]
+    delete(sc, OUTPUT_PATH + '/' + table)
+    if name in TEXT_COLUMNS and TEXT_POLICIES[name].offloads:
+        delete(sc, OUTPUT_PATH + '/' + TABLE_FILES[TEXT_COLUMNS[name][1]])
+
+def read_table(table):
+    """Read back a table just written by this run, which is still in staging when running incrementally, empty if the
+    run wrote no rows to it"""
+    
+    path = (STAGING_PATH if INCREMENTAL else OUTPUT_PATH) + '/' + table
+    if not has_parquet(sc, path):
+        return spark.createDataFrame([], spark_schema(TABLE_NAMES[table]))
+    return spark.read.parquet(path)
 
+# Split our events out by type
 # See https://developer.github.com/v3/activity/events/types/
-create_events         = github_events.filter(lambda x: split_types(x, 'CreateEvent'))
-delete_events         = github_events.filter(lambda x: split_types(x, 'DeleteEvent'))
-fork_events           = github_events.filter(lambda x: split_types(x, 'ForkEvent'))
-gist_events           = github_events.filter(lambda x: split_types(x, 'GistEvent'))
-issue_events          = github_events.filter(lambda x: split_types(x, 'IssuesEvent'))
-issue_comment_events  = github_events.filter(lambda x: split_types(x, 'IssueCommentEvent'))
-member_events         = github_events.filter(lambda x: split_types(x, 'MemberEvent'))
-push_events           = github_events.filter(lambda x: split_types(x, 'PushEvent'))
-pull_events           = github_events.filter(lambda x: split_types(x, 'PullRequestEvent'))
-repo_events           = github_events.filter(lambda x: split_types(x, 'RepositoryEvent'))
-star_events           = github_events.filter(lambda x: split_types(x, 'StarEvent'))
+create_events         = events_of_type('CreateEvent')
+delete_events         = events_of_type('DeleteEvent')
+fork_events           = events_of_type('ForkEvent')
+issue_events          = events_of_type('IssuesEvent')
+member_events         = events_of_type('MemberEvent')
+push_events           = events_of_type('PushEvent')
+pull_events           = events_of_type('PullRequestEvent')
 
 # Check: did it work? - may have to run more than once...
 # [(x[0], x[1]['type']) for x in [
@@ -48,567 +446,191 @@ star_events           = github_events.filter(lambda x: split_types(x, 'StarEvent
 #     ('ForkEvent',   fork_events.first())
 # ]]
 
-# See: https://developer.github.com/v3/activity/events/types/#forkevent
-def extract_fork(f):
-    """Extracts Rows of ForkEvents and their associated fields from a gharchive.org event dict"""
-    
-    # Out forks...
-    out_f = {
-        'id': f['id'],
-        'created_at': duparse(f['created_at']),
-        'type': 'ForkEvent',
-        'public': f['public']
-    }
-    
-    actor = f['actor']
-    out_f['actor_user_id'] = actor['id']
-    out_f['actor_user_name'] = actor['login']
-    
-    org = f['org'] if 'org' in f else {}
-    out_f['from_org_id'] = org['id'] if 'id' in org else ''
-    out_f['from_org_login'] = org['login'] if 'login' in org else ''
-    
-    repo = f['repo']
-    out_f['from_repo_id'] = repo['id']
-    out_f['from_repo_name'] = repo['name']
-    
-    payload = f['payload']
-    forkee = payload['forkee']
-    
-    owner = forkee['owner']
-    out_f['to_user_id'] = owner['id']
-    out_f['to_user_name'] = owner['login']
-    
-    out_f['to_repo_created_at'] = duparse(forkee['created_at'])
-    out_f['to_repo_updated_at'] = duparse(forkee['updated_at'])
-    out_f['to_repo_pushed_at'] = duparse(forkee['pushed_at'])
-    
-    out_f['to_repo_size'] = forkee['size']
-    out_f['to_repo_stargazer_count'] = forkee['stargazers_count']
-    out_f['to_repo_watcher_count'] = forkee['watchers_count']
-    out_f['to_repo_forks_count'] = forkee['forks_count']
-    
-    license = forkee['license'] if 'license' in forkee and isinstance(forkee['license'], dict) else {}
-    out_f['to_license_key'] = license['key'] if 'key' in license else ''
-    out_f['to_license_name'] = license['name'] if 'name' in license else ''
-    
-    return Row(**out_f)
-
-forks = fork_events.map(extract_fork).toDF().select(
-    'id',
-    'type',
-    'created_at',
-    'actor_user_id',
-    'actor_user_name',
-    'from_org_id',
-    'from_org_login',
-    'to_user_id',
-    'to_user_name',
-    'to_repo_created_at',
-    'to_repo_updated_at',
-    'to_repo_pushed_at',
-    'to_repo_size',
-    'to_repo_stargazer_count',
-    'to_repo_watcher_count',
-    'to_repo_forks_count',
-    'to_license_key',
-    'to_license_name',
-    'public'
-)
-forks.write.mode('overwrite').parquet('s3://github-superset-parquet/ForkEvents.parquet')
-
-forks = spark.read.parquet('s3://github-superset-parquet/ForkEvents.parquet')
-forks.show(5)
-
-# See: https://developer.github.com/v3/activity/events/types/#pushevent
-def extract_push(p):
-    """Extracts Rows of PushEvents and their associated Commits from a gharchive.org event dict"""
-    
-    # Out pushes...
-    out_p = {
-        'type': 'PushEvent',
-        'id': p['id'],
-        'created_at': duparse(p['created_at']),
-        'public': p['public']
-    }
-    
-    # Who pushed it?
-    actor = p['actor']
-    out_p['actor_id'] = actor['id']
-    out_p['actor_user_name'] = actor['login']
-    
-    # To what repo?
-    repo = p['repo']
-    out_p['repo_id'] = repo['id']
-    out_p['repo_name'] = repo['name']
-    
-    # What did they push?
-    payload = p['payload']
-    out_p['push_id'] = payload['push_id']
-    out_p['push_size'] = payload['size']
-    out_p['push_ref'] = payload['ref']
-    out_p['push_head'] = payload['head']
-    out_p['push_before'] = payload['before']
-    
-    # Out commits...
-    out_cs = []
-    commits = payload['commits']
-    for c in commits:
-        out_c = {
-            'type': 'Commit',
-            'sha': c['sha'],
-            'repo_id': out_p['repo_id'],
-            'repo_name': out_p['repo_name'],
-            'push_id': out_p['push_id'],
-            'actor_id': out_p['actor_id'],
-            'actor_user_name': out_p['actor_user_name'],
-            'author_name': c['author']['name'],
-            'url': c['url'],
-            'message': c['message'],
-            'push_created_at': out_p['created_at'],
-            'public': out_p['public']
-        }
-        out_cs.append(Row(**out_c))
-        
-    return [Row(**out_p)] + (out_cs)
-
-# Generate both PushEvents and Commits in varyin length lists with flatMap...
-push_and_commits = push_events.flatMap(extract_push)
-
-# Split pushes, make DataFrame and store as CSV for a SQL DB
-pushes_raw = push_and_commits.filter(lambda x: x['type'] == 'PushEvent')
-pushes = pushes_raw.toDF().select(
-    'id',
-    'type',
-    'actor_id',
-    'actor_user_name',
-    'repo_id',
-    'repo_name',
-    'push_id',
-    'push_size',
-    'push_ref',
-    'push_head',
-    'push_before',
-    'created_at',
-    'public'
-)
-pushes.write.mode('overwrite').parquet('s3://github-superset-parquet/PushEvents.Parquet')
-
-pushes = spark.read.parquet('s3://github-superset-parquet/PushEvents.Parquet')
-pushes.show(5)
-
-# Split commits, make DataFrame and store as CSV for a SQL DB
-commits_raw = push_and_commits.filter(lambda x: x['type'] == 'Commit')
-commits = commits_raw.toDF().select(
-    'sha',
-    'type',
-    'push_id',
-    'actor_id',
-    'repo_id',
-    'repo_name',
-    'actor_user_name',
-    'author_name',
-    'url',
-    'message',
-    'push_created_at',
-    'public'
-)
-commits.write.mode('overwrite').parquet('s3://github-superset-parquet/Commits.parquet')
-
-# See https://developer.github.com/v3/activity/events/types/#createvent
-def extract_create(c):
-    """Extract Rows of CreateEvents and their associated fields from a gharchive.org event dict"""
-    
-    # Out creates...
-    out_c = {
-        'id': c['id'],
-        'created_at': duparse(c['created_at']),
-        'type': 'CreateEvent',
-    }
-    
-    actor = c['actor']
-    out_c['actor_id'] = actor['id']
-    out_c['actor_user_name'] = actor['login']
-    
-    repo = c['repo']
-    out_c['repo_id'] = repo['id']
-    out_c['repo_name'] = repo['name']
-    
-    out_c['public'] = c['public']
-    
-    return Row(**out_c)
-
-create_events.map(extract_create).toDF().select(
-    'id',
-    'type',
-    'created_at',
-    'actor_id',
-    'actor_user_name',
-    'repo_id',
-    'repo_name',
-    'public'
-).write.mode('overwrite').parquet('s3://github-superset-parquet/Creates.parquet')
-
-creates = spark.read.parquet('s3://github-superset-parquet/Creates.parquet')
-creates.show(5)
-
-# See https://developer.github.com/v3/activity/events/types/#deleteevent
-def extract_delete(d):
-    """Extract Rows of DeleteEvents and their associated fields from a gharchive.org event dict"""
-    
-    # Out deletes...
-    out_d = {
-        'id': d['id'],
-        'type': 'DeleteEvent',
-        'created_at': duparse(d['created_at'])
-    }
-    
-    actor = d['actor']
-    out_d['actor_id'] = actor['id']
-    out_d['actor_user_name'] = actor['login']
-    
-    repo = d['repo']
-    out_d['repo_id'] = repo['id']
-    out_d['repo_name'] = repo['name']
-    
-    org = d['org'] if 'org' in d else {}
-    out_d['org_id'] = org['id'] if 'id' in org else ''
-    out_d['org_name'] = org['login'] if 'login' in org else ''
-    
-    out_d['public'] = d['public']
-    
-    return Row(**out_d)
-
-delete_events.map(extract_delete).toDF().select(
-    'id',
-    'type',
-    'created_at',
-    'actor_id',
-    'actor_user_name',
-    'repo_id',
-    'repo_name',
-    'org_id',
-    'org_name',
-    'public'
-).write.mode('overwrite').parquet('s3://github-superset-parquet/Deletes.parquet')
-
-deletes = spark.read.parquet('s3://github-superset-parquet/Deletes.parquet')
-deletes.show(5)
-
-# See https://developer.github.com/v3/activity/events/types/#issueevent
-def extract_issue(i):
-    """Extract Rows of IssueEvents and their associated fields from a gharchive.org event dict"""
-    
-    # Out issues...
-    out_i = {
-        'id': i['id'],
-        'type': 'IssuesEvent',
-        'created_at': duparse(i['created_at']),
-        'public': i['public']
-    }
-    
-    actor = i['actor']
-    out_i['actor_id'] = actor['id']
-    out_i['actor_user_name'] = actor['login']
-    
-    repo = i['repo']
-    out_i['repo_id'] = repo['id']
-    out_i['repo_name'] = repo['name']
-    
-    payload = i['payload']
-    out_i['action'] = payload['action']
-
-    issue = payload['issue']
-    out_i['assignee'] = issue['assignee']
-    out_i['assignees'] = issue['assignees']
-    out_i['body'] = issue['body']
-    out_i['closed_at'] = duparse(issue['closed_at']) if issue['closed_at'] else None
-    out_i['comments'] = issue['comments']
-    out_i['issue_id'] = issue['id']
-    out_i['labels'] = issue['labels']
-    out_i['locked'] = issue['locked']
-    out_i['number'] = issue['number']
-    out_i['title'] = issue['title']
-    out_i['updated_at'] = issue['updated_at']
-    
-    user = issue['user']
-    out_i['user_id'] = user['id']
-    out_i['user_name'] = user['login']
-    
-    return Row(**out_i)
-
-issue_events.map(extract_issue).toDF().select(
-    'id',
-    'type',
-    'created_at',
-    'updated_at',
-    'closed_at',
-    'actor_id',
-    'actor_user_name',
-    'repo_id',
-    'repo_name',
-    'user_id',
-    'user_name',
-    'action',
-    'assignee',
-    'assignees',
-    'title',
-    'body',
-    'comments',
-    'issue_id',
-    'labels',
-    'locked',
-    'number',
-    'public'
-).write.mode('overwrite').parquet('s3://github-superset-parquet/Issues.parquet')
-
-issues = spark.read.parquet('s3://github-superset-parquet/Issues.parquet')
-issues.show(5)
-
-# See https://developer.github.com/v3/activity/events/types/#memberevent
-def extract_member(m):
-    """Extract Rows of MemberEvents and their associated fields from a gharchive.org event dict"""
-    
-    # Out members...
-    out_m = {
-        'id': m['id'],
-        'type': 'MemberEvent',
-        'created_at': duparse(m['created_at']),
-        'public': m['public']
-    }
-    
-    actor = m['actor']
-    out_m['actor_id'] = actor['id']
-    out_m['actor_user_name'] = actor['login']
-    
-    payload = m['payload']
-    out_m['action'] = payload['action']
-
-    member = payload['member']
-    out_m['member_id'] = member['id']
-    out_m['member_name'] = member['login']
-    out_m['site_admin'] = member['site_admin']
-    
-    repo = m['repo']
-    out_m['repo_id'] = repo['id']
-    out_m['repo_name'] = repo['name']
-    
-    return out_m
-
-member_events.map(extract_member).toDF().select(
-    'id',
-    'type',
-    'created_at',
-    'actor_id',
-    'actor_user_name',
-    'action',
-    'member_id',
-    'member_name',
-    'site_admin',
-    'repo_id',
-    'repo_name',
-    'public'
-).write.mode('overwrite').parquet('s3://github-superset-parquet/Members.parquet')
-
-members = spark.read.parquet('s3://github-superset-parquet/Members.parquet')
-members.show(5)
-
-# See https://developer.github.com/v3/activity/events/types/#pullrequestevent
-def extract_pull(p):
-    """Extract Rows of PullRequestEvents and their associated fields from a gharchive.org event dict"""
-    
-    # Out pull requests...
-    out_p = {
-        'id': p['id'],
-        'type': 'PullRequestEvent',
-        'created_at': duparse(p['created_at']),
-        'public': p['public']
-    }
-    
-    actor = p['actor']
-    out_p['actor_id'] = actor['id']
-    out_p['actor_user_name'] = actor['login']
-    
-    org = p['org'] if 'org' in p else {}
-    out_p['org_id'] = org['id'] if 'id' in org else None
-    out_p['org_name'] = org['login'] if 'login' in org else None
-    
-    payload = p['payload']
-    out_p['action'] = payload['action']
-    out_p['number'] = payload['number']
-    
-    pull_request = payload['pull_request']
-    out_p['additions'] = pull_request['additions']
-    out_p['assignee'] = pull_request['assignee']
-    out_p['assignees'] = pull_request['assignees']
-    out_p['author_association'] = pull_request['author_association']
-    
-    base = pull_request['base']
-    out_p['base_label'] = base['label']
-    out_p['base_ref'] = base['ref']
-    
-    base_repo = base['repo']
-    out_p['base_repo_created_at'] = duparse(base_repo['created_at'])
-    out_p['base_repo_default_branch'] = base_repo['default_branch'] if 'default_branch' in base_repo else None
-    out_p['base_repo_description'] = base_repo['description']
-    out_p['base_repo_fork'] = base_repo['fork']
-    out_p['base_repo_forks'] = base_repo['forks']
-    out_p['base_repo_full_name'] = base_repo['full_name']
-    out_p['base_repo_id'] = base_repo['id']
-    out_p['base_repo_language'] = base_repo['language']
-    
-    license = base_repo['license'] if isinstance(base_repo['license'], dict) else {}
-    out_p['base_repo_license_key'] = license['key'] if 'key' in license else None
-    out_p['base_repo_license_name'] = license['name'] if 'name' in license else None
-    
-    out_p['base_repo_name'] = base_repo['name']
-    out_p['base_repo_open_issues'] = base_repo['open_issues']
-    
-    owner = base_repo['owner']
-    out_p['base_repo_owner_id'] = owner['id']
-    out_p['base_repo_owner_user_name'] = owner['login']
-    out_p['base_repo_owner_site_admin'] = owner['site_admin']
-    
-    out_p['base_repo_private'] = base_repo['private']
-    out_p['base_repo_pushed_at'] = duparse(base_repo['pushed_at'])
-    out_p['base_repo_size'] = base_repo['size']
-    out_p['base_repo_stargazers_count'] = base_repo['stargazers_count']
-    out_p['base_repo_updated_at'] = duparse(base_repo['updated_at'])
-    out_p['base_repo_watchers'] = base_repo['watchers']
-    
-    out_p['base_sha'] = base['sha']
-    
-    base_user = base['user']
-    out_p['base_user_id'] = base_user['id']
-    out_p['base_user_user_name'] = base_user['login']
-    out_p['base_user_site_admin'] = base_user['site_admin']
-    
-    out_p['body'] = pull_request['body']
-    out_p['changed_files'] = pull_request['changed_files']
-    out_p['closed_at'] = duparse(pull_request['closed_at']) if pull_request['closed_at'] else None
-    out_p['comments'] = pull_request['comments']
-    out_p['commits'] = pull_request['commits']
-    out_p['created_at'] = duparse(pull_request['created_at'])
-    out_p['deletions'] = pull_request['deletions']
-    
-    head = pull_request['head']
-    out_p['head_label'] = head['label']
-    out_p['head_ref'] = head['ref']
-    
-    head_repo = head['repo'] if 'repo' in head and isinstance(head['repo'], dict) else {}
-    out_p['head_repo_created_at'] = duparse(head_repo['created_at']) if 'created_at' in head_repo and head_repo['created_at'] else None
-    out_p['head_repo_default_branch'] = head_repo['default_branch'] if 'default_branch' in head_repo else None
-    out_p['head_repo_description'] = head_repo['description'] if 'description' in head_repo else None
-    out_p['head_repo_fork'] = head_repo['fork'] if 'fork' in head_repo else None
-    out_p['head_repo_forks'] = head_repo['forks'] if 'forks' in head_repo else None
-    out_p['head_repo_full_name'] = head_repo['full_name'] if 'full_name' in head_repo else None
-    out_p['head_repo_id'] = head_repo['id'] if 'id' in head_repo else None
-    out_p['head_repo_language'] = head_repo['language'] if 'language' in head_repo else None
-    out_p['head_repo_languages'] = head_repo['languages'] if 'languages' in head_repo else ''
-    
-    head_repo_license = head_repo['license'] if 'license' in head_repo and isinstance(head_repo['license'], dict) else {}
-    out_p['head_repo_license_key'] = head_repo_license['key'] if 'key' in head_repo_license else None
-    out_p['head_repo_license_name'] = head_repo_license['name'] if 'name' in head_repo_license else None
-    
-    out_p['head_repo_name'] = head_repo['name'] if 'name' in head_repo else None
-    out_p['head_repo_open_issues'] = head_repo['open_issues'] if 'open_issues' in head_repo else None
-    
-    head_repo_owner = head_repo['owner'] if 'owner' in head_repo else {}
-    out_p['head_repo_owner_id'] = head_repo_owner['id'] if 'id' in head_repo_owner else None
-    out_p['head_repo_owner_user_name'] = head_repo_owner['login'] if 'login' in head_repo_owner else None
-    out_p['head_repo_owner_site_admin'] = head_repo_owner['site_admin'] if 'site_admin' in head_repo_owner else None
-    
-    out_p['head_repo_private'] = head_repo['private'] if 'private' in head_repo else None
-    out_p['head_repo_pushed_at'] = duparse(head_repo['pushed_at']) if 'pushed_at' in head_repo else None
-    out_p['head_repo_size'] = head_repo['size'] if 'size' in head_repo else None
-    out_p['head_repo_stargazers_count'] = head_repo['stargazers_count'] if 'stargazers_count' in head_repo else None
-    out_p['head_repo_updated_at'] = duparse(head_repo['updated_at']) if 'updated_at' in head_repo else None
-    out_p['head_repo_watchers'] = head_repo['watchers'] if 'watchers' in head_repo else None
-    
-    out_p['head_sha'] = head['sha']
-    
-    head_user = head['user']
-    out_p['head_user_id'] = head_user['id']
-    out_p['head_user_name'] = head_user['login']
-    out_p['head_user_site_admin'] = head_user['site_admin']
-    
-    out_p['id'] = pull_request['id']
-    # out_p['labels'] = pull_request['labels']
-    out_p['locked'] = pull_request['locked']
-    out_p['merge_commit_sha'] = pull_request['merge_commit_sha']
-    out_p['mergeable'] = pull_request['mergeable']
-    out_p['merged'] = pull_request['merged']
-    out_p['merged_at'] = duparse(pull_request['merged_at']) if 'merged_at' in pull_request and pull_request['merged_at'] else None
-    out_p['merged_by'] = pull_request['merged_by']
-    out_p['milestone'] = pull_request['milestone']
-    out_p['number'] = pull_request['number']
-    out_p['rebaseable'] = pull_request['rebaseable']
-    out_p['requested_reviewers'] = pull_request['requested_reviewers']
-    out_p['requested_teams'] = pull_request['requested_teams']
-    out_p['review_comments'] = pull_request['review_comments']
-    out_p['state'] = pull_request['state']
-    out_p['title'] = pull_request['title']
-    out_p['updated_at'] = duparse(pull_request['updated_at']) if 'updated_at' in pull_request else None
-    
-    user = pull_request['user']
-    out_p['user_id'] = user['id']
-    out_p['user_name'] = user['login']
-    out_p['user_site_admin'] = user['site_admin']
-    
-    out_p['public'] = p['public']
-    
-    repo = p['repo']
-    out_p['repo_id'] = repo['id']
-    out_p['repo_name'] = repo['name']
-    
-    return Row(**out_p)
-
-from datetime import date, datetime
-
-def json_serial(obj):
-    """JSON serializer for objects not serializable by default json code"""
-    
-    if isinstance(obj, (datetime.datetime, datetime.date)):
-        return obj.isoformat()
-    raise TypeError ("Type %s not serializable" % type(obj))
-
-pull_events.map(extract_pull).take(1)[0]
-
-pull_events.map(extract_pull).toDF(sampleRatio=0.01).write.mode('overwrite').parquet(
-    's3://github-superset-parquet/PullRequests.parquet'
-)
-
-pull_requests = spark.read.parquet('s3://github-superset-parquet/PullRequests.parquet')
-pull_requests.show(5)
-
-# # I return no records. Why is that?
-# # See https://developer.github.com/v3/activity/events/types/#repositoryevent
-# def extract_repo(r):
-#     """Extract Rows of RepositoryEvents and their associated fields from a gharchive.org event dict"""
-#    
-#     # Our repos...
-#     out_r = {
-#         'id': r['id'],
-#         'created_at': duparse(r['created_at'])
-#     }
-#    
-#     return r
-#
-# I return no records. Why is that?
-# repo_events.map(extract_repo).take(10)
-
-# I return no records. Why is that?
-# # See https://developer.github.com/v3/activity/events/types/#watchevent
-# def extract_star(s):
-#     """Extract Rows of WatchEvents and their associated fields from a gharchive.org event dict"""
-#    
-#     # Out stars...
-#     out_s = {
-#         'id': s['id'],
-#         'created_at': s['created_at']
-#     }
-#    
-#     return s
-#
-# I return no records. Why is that?
-# star_events.map(extract_star).take(10)
+if event_rows('ForkEvent'):
+    if NATIVE:
+        forks = extract_table(spark, EVENTS_PATH, 'ForkEvents', VECTORIZED)
+    else:
+        forks = to_table(extracted(fork_events, extract_fork, 'ForkEvents'), 'ForkEvents')
+    write_table(forks, 'ForkEvents.parquet', event_rows('ForkEvent'))
+    
+    forks = read_table('ForkEvents.parquet')
+    forks.show(5)
+else:
+    skip_table('ForkEvents.parquet')
+
+if event_rows('PushEvent'):
+    # Extract pushes once with their commits nested in them, then write PushEvents and explode Commits from the same,
+    # persisted, pushes
+    if NATIVE:
+        push_commits = native_extract.extract_push_commits(spark, EVENTS_PATH, VECTORIZED)
+    else:
+        pushes_raw = extracted(push_events, extract_push_commits, 'PushEvents')
+        if VALIDATE_SCHEMA:
+            pushes_raw = pushes_raw.map(lambda row: check_row('PushEvents', row))
+        push_commits = spark.createDataFrame(
+            pushes_raw.map(METRICS.timed('conform.PushEvents', coerce_push_commits)), push_commits_schema(),
+            verifySchema=False
+        )
+    push_commits = push_commits.persist(StorageLevel.MEMORY_AND_DISK)
+    
+    pushes = push_commits.drop('commits')
+    write_table(pushes, 'PushEvents.Parquet', event_rows('PushEvent'))
+    
+    pushes = read_table('PushEvents.Parquet')
+    pushes.show(5)
+    
+    commits = explode_commits(push_commits)
+    
+    # Payloads list at most 20 commits, so the pushes' sizes give a close count of commits
+    commit_rows = read_table('PushEvents.Parquet').select(sum_(least('push_size', lit(20)))).first()[0] or 0
+    
+    if DEDUPE:
+        commits_extracted = commits.count()
+        commits = dedupe_table(commits, 'Commits')
+    
+    write_table(commits, 'Commits.parquet', commit_rows, date_column='push_created_at')
+    if DEDUPE:
+        run_summary['duplicates']['Commits'] = commits_extracted - read_table('Commits.parquet').count()
+    
+    push_commits.unpersist()
+else:
+    skip_table('PushEvents.Parquet')
+    skip_table('Commits.parquet')
+
+if event_rows('CreateEvent'):
+    if NATIVE:
+        creates = extract_table(spark, EVENTS_PATH, 'Creates', VECTORIZED)
+    else:
+        creates = to_table(extracted(create_events, extract_create, 'Creates'), 'Creates')
+    write_table(creates, 'Creates.parquet', event_rows('CreateEvent'))
+    
+    creates = read_table('Creates.parquet')
+    creates.show(5)
+else:
+    skip_table('Creates.parquet')
+
+if event_rows('DeleteEvent'):
+    if NATIVE:
+        deletes = extract_table(spark, EVENTS_PATH, 'Deletes', VECTORIZED)
+    else:
+        deletes = to_table(extracted(delete_events, extract_delete, 'Deletes'), 'Deletes')
+    write_table(deletes, 'Deletes.parquet', event_rows('DeleteEvent'))
+    
+    deletes = read_table('Deletes.parquet')
+    deletes.show(5)
+else:
+    skip_table('Deletes.parquet')
+
+if event_rows('IssuesEvent'):
+    if NATIVE:
+        issues = extract_table(spark, EVENTS_PATH, 'Issues', VECTORIZED)
+    else:
+        issues = to_table(extracted(issue_events, extract_issue, 'Issues'), 'Issues')
+    write_table(issues, 'Issues.parquet', event_rows('IssuesEvent'))
+    
+    issues = read_table('Issues.parquet')
+    issues.show(5)
+else:
+    skip_table('Issues.parquet')
+
+if event_rows('MemberEvent'):
+    if NATIVE:
+        members = extract_table(spark, EVENTS_PATH, 'Members', VECTORIZED)
+    else:
+        members = to_table(extracted(member_events, extract_member, 'Members'), 'Members')
+    write_table(members, 'Members.parquet', event_rows('MemberEvent'))
+    
+    members = read_table('Members.parquet')
+    members.show(5)
+else:
+    skip_table('Members.parquet')
+
+if event_rows('PullRequestEvent'):
+    if NATIVE:
+        pull_requests = extract_table(spark, EVENTS_PATH, 'PullRequests', VECTORIZED)
+    else:
+        pull_requests = to_table(extracted(pull_events, extract_pull, 'PullRequests'), 'PullRequests')
+    if DEDUPE:
+        # Extract once for both the count and the write
+        extracted_pulls = pull_requests.persist(StorageLevel.MEMORY_AND_DISK)
+        pull_requests = dedupe_table(extracted_pulls, 'PullRequests')
+    write_table(pull_requests, 'PullRequests.parquet', event_rows('PullRequestEvent'))
+    if DEDUPE:
+        run_summary['duplicates']['PullRequests'] = extracted_pulls.count() - read_table('PullRequests.parquet').count()
+        extracted_pulls.unpersist()
+    
+    pull_requests = read_table('PullRequests.parquet')
+    pull_requests.show(5)
+else:
+    skip_table('PullRequests.parquet')
+
+if TOLERANT:
+    write_dead_letters()
+    run_summary['dead_letters'] = dead_letters.value
+
+# Issue comments, stars, gists and repositories made public are only extracted with native column expressions,
+# whatever the mode. Stars come from WatchEvents, there are no StarEvents, and RepositoryEvents aren't in the public
+# timeline gharchive.org records, so PublicEvents stands in for them. GistEvents end in 2014, so runs over later hours
+# write no Gists.
+for table in NATIVE_ONLY_TABLES:
+    event_type = NATIVE_TABLES[table][0]
+    if event_rows(event_type):
+        write_table(extract_table(spark, EVENTS_PATH, table, VECTORIZED), TABLE_FILES[table], event_rows(event_type))
+    else:
+        skip_table(TABLE_FILES[table])
+
+stars = read_table('Stars.parquet')
+stars.show(5)
+
+# Publish an incremental run: move the staged files into the tables, then record its hours in the manifest
+if INCREMENTAL:
+    run_files = [f for f, size in input_files]
+    manifest.begin(RUN_ID, run_files)
+    for table in TABLES:
+        published = publish(sc, STAGING_PATH + '/' + table, OUTPUT_PATH + '/' + table, RUN_ID)
+        if FILE_INDEX:
+            with METRICS.stage('index.' + TABLE_NAMES[table]):
+                index_files(sc, OUTPUT_PATH + '/' + table, published, RUN_ID)
+    publish(sc, EVENTS_PATH, CACHE_PATH, RUN_ID)
+    
+    # Dimension tables are replaced whole. Merging is idempotent, so a run redone after a failure here is harmless.
+    with METRICS.stage('dimensions'):
+        write_dimensions()
+    for dimension in sorted(sighting_paths):
+        table = TABLE_FILES[dimension]
+        replace(sc, STAGING_PATH + '/' + table, OUTPUT_PATH + '/' + table)
+    if ROLLUPS:
+        with METRICS.stage('rollups'):
+            write_rollups()
+    
+    manifest.commit(RUN_ID, run_files)
+    delete(sc, STAGING_PATH)
+    
+    run_summary['recovered_runs'] = recovered_runs
+else:
+    with METRICS.stage('dimensions'):
+        write_dimensions()
+    delete(sc, STAGING_PATH)
+    if ROLLUPS:
+        with METRICS.stage('rollups'):
+            write_rollups()
+
+# Run-level summary: the pile was scanned once by route_event, so bytes_read should match one pass
+# over the decompressed input and records_per_type should add up to the number of lines read
+for table in TABLES + DIMENSION_TABLES + ROLLUP_FILES:
+    # Tables no run has had rows for yet are left out
+    if has_parquet(sc, OUTPUT_PATH + '/' + table):
+        rows = spark.read.parquet(OUTPUT_PATH + '/' + table).count()
+        if rows:
+            run_summary['tables'][table] = rows
+if VALIDATE_SCHEMA:
+    run_summary['schema_violations'] = schema_violations.value
+
+run_summary['run_id'] = RUN_ID
+run_summary['metrics'] = METRICS.report()
+
+report = json.dumps(run_summary, indent=2, sort_keys=True)
+write_text(sc, '{}/{}.json'.format(REPORT_PATH, RUN_ID), report)
+if PROFILE:
+    write_text(sc, '{}/{}.profile.txt'.format(REPORT_PATH, RUN_ID), METRICS.collapsed_stacks())
+print(report)
@@ -0,0 +1,164 @@
+"""How the columns of the tables are stored: which are dictionary encoded, which codec compresses them, and what
+happens to the large free text columns.
+
+Issue and pull request bodies, repository descriptions and commit messages are unbounded text and most of the bytes
+of their tables. A TextPolicy keeps them, truncates them, drops them or offloads them: the whole text goes to a side
+table with just the columns identifying its row, like CommitMessages, compressed with a high ratio codec, and the main
+table keeps a prefix of it or nothing. Dropped text is nulled rather than the column removed, so every table keeps its
+schema whatever the policy and runs with different policies can append to the same tables.
+
+Dictionary encoding pays off for columns with few distinct values, like `action` and `state`, and only costs for text
+and hashes, which are stored plain. The single machine engine also compresses the text columns it keeps with the text
+codec and the rest with Snappy. Spark's Parquet writer takes one codec per file, so only the dictionary profile and
+the side tables' codec apply there.
+"""
+import os
+
+# The free text columns of each table, the side table they are offloaded to, and the columns the side table keeps to
+# join back on, the table's natural key with its time and repository
+TEXT_COLUMNS = {
+    'Commits': (['message'], 'CommitMessages', ['sha', 'push_id', 'repo_id', 'push_created_at']),
+    'Issues': (['body'], 'IssueTexts', ['id', 'created_at', 'repo_id']),
+    'IssueComments': (['body'], 'IssueCommentTexts', ['id', 'comment_id', 'created_at', 'repo_id']),
+    'PullRequests': (
+        ['body', 'base_repo_description', 'head_repo_description'], 'PullRequestTexts',
+        ['id', 'action', 'updated_at', 'created_at', 'repo_id']
+    ),
+}
+
+# Columns of a few distinct values each, always dictionary encoded
+DICTIONARY_COLUMNS = [
+    'type', 'action', 'state', 'issue_state', 'author_association', 'ref_type', 'language', 'base_repo_language',
+    'head_repo_language'
+]
+
+# Columns of mostly distinct values, never dictionary encoded. Repository descriptions repeat with their repository,
+# so they stay in dictionaries.
+PLAIN_COLUMNS = ['body', 'message', 'sha', 'push_head', 'push_before', 'url']
+
+TEXT_MODES = ('keep', 'truncate', 'drop', 'offload')
+
+
+class TextPolicy(object):
+    """What to do with a table's free text columns
+
+    `chars` is how many characters of each text the main table keeps when truncating or offloading, offloading keeps
+    none when it is 0 and all of them when it is None. `codec` compresses the side tables and, on a single machine,
+    the text columns.
+    """
+
+    def __init__(self, mode='keep', chars=0, codec='gzip'):
+        if mode not in TEXT_MODES:
+            raise ValueError('The text mode must be one of {}, not {!r}'.format(', '.join(TEXT_MODES), mode))
+        if mode == 'truncate' and not chars:
+            raise ValueError('Truncating text needs a number of characters to keep, see GITHUB_TEXT_CHARS')
+
+        self.mode = mode
+        self.chars = chars
+        self.codec = codec
+
+    @property
+    def offloads(self):
+        return self.mode == 'offload'
+
+    @property
+    def trims(self):
+        return self.mode in ('truncate', 'drop') or (self.offloads and self.chars is not None)
+
+    def trim(self, value):
+        """A text value as the main table keeps it"""
+        if not self.trims or value is None:
+            return value
+        return value[:self.chars] if self.mode != 'drop' and self.chars else None
+
+
+def text_policies():
+    """The TextPolicy of each table with free text, from GITHUB_TEXT_MODE, GITHUB_TEXT_CHARS and GITHUB_TEXT_CODEC
+
+    Commits follows GITHUB_COMMIT_MESSAGE_CHARS, GITHUB_COMMIT_MESSAGE_TABLE and GITHUB_COMMIT_MESSAGE_CODEC instead
+    when either of the first two is set, as it did before the other tables had policies.
+    """
+    codec = os.environ.get('GITHUB_TEXT_CODEC', 'gzip')
+    default = TextPolicy(os.environ.get('GITHUB_TEXT_MODE', 'keep'), int(os.environ.get('GITHUB_TEXT_CHARS', '0')),
+                         codec)
+    policies = {table: default for table in TEXT_COLUMNS}
+
+    if 'GITHUB_COMMIT_MESSAGE_CHARS' in os.environ or 'GITHUB_COMMIT_MESSAGE_TABLE' in os.environ:
+        chars = int(os.environ.get('GITHUB_COMMIT_MESSAGE_CHARS', '0'))
+        if os.environ.get('GITHUB_COMMIT_MESSAGE_TABLE', '') == '1':
+            mode = 'offload'
+        else:
+            mode = 'truncate' if chars else 'keep'
+        # With the whole messages in CommitMessages, Commits still had them whole unless told how many to keep
+        policies['Commits'] = TextPolicy(mode, chars or None, os.environ.get('GITHUB_COMMIT_MESSAGE_CODEC', codec))
+    return policies
+
+
+def side_tables(policies):
+    """The side tables the policies offload text to"""
+    return sorted(TEXT_COLUMNS[table][1] for table, policy in policies.items() if policy.offloads)
+
+
+def trim_row(table, row, policy):
+    """A row dict with its text as the main table keeps it"""
+    if table not in TEXT_COLUMNS or not policy.trims:
+        return row
+    return dict(row, **{column: policy.trim(row.get(column)) for column in TEXT_COLUMNS[table][0]})
+
+
+def side_row(table, row):
+    """A row dict of a table's side table, from a row of the table"""
+    texts, _, keys = TEXT_COLUMNS[table]
+    return {column: row.get(column) for column in keys + texts}
+
+
+def split_text(df, table, policy):
+    """A table's DataFrame as the main table keeps it, and its side table's DataFrame if the policy offloads text"""
+    from pyspark.sql.functions import col, lit, substring
+
+    from schemas import columns
+
+    if table not in TEXT_COLUMNS:
+        return df, None
+    texts, side_table, _ = TEXT_COLUMNS[table]
+
+    side = df.select(columns(side_table)) if policy.offloads else None
+    if policy.trims:
+        for column in texts:
+            kept = substring(col(column), 1, policy.chars) if policy.mode != 'drop' and policy.chars else lit(None)
+            df = df.withColumn(column, kept.cast('string'))
+    return df, side
+
+
+def spark_options(columns):
+    """Parquet writer options for Spark with the dictionary profile of a table's columns, which needs Parquet 1.12"""
+    options = {}
+    for column in columns:
+        if column in DICTIONARY_COLUMNS:
+            options['parquet.enable.dictionary#' + column] = 'true'
+        elif column in PLAIN_COLUMNS:
+            options['parquet.enable.dictionary#' + column] = 'false'
+    return options
+
+
+def leaf_paths(name, arrow_type):
+    """The Parquet column paths of an Arrow column, one per leaf of its lists, maps and structs"""
+    import pyarrow as pa
+
+    if pa.types.is_map(arrow_type):
+        return leaf_paths(name + '.key_value.key', arrow_type.key_type) + \
+            leaf_paths(name + '.key_value.value', arrow_type.item_type)
+    if pa.types.is_list(arrow_type):
+        return leaf_paths(name + '.list.element', arrow_type.value_type)
+    if pa.types.is_struct(arrow_type):
+        return [path for field in arrow_type for path in leaf_paths(name + '.' + field.name, field.type)]
+    return [name]
+
+
+def arrow_options(schema, compression='snappy', text_codec='gzip'):
+    """pyarrow ParquetWriter arguments with the dictionary and compression profiles of a table's Arrow schema"""
+    paths = [(field.name, path) for field in schema for path in leaf_paths(field.name, field.type)]
+    return {
+        'use_dictionary': [path for name, path in paths if name not in PLAIN_COLUMNS],
+        'compression': {path: text_codec if name in PLAIN_COLUMNS else compression for name, path in paths},
+    }
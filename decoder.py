@@ -0,0 +1,77 @@
+"""Decoding raw gharchive.org lines, skipping the event types nobody asked for without parsing them.
+
+The event's type is sniffed from the raw line with a regex before any JSON is parsed: 2015+ events put it second,
+right after the id, and in 2011-2014 events it follows the payload. Only a `"type":"...Event"` pair counts, since
+users and organizations nested in payloads have types like `"User"`, and quotes inside strings are escaped so text
+can't match. Lines of other types are skipped, the rest are parsed with orjson when it is installed and the standard
+library otherwise. Lines orjson rejects, like ones with lone surrogates or integers past 64 bits, get a second try with
+the standard library, so the same lines parse either way.
+"""
+import json
+import re
+
+TYPE_TOKEN = re.compile(r'"type"\s*:\s*"(\w+Event)"')
+
+
+def sniff_type(line):
+    """The event type of a raw line, or None if it can't be told without parsing"""
+    match = TYPE_TOKEN.search(line)
+    return match.group(1) if match else None
+
+
+def json_library(name=None):
+    """The name of the JSON library to parse with, and its loads, the fastest installed unless one is named"""
+    if name in (None, 'orjson'):
+        try:
+            import orjson
+        except ImportError:
+            if name == 'orjson':
+                raise
+        else:
+            def loads(line):
+                try:
+                    return orjson.loads(line)
+                except ValueError:
+                    return json.loads(line)
+            return 'orjson', loads
+    return 'json', json.loads
+
+
+class Decoder(object):
+    """Parses the lines of the requested event types, or every line if `types` is None"""
+
+    def __init__(self, types=None, library=None):
+        self.types = frozenset(types) if types is not None else None
+        self.library = library
+        self._loads = None
+
+    def decode(self, line):
+        """(event type, record, error) for a raw line
+
+        The record is None when the line is of a type not requested, or when it doesn't parse, with the parser's
+        reason in `error`. The type is the sniffed one until the line is parsed, 'ParseError' if it doesn't parse.
+        """
+        # With every type wanted there is nothing to skip, and no point sniffing
+        event_type = sniff_type(line) if self.types is not None else None
+        if event_type is not None and not self.wants(event_type):
+            return event_type, None, None
+
+        # Look the library up on first use, on the worker rather than wherever the decoder was made
+        if self._loads is None:
+            _, self._loads = json_library(self.library)
+        try:
+            record = self._loads(line)
+        except ValueError as e:
+            return 'ParseError', None, getattr(e, 'msg', type(e).__name__)
+        if not isinstance(record, dict):
+            return 'ParseError', None, 'Not an object'
+
+        event_type = record['type'] if isinstance(record.get('type'), str) else 'Unknown'
+        return (event_type, record, None) if self.wants(event_type) else (event_type, None, None)
+
+    def wants(self, event_type):
+        return self.types is None or event_type in self.types
+
+    def __getstate__(self):
+        # Ship the decoder without its loads, which may be a library the workers don't have
+        return dict(self.__dict__, _loads=None)
@@ -0,0 +1,57 @@
+"""Deduplication of events repeated within and across the hourly input files.
+
+Hourly files overlap at their edges, and re-downloads leave the same hour twice in the input. Events are keyed by
+their id, or for the few without one by a SHA-1 of their content. The routing stage already shuffles the events by
+type and created_date to write the event cache, so each event's copies meet in the same task and are dropped there
+with a partition-local hash aggregate, without another shuffle. Incremental runs also drop the events already in the
+cache for the dates their files cover and the days either side, where an event at midnight may have been cached from
+the neighbouring day's file. Child tables are deduplicated on their natural keys in NATURAL_KEYS.
+"""
+from datetime import date, timedelta
+
+# Columns identifying a row of a child table, where one event's rows could otherwise repeat
+NATURAL_KEYS = {
+    # The same commit can be pushed again to another branch or repository, so a commit is a sha within a push
+    'Commits': ['push_id', 'sha'],
+    # Each event on a pull request is a row, one is repeated if the same action happened at the same update
+    'PullRequests': ['id', 'action', 'updated_at'],
+}
+
+# The column of the Events table holding each event's key while deduplicating
+KEY_COLUMN = '_event_key'
+
+
+def event_key():
+    """An event's id, or a SHA-1 of its content if it has none"""
+    from pyspark.sql.functions import coalesce, col, concat_ws, sha1
+
+    content = concat_ws('\x01', col('created_at'), col('actor_login'), col('repo_name'), col('payload'), col('extra'))
+    return coalesce(col('id'), sha1(content))
+
+
+def dedupe_events(events):
+    """Events partitioned by type and created_date with the repeats of each dropped, within each partition"""
+    return events.withColumn(KEY_COLUMN, event_key()) \
+        .dropDuplicates(['type', 'created_date', KEY_COLUMN]) \
+        .drop(KEY_COLUMN)
+
+
+def overlapping_dates(hours):
+    """The dates, as 'YYYY-MM-DD', whose cached events files of the given (year, month, day, hour) hours may repeat"""
+    days = set(date(*hour[:3]) for hour in hours)
+    return sorted(set((day + timedelta(days=d)).isoformat() for day in days for d in (-1, 0, 1)))
+
+
+def new_events(events, cached, dates):
+    """The events not already in the cache, reading only the cache's partitions of `dates`, given as 'YYYY-MM-DD'"""
+    from pyspark.sql.functions import col, date_format
+
+    keys = ['type', 'created_date', KEY_COLUMN]
+    seen = cached.where(date_format(col('created_date'), 'yyyy-MM-dd').isin(dates)) \
+        .withColumn(KEY_COLUMN, event_key()).select(keys)
+    return events.withColumn(KEY_COLUMN, event_key()).join(seen, keys, 'left_anti').drop(KEY_COLUMN)
+
+
+def dedupe_table(df, table):
+    """A child table with the rows repeating its natural key dropped"""
+    return df.dropDuplicates(NATURAL_KEYS[table])
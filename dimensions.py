@@ -0,0 +1,125 @@
+"""Repository, user and organization dimension tables.
+
+The event tables repeat the names and attributes of the repositories, users and organizations they mention on every
+row. FACT_DIMENSIONS maps those columns of each table to the Repos, Users and Orgs tables declared in schemas.py,
+keyed by their GitHub ids. Each run collects the sightings of every entity in the tables it writes, and the dimension
+tables keep one row per id with the latest non-null value seen of each attribute. With the normalized layout the event
+tables keep only the ids, and load_postgres.py can join the attributes back in views.
+"""
+from schemas import TABLE_SCHEMAS
+
+# The key column of each dimension table
+DIMENSION_KEYS = {
+    'Repos': 'repo_id',
+    'Users': 'user_id',
+    'Orgs': 'org_id',
+}
+
+ACTOR = ('actor_id', 'Users', {'actor_user_name': 'user_name'})
+REPO = ('repo_id', 'Repos', {'repo_name': 'name'})
+
+
+def repo_attributes(prefix, languages=False):
+    """The Repos attributes of a pull request's base or head repository columns"""
+    attributes = {prefix + 'full_name': 'name', prefix + 'name': 'short_name'}
+    for name in [
+        'created_at', 'default_branch', 'description', 'fork', 'forks', 'language', 'license_key', 'license_name',
+        'open_issues', 'owner_id', 'owner_user_name', 'owner_site_admin', 'private', 'pushed_at', 'size',
+        'stargazers_count', 'updated_at', 'watchers'
+    ]:
+        attributes[prefix + name] = name
+    if languages:
+        attributes[prefix + 'languages'] = 'languages'
+    return attributes
+
+
+# Each table's dimension keys: the key column, the dimension it refers to and the table's columns holding that
+# dimension's attributes, by the dimension column they fill
+FACT_DIMENSIONS = {
+    'ForkEvents': [
+        ('actor_user_id', 'Users', {'actor_user_name': 'user_name'}),
+        ('from_org_id', 'Orgs', {'from_org_login': 'org_name'}),
+        ('to_user_id', 'Users', {'to_user_name': 'user_name'}),
+        ('from_repo_id', 'Repos', {'from_repo_name': 'name'}),
+    ],
+    'PushEvents': [ACTOR, REPO],
+    'Commits': [ACTOR, REPO],
+    'Creates': [ACTOR, REPO],
+    'Deletes': [ACTOR, REPO, ('org_id', 'Orgs', {'org_name': 'org_name'})],
+    'Issues': [ACTOR, REPO, ('user_id', 'Users', {'user_name': 'user_name'})],
+    'Members': [ACTOR, REPO, ('member_id', 'Users', {'member_name': 'user_name', 'site_admin': 'site_admin'})],
+    'PullRequests': [
+        ACTOR,
+        REPO,
+        ('org_id', 'Orgs', {'org_name': 'org_name'}),
+        ('user_id', 'Users', {'user_name': 'user_name', 'user_site_admin': 'site_admin'}),
+        ('base_user_id', 'Users', {'base_user_user_name': 'user_name', 'base_user_site_admin': 'site_admin'}),
+        ('head_user_id', 'Users', {'head_user_name': 'user_name', 'head_user_site_admin': 'site_admin'}),
+        ('base_repo_id', 'Repos', repo_attributes('base_repo_')),
+        ('head_repo_id', 'Repos', repo_attributes('head_repo_', languages=True)),
+    ],
+    'IssueComments': [ACTOR, REPO, ('comment_user_id', 'Users', {'comment_user_name': 'user_name'})],
+    'Stars': [ACTOR, REPO],
+    'Gists': [ACTOR],
+    'PublicEvents': [ACTOR, REPO, ('org_id', 'Orgs', {'org_name': 'org_name'})],
+}
+
+# The date column of each table that says when its entities were seen
+SEEN_AT = {'Commits': 'push_created_at'}
+
+
+def attribute_columns(table):
+    """The columns of a table that move to the dimension tables in the normalized layout"""
+    return set(column for _, _, attributes in FACT_DIMENSIONS.get(table, []) for column in attributes)
+
+
+def sightings(df, table):
+    """Each dimension's entities seen in a table, as DataFrames of dimension rows seen once at the row's date"""
+    from pyspark.sql.functions import col, lit
+
+    seen_at = col(SEEN_AT.get(table, 'created_at'))
+    selects = {}
+    for key, dimension, attributes in FACT_DIMENSIONS.get(table, []):
+        filled = dict((name, col(column)) for column, name in attributes.items())
+        filled[DIMENSION_KEYS[dimension]] = col(key)
+        filled['first_seen_at'] = filled['last_seen_at'] = seen_at
+
+        select = df.where(col(key).isNotNull()).select([
+            (filled[name] if name in filled else lit(None)).cast(t).alias(name)
+            for name, t in TABLE_SCHEMAS[dimension]
+        ])
+        selects.setdefault(dimension, []).append(select)
+
+    unioned = {}
+    for dimension, parts in selects.items():
+        unioned[dimension] = parts[0]
+        for part in parts[1:]:
+            unioned[dimension] = unioned[dimension].union(part)
+    return unioned
+
+
+def latest(df, dimension):
+    """One row per id from dimension rows: the first and last time it was seen and the latest non-null attributes"""
+    from pyspark.sql.functions import col, max as max_, min as min_, struct, when
+
+    key = DIMENSION_KEYS[dimension]
+    aggregates = []
+    for name, _ in TABLE_SCHEMAS[dimension]:
+        if name == key:
+            continue
+        if name == 'first_seen_at':
+            aggregates.append(min_(name).alias(name))
+        elif name == 'last_seen_at':
+            aggregates.append(max_(name).alias(name))
+        else:
+            # max of (seen, value) structs picks the value seen last, ignoring the nulls of when()
+            latest_value = max_(when(col(name).isNotNull(), struct(col('last_seen_at'), col(name).alias('value'))))
+            aggregates.append(latest_value.getField('value').alias(name))
+
+    return df.groupBy(key).agg(*aggregates).select([name for name, _ in TABLE_SCHEMAS[dimension]])
+
+
+def normalize(df, table):
+    """A table with only the dimension keys, its attributes of repositories, users and organizations dropped"""
+    return df.drop(*sorted(attribute_columns(table) & set(df.columns)))
+
@@ -0,0 +1,254 @@
+"""Download gharchive.org hourly event files in parallel, resumably.
+
+Only real calendar hours in the date range are requested, a bounded pool of workers fetches them, every file is
+checked to be a complete gzip stream before it is kept, failures are retried with exponential backoff and progress is
+recorded in a state file so an interrupted download picks up where it left off. Files go to a local directory or
+straight to an object store like `s3://github-dataset/`, wherever the Spark job reads them from.
+
+Usage: python download.py --start 2019-01-01 --end 2019-06-30 --dest data/
+
+Point --source-url at another server, i.e. `python -m http.server` over a directory of files, to test it.
+"""
+import argparse
+import gzip
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime, timedelta
+from urllib.error import HTTPError, URLError
+from urllib.request import urlopen
+
+import pyarrow.fs as pafs
+
+SOURCE_URL = 'https://data.gharchive.org/{name}'
+
+# Hours gharchive.org may not have published yet, whose files are tried again by later runs rather than recorded missing
+RECENT = timedelta(days=1)
+
+
+def hourly_names(start, end):
+    """The gharchive.org file names of every hour from start to end, both dates included, i.e. 2019-06-01-0.json.gz"""
+    hour = datetime(start.year, start.month, start.day)
+    last = datetime(end.year, end.month, end.day, 23)
+    while hour <= last:
+        yield '{:%Y-%m-%d}-{}.json.gz'.format(hour, hour.hour)
+        hour += timedelta(hours=1)
+
+
+def file_hour(name):
+    """The hour, in UTC, of a gharchive.org file name"""
+    day, hour = name[:10], name[11:].split('.', 1)[0]
+    return datetime.strptime(day, '%Y-%m-%d') + timedelta(hours=int(hour))
+
+
+def verify_gzip(path):
+    """Read a gzip file to the end, which checks its CRC and length, raising on a truncated or corrupt file"""
+    with gzip.open(path, 'rb') as f:
+        while f.read(1024 * 1024):
+            pass
+
+
+class Sink(object):
+    """Where downloaded files go: a local directory or an object store path pyarrow can write to"""
+
+    def __init__(self, dest):
+        if '://' in dest:
+            self.fs, self.root = pafs.FileSystem.from_uri(dest)
+        else:
+            self.fs, self.root = pafs.LocalFileSystem(), os.path.abspath(dest)
+        self.fs.create_dir(self.root, recursive=True)
+
+        # Downloads to a local directory are written beside their final names, so moving them there is atomic
+        self.temp_dir = self.root if isinstance(self.fs, pafs.LocalFileSystem) else None
+
+    def path(self, name):
+        return self.root.rstrip('/') + '/' + name
+
+    def size(self, name):
+        """The size of a file in the sink, None if it isn't there"""
+        info = self.fs.get_file_info(self.path(name))
+        return info.size if info.type == pafs.FileType.File else None
+
+    def put(self, local_path, name):
+        """Copy a verified local file into the sink under its final name"""
+        if self.temp_dir is not None:
+            os.replace(local_path, self.path(name))
+            return
+        with open(local_path, 'rb') as source, self.fs.open_output_stream(self.path(name)) as target:
+            shutil.copyfileobj(source, target, 1024 * 1024)
+        os.remove(local_path)
+
+
+class State(object):
+    """A JSON file recording which files are done (with their sizes) and which the server doesn't have"""
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.done = {}
+        self.missing = set()
+        if path and os.path.exists(path):
+            with open(path) as f:
+                state = json.load(f)
+            self.done = state.get('done', {})
+            self.missing = set(state.get('missing', []))
+
+    def record(self, name, size=None):
+        """Record a file as done, or as missing when it has no size and its hour isn't recent"""
+        with self.lock:
+            if size is None:
+                if file_hour(name) < datetime.utcnow() - RECENT:
+                    self.missing.add(name)
+            else:
+                self.done[name] = size
+
+    def save(self):
+        """Write the state atomically, so an interrupted save never loses it"""
+        if not self.path:
+            return
+        with self.lock:
+            state = {'done': self.done, 'missing': sorted(self.missing)}
+        temp = self.path + '.tmp'
+        with open(temp, 'w') as f:
+            json.dump(state, f, sort_keys=True)
+        os.replace(temp, self.path)
+
+
+class Downloader(object):
+    """Fetches hourly files with a bounded worker pool, verifying and retrying each"""
+
+    def __init__(self, sink, state, source_url=SOURCE_URL, workers=8, retries=5, backoff=2.0, timeout=60):
+        self.sink = sink
+        self.state = state
+        self.source_url = source_url
+        self.workers = workers
+        self.retries = retries
+        self.backoff = backoff
+        self.timeout = timeout
+
+    def fetch(self, name):
+        """Download one file to a temporary path and verify it, returning (path, size) or None if it doesn't exist"""
+        url = self.source_url.format(name=name)
+        # Hidden and without the .json.gz suffix, so no job globbing the directory picks up a partial file
+        handle, temp = tempfile.mkstemp(prefix='.', suffix='.part', dir=self.sink.temp_dir)
+        os.close(handle)
+        try:
+            with urlopen(url, timeout=self.timeout) as response, open(temp, 'wb') as out:
+                shutil.copyfileobj(response, out, 1024 * 1024)
+            verify_gzip(temp)
+
+            # mkstemp makes the file readable by its owner alone, and moving it keeps that
+            os.chmod(temp, 0o644)
+            return temp, os.path.getsize(temp)
+        except HTTPError as e:
+            os.remove(temp)
+            if e.code == 404:
+                return None
+            raise
+        except BaseException:
+            os.remove(temp)
+            raise
+
+    def download(self, name):
+        """Fetch, verify and store one file, retrying with exponential backoff and jitter, returning its size"""
+        for attempt in range(self.retries + 1):
+            try:
+                # Only verified files ever land in the sink, so one already there is done. Checking here rather than
+                # before starting makes the checks against an object store as parallel as the downloads.
+                stored = self.sink.size(name)
+                if stored is not None:
+                    self.state.record(name, stored)
+                    return 0
+
+                fetched = self.fetch(name)
+                if fetched is None:
+                    self.state.record(name)
+                    return 0
+                temp, size = fetched
+                self.sink.put(temp, name)
+                self.state.record(name, size)
+                return size
+            except (HTTPError, URLError, OSError, EOFError, zlib.error) as e:
+                if attempt == self.retries:
+                    raise
+                delay = self.backoff * 2 ** attempt * (0.5 + random.random())
+                sys.stderr.write('{}: {}, retrying in {:.1f}s\n'.format(name, e, delay))
+                time.sleep(delay)
+
+    def run(self, names, report_every=10.0):
+        """Download every file not already done, reporting throughput and ETA, returning the names that failed"""
+        todo = [n for n in names if n not in self.state.done and n not in self.state.missing]
+        total = len(todo)
+        done = downloaded = 0
+        failed = []
+        start = last_report = time.time()
+
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            futures = {executor.submit(self.download, name): name for name in todo}
+            for future in as_completed(futures):
+                name = futures[future]
+                try:
+                    downloaded += future.result()
+                except Exception as e:
+                    sys.stderr.write('{}: failed for good: {}\n'.format(name, e))
+                    failed.append(name)
+                done += 1
+
+                now = time.time()
+                if now - last_report >= report_every or done == total:
+                    self.state.save()
+                    elapsed = now - start
+                    rate = done / elapsed if elapsed else 0.0
+                    eta = (total - done) / rate if rate else 0.0
+                    sys.stdout.write('{}/{} files, {:.1f} MB/s, {:.1f} files/s, ETA {}\n'.format(
+                        done, total, downloaded / elapsed / 1e6 if elapsed else 0.0, rate,
+                        timedelta(seconds=int(eta))
+                    ))
+                    sys.stdout.flush()
+                    last_report = now
+
+        self.state.save()
+        return failed
+
+
+def main():
+    date = lambda s: datetime.strptime(s, '%Y-%m-%d')
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--start', type=date, required=True, help='first day, YYYY-MM-DD')
+    parser.add_argument('--end', type=date, required=True, help='last day, YYYY-MM-DD, included')
+    parser.add_argument('--dest', default='data/', help='local directory or object store URI, i.e. s3://bucket/path')
+    parser.add_argument('--source-url', default=SOURCE_URL, help='URL template with a {name} placeholder')
+    parser.add_argument('--state', default=None, help='state file, defaults to .download-state.json in --dest '
+                                                      'for a local --dest')
+    parser.add_argument('--workers', type=int, default=8, help='parallel downloads')
+    parser.add_argument('--retries', type=int, default=5, help='retries per file')
+    parser.add_argument('--backoff', type=float, default=2.0, help='seconds before the first retry, doubling after')
+    parser.add_argument('--retry-missing', action='store_true', help='request files the server didn\'t have again')
+    args = parser.parse_args()
+
+    sink = Sink(args.dest)
+    state_path = args.state
+    if state_path is None and '://' not in args.dest:
+        state_path = os.path.join(args.dest, '.download-state.json')
+    state = State(state_path)
+    if args.retry_missing:
+        state.missing = set()
+
+    names = [n for n in hourly_names(args.start, args.end) if n not in state.done and n not in state.missing]
+
+    downloader = Downloader(sink, state, args.source_url, args.workers, args.retries, args.backoff)
+    failed = downloader.run(names)
+    if failed:
+        sys.stderr.write('{} files failed, run again to retry them\n'.format(len(failed)))
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
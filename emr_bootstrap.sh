@@ -1,4 +1,4 @@
 #!/usr/bin/env bash
 
 sudo pip install --upgrade pip
-sudo pip install frozendict findspark numpy pandas dateutil ipython
+sudo pip install frozendict findspark numpy pandas pyarrow orjson dateutil ipython
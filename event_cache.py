@@ -0,0 +1,112 @@
+"""A columnar cache of the raw gharchive.org events, so extraction never reads the gzipped JSON again.
+
+The routing stage writes every event once as a row of the Events table in schemas.py, partitioned by `type` and
+`created_date`: the envelope fields as typed columns and the payload as its JSON text. Extractors read only the
+partitions of their event type, and the Python ones get back the event dicts they expect from `event_of_row`.
+Top-level fields that don't fit the envelope, like the `repository` and string `actor` of 2011-2014 events, are kept as
+JSON in `extra`. Of the actor, repo and org objects only the ids and names are kept, which is all the extractors read.
+Each row also records the input file and line the event came from, so a dead letter can be traced back to it.
+"""
+import json
+from datetime import timezone
+
+from schemas import TABLE_SCHEMAS, coerce
+from timestamps import parse_timestamp
+
+# The envelope's objects: the column of each one's id and of its name
+ENVELOPE_OBJECTS = [
+    ('actor', 'actor_id', 'login', 'actor_login'),
+    ('repo', 'repo_id', 'name', 'repo_name'),
+    ('org', 'org_id', 'login', 'org_login'),
+]
+
+# The envelope's fields kept as they are
+ENVELOPE_FIELDS = ['id', 'type', 'created_at', 'public']
+
+
+def created_date(created_at):
+    """The UTC date an event was created on, its cache partition, or None if its created_at doesn't parse"""
+    try:
+        at = parse_timestamp(created_at)
+    except (TypeError, ValueError, OverflowError):
+        return None
+    if at is not None and at.tzinfo is not None:
+        at = at.astimezone(timezone.utc)
+    return at.date() if at is not None else None
+
+
+def cache_row(record, event_type, source_file=None, source_line=None):
+    """A row dict of the Events table from a parsed event, read from a line of an input file"""
+    types = dict(TABLE_SCHEMAS['Events'])
+    objects = {name: columns for name, *columns in ENVELOPE_OBJECTS}
+    row = {
+        'type': event_type, 'created_date': created_date(record.get('created_at')), 'source_file': source_file,
+        'source_line': source_line
+    }
+    extra = {}
+
+    for name, value in record.items():
+        if name == 'type':
+            continue
+        if name == 'payload':
+            row['payload'] = json.dumps(value)
+        elif name in ENVELOPE_FIELDS and coerce(value, types[name]) == value:
+            row[name] = value
+        elif name in objects and isinstance(value, dict):
+            id_column, key, key_column = objects[name]
+            row[id_column] = coerce(value.get('id'), 'long')
+            row[key_column] = value.get(key) if isinstance(value.get(key), str) else None
+        else:
+            extra[name] = value
+
+    row['extra'] = json.dumps(extra) if extra else None
+    return row
+
+
+def event_of_row(row):
+    """A cached event as the event dict the extractors read"""
+    event = {name: row[name] for name in ENVELOPE_FIELDS if row[name] is not None}
+    for name, id_column, key, key_column in ENVELOPE_OBJECTS:
+        if row[id_column] is not None or row[key_column] is not None:
+            event[name] = {'id': row[id_column], key: row[key_column]}
+    if row['payload'] is not None:
+        event['payload'] = json.loads(row['payload'])
+    if row['extra'] is not None:
+        event.update(json.loads(row['extra']))
+    return event
+
+
+def source_of_row(row):
+    """The input file and line number of a cached event, None for caches written before they were recorded"""
+    fields = row.asDict() if hasattr(row, 'asDict') else row
+    return fields.get('source_file'), fields.get('source_line')
+
+
+def numbered_lines(rows):
+    """(file, line number, line) from the rows of a text DataFrame with each line's input file in `file`
+
+    A partition reads each gzipped file whole and in order, so numbering the lines of each file as they come gives
+    their line numbers in it. Uncompressed files may be split, and are numbered from the start of each split.
+    """
+    source_file, number = None, 0
+    for row in rows:
+        if row['file'] != source_file:
+            source_file, number = row['file'], 0
+        number += 1
+        yield source_file, number, row['value']
+
+
+def read_cached(spark, path, event_type, payload_schema=None):
+    """The cached events of one type as a DataFrame, with the envelope nested as in the raw events
+
+    With a payload_schema the payload is parsed against it, as spark.read.json would, otherwise it stays JSON text.
+    """
+    from pyspark.sql.functions import col, from_json, struct
+
+    events = spark.read.parquet(path).where(col('type') == event_type)
+    nested = [col(name) for name in ENVELOPE_FIELDS] + [
+        struct(col(id_column).alias('id'), col(key_column).alias(key)).alias(name)
+        for name, id_column, key, key_column in ENVELOPE_OBJECTS
+    ]
+    payload = from_json(col('payload'), payload_schema) if payload_schema is not None else col('payload')
+    return events.select(nested + [payload.alias('payload')])
@@ -0,0 +1,530 @@
+"""Extractors turning gharchive.org event dicts into flat row dicts, one function per event type.
+
+These are plain Python so the same code runs on Spark's Python workers, where build_parquet_tables.spark.py builds
+DataFrames of the dicts on the schemas in schemas.py, and in the single-node engine, build_parquet_tables.local.py,
+which writes them with pyarrow.
+"""
+import json
+from datetime import timezone
+
+from timestamps import parse_timestamp
+
+# Apply the function to every record. The jobs decode with decoder.Decoder, which skips unwanted types unparsed.
+def parse_json(line):
+    record = None
+    try:
+        record = json.loads(line)
+    except json.JSONDecodeError as e:
+        record = {'error': 'Parse error', 'reason': e.msg}
+    return record
+
+
+class Missing(object):
+    """What a Lenient event gives for a field it lacks: falsy, empty and itself when indexed, so extractors carry on"""
+
+    def __getitem__(self, key):
+        return self
+
+    def __contains__(self, key):
+        return False
+
+    def __iter__(self):
+        return iter(())
+
+    def __len__(self):
+        return 0
+
+    def __bool__(self):
+        return False
+
+    def __repr__(self):
+        return 'MISSING'
+
+    def __reduce__(self):
+        return 'MISSING'
+
+
+MISSING = Missing()
+
+
+class Lenient(dict):
+    """An event dict giving MISSING for absent and null fields, with nested objects lenient too"""
+
+    def __getitem__(self, key):
+        value = dict.get(self, key)
+        if value is None:
+            return MISSING
+        if isinstance(value, dict):
+            return Lenient(value)
+        if isinstance(value, list):
+            return [Lenient(v) if isinstance(v, dict) else v for v in value]
+        return value
+
+
+def without_missing(value):
+    """A row dict, or list of them, with MISSING values as None and Lenient objects as plain dicts"""
+    if value is MISSING:
+        return None
+    if isinstance(value, dict):
+        return {k: without_missing(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [without_missing(v) for v in value]
+    return value
+
+
+def modern_envelope(record):
+    """An event dict with the actor and repository of a 2011-2014 event as `actor`, `repo` and `org` objects"""
+    if not isinstance(record, dict) or (isinstance(record.get('actor'), dict) and 'repo' in record):
+        return record
+
+    record = dict(record)
+    if not isinstance(record.get('actor'), dict):
+        attributes = record.get('actor_attributes') or {}
+        record['actor'] = {'id': attributes.get('id'), 'login': attributes.get('login', record.get('actor'))}
+
+    repository = record.get('repository')
+    if 'repo' not in record and isinstance(repository, dict):
+        name = repository.get('name')
+        if repository.get('owner') and name:
+            name = '{}/{}'.format(repository['owner'], name)
+        record['repo'] = {'id': repository.get('id'), 'name': name, 'url': repository.get('url')}
+        if 'org' not in record and repository.get('organization'):
+            record['org'] = {'id': None, 'login': repository['organization']}
+    return record
+
+
+def extract_leniently(extractor, record):
+    """Run an extractor on an event, again with missing fields as nulls if that fails, returning (rows, error)
+
+    Events from 2011-2014 lack many of the fields later ones have, and name their actor and repository differently,
+    see modern_envelope(). Rows come back None when even the lenient run fails, with the error as text.
+    """
+    record = modern_envelope(record)
+    try:
+        return extractor(record), None
+    except Exception:
+        pass
+
+    if not isinstance(record, dict):
+        return None, 'Event is not an object'
+    try:
+        return without_missing(extractor(Lenient(record))), None
+    except Exception as e:
+        return None, '{}: {}'.format(type(e).__name__, e)
+
+
+def dead_letter(table, record, error, source_file=None, source_line=None):
+    """A row dict for the DeadLetters table, of an event no extractor could make a row of, from a line of a file"""
+    created_at = record.get('created_at') if isinstance(record, dict) else None
+    try:
+        hour = parse_timestamp(created_at)
+    except (TypeError, ValueError, OverflowError):
+        hour = None
+    if hour is not None and hour.tzinfo is not None:
+        hour = hour.astimezone(timezone.utc)
+
+    return {
+        'table': table,
+        'event_type': record.get('type') if isinstance(record, dict) else None,
+        'id': record.get('id') if isinstance(record, dict) else None,
+        'created_at': hour,
+        'source_file': source_file,
+        'source_line': source_line,
+        'error': error,
+        'event': json.dumps(record, default=str),
+    }
+
+
+# See: https://developer.github.com/v3/activity/events/types/#forkevent
+def extract_fork(f):
+    """Extracts a row dict of a ForkEvent and its associated fields from a gharchive.org event dict"""
+    
+    # Out forks...
+    out_f = {
+        'id': f['id'],
+        'created_at': parse_timestamp(f['created_at']),
+        'type': 'ForkEvent',
+        'public': f['public']
+    }
+    
+    actor = f['actor']
+    out_f['actor_user_id'] = actor['id']
+    out_f['actor_user_name'] = actor['login']
+    
+    org = f['org'] if 'org' in f else {}
+    out_f['from_org_id'] = org['id'] if 'id' in org else None
+    out_f['from_org_login'] = org['login'] if 'login' in org else ''
+    
+    repo = f['repo']
+    out_f['from_repo_id'] = repo['id']
+    out_f['from_repo_name'] = repo['name']
+    
+    payload = f['payload']
+    forkee = payload['forkee']
+    
+    owner = forkee['owner']
+    out_f['to_user_id'] = owner['id']
+    out_f['to_user_name'] = owner['login']
+    
+    out_f['to_repo_created_at'] = parse_timestamp(forkee['created_at'])
+    out_f['to_repo_updated_at'] = parse_timestamp(forkee['updated_at'])
+    out_f['to_repo_pushed_at'] = parse_timestamp(forkee['pushed_at'])
+    
+    out_f['to_repo_size'] = forkee['size']
+    out_f['to_repo_stargazer_count'] = forkee['stargazers_count']
+    out_f['to_repo_watcher_count'] = forkee['watchers_count']
+    out_f['to_repo_forks_count'] = forkee['forks_count']
+    
+    license = forkee['license'] if 'license' in forkee and isinstance(forkee['license'], dict) else {}
+    out_f['to_license_key'] = license['key'] if 'key' in license else ''
+    out_f['to_license_name'] = license['name'] if 'name' in license else ''
+    
+    return out_f
+
+
+# See: https://developer.github.com/v3/activity/events/types/#pushevent
+def extract_push_commits(p):
+    """Extract a row dict of a PushEvent from a gharchive.org event dict, with its commits nested under `commits`"""
+    
+    # Out pushes...
+    out_p = {
+        'type': 'PushEvent',
+        'id': p['id'],
+        'created_at': parse_timestamp(p['created_at']),
+        'public': p['public']
+    }
+    
+    # Who pushed it?
+    actor = p['actor']
+    out_p['actor_id'] = actor['id']
+    out_p['actor_user_name'] = actor['login']
+    
+    # To what repo?
+    repo = p['repo']
+    out_p['repo_id'] = repo['id']
+    out_p['repo_name'] = repo['name']
+    
+    # What did they push?
+    payload = p['payload']
+    out_p['push_id'] = payload['push_id']
+    out_p['push_size'] = payload['size']
+    out_p['push_ref'] = payload['ref']
+    out_p['push_head'] = payload['head']
+    out_p['push_before'] = payload['before']
+    
+    # Only what is particular to each commit, the rest comes from the push
+    out_p['commits'] = [
+        {
+            'sha': c['sha'],
+            'author_name': c['author']['name'],
+            'url': c['url'],
+            'message': c['message'],
+        }
+        for c in payload['commits']
+    ]
+    
+    return out_p
+
+
+def extract_push(p):
+    """Extracts a row dict of a PushEvent and its associated Commits from a gharchive.org event dict"""
+    
+    out_p = extract_push_commits(p)
+    
+    # Out commits...
+    out_cs = []
+    for c in out_p.pop('commits'):
+        out_c = {
+            'type': 'Commit',
+            'sha': c['sha'],
+            'repo_id': out_p['repo_id'],
+            'repo_name': out_p['repo_name'],
+            'push_id': out_p['push_id'],
+            'actor_id': out_p['actor_id'],
+            'actor_user_name': out_p['actor_user_name'],
+            'author_name': c['author_name'],
+            'url': c['url'],
+            'message': c['message'],
+            'push_created_at': out_p['created_at'],
+            'public': out_p['public']
+        }
+        out_cs.append(out_c)
+        
+    return [out_p] + out_cs
+
+
+# See https://developer.github.com/v3/activity/events/types/#createvent
+def extract_create(c):
+    """Extract a row dict of a CreateEvent and its associated fields from a gharchive.org event dict"""
+    
+    # Out creates...
+    out_c = {
+        'id': c['id'],
+        'created_at': parse_timestamp(c['created_at']),
+        'type': 'CreateEvent',
+    }
+    
+    actor = c['actor']
+    out_c['actor_id'] = actor['id']
+    out_c['actor_user_name'] = actor['login']
+    
+    repo = c['repo']
+    out_c['repo_id'] = repo['id']
+    out_c['repo_name'] = repo['name']
+    
+    out_c['public'] = c['public']
+    
+    return out_c
+
+
+# See https://developer.github.com/v3/activity/events/types/#deleteevent
+def extract_delete(d):
+    """Extract a row dict of a DeleteEvent and its associated fields from a gharchive.org event dict"""
+    
+    # Out deletes...
+    out_d = {
+        'id': d['id'],
+        'type': 'DeleteEvent',
+        'created_at': parse_timestamp(d['created_at'])
+    }
+    
+    actor = d['actor']
+    out_d['actor_id'] = actor['id']
+    out_d['actor_user_name'] = actor['login']
+    
+    repo = d['repo']
+    out_d['repo_id'] = repo['id']
+    out_d['repo_name'] = repo['name']
+    
+    org = d['org'] if 'org' in d else {}
+    out_d['org_id'] = org['id'] if 'id' in org else None
+    out_d['org_name'] = org['login'] if 'login' in org else ''
+    
+    out_d['public'] = d['public']
+    
+    return out_d
+
+
+# See https://developer.github.com/v3/activity/events/types/#issueevent
+def extract_issue(i):
+    """Extract a row dict of a IssueEvent and its associated fields from a gharchive.org event dict"""
+    
+    # Out issues...
+    out_i = {
+        'id': i['id'],
+        'type': 'IssuesEvent',
+        'created_at': parse_timestamp(i['created_at']),
+        'public': i['public']
+    }
+    
+    actor = i['actor']
+    out_i['actor_id'] = actor['id']
+    out_i['actor_user_name'] = actor['login']
+    
+    repo = i['repo']
+    out_i['repo_id'] = repo['id']
+    out_i['repo_name'] = repo['name']
+    
+    payload = i['payload']
+    out_i['action'] = payload['action']
+
+    issue = payload['issue']
+    out_i['assignee'] = issue['assignee']
+    out_i['assignees'] = issue['assignees']
+    out_i['body'] = issue['body']
+    out_i['closed_at'] = parse_timestamp(issue['closed_at']) if issue['closed_at'] else None
+    out_i['comments'] = issue['comments']
+    out_i['issue_id'] = issue['id']
+    out_i['labels'] = issue['labels']
+    out_i['locked'] = issue['locked']
+    out_i['number'] = issue['number']
+    out_i['title'] = issue['title']
+    out_i['updated_at'] = issue['updated_at']
+    
+    user = issue['user']
+    out_i['user_id'] = user['id']
+    out_i['user_name'] = user['login']
+    
+    return out_i
+
+
+# See https://developer.github.com/v3/activity/events/types/#memberevent
+def extract_member(m):
+    """Extract a row dict of a MemberEvent and its associated fields from a gharchive.org event dict"""
+    
+    # Out members...
+    out_m = {
+        'id': m['id'],
+        'type': 'MemberEvent',
+        'created_at': parse_timestamp(m['created_at']),
+        'public': m['public']
+    }
+    
+    actor = m['actor']
+    out_m['actor_id'] = actor['id']
+    out_m['actor_user_name'] = actor['login']
+    
+    payload = m['payload']
+    out_m['action'] = payload['action']
+
+    member = payload['member']
+    out_m['member_id'] = member['id']
+    out_m['member_name'] = member['login']
+    out_m['site_admin'] = member['site_admin']
+    
+    repo = m['repo']
+    out_m['repo_id'] = repo['id']
+    out_m['repo_name'] = repo['name']
+    
+    return out_m
+
+
+# See https://developer.github.com/v3/activity/events/types/#pullrequestevent
+def extract_pull(p):
+    """Extract a row dict of a PullRequestEvent and its associated fields from a gharchive.org event dict"""
+    
+    # Out pull requests...
+    out_p = {
+        'id': p['id'],
+        'type': 'PullRequestEvent',
+        'created_at': parse_timestamp(p['created_at']),
+        'public': p['public']
+    }
+    
+    actor = p['actor']
+    out_p['actor_id'] = actor['id']
+    out_p['actor_user_name'] = actor['login']
+    
+    org = p['org'] if 'org' in p else {}
+    out_p['org_id'] = org['id'] if 'id' in org else None
+    out_p['org_name'] = org['login'] if 'login' in org else None
+    
+    payload = p['payload']
+    out_p['action'] = payload['action']
+    out_p['number'] = payload['number']
+    
+    pull_request = payload['pull_request']
+    out_p['additions'] = pull_request['additions']
+    out_p['assignee'] = pull_request['assignee']
+    out_p['assignees'] = pull_request['assignees']
+    out_p['author_association'] = pull_request['author_association']
+    
+    base = pull_request['base']
+    out_p['base_label'] = base['label']
+    out_p['base_ref'] = base['ref']
+    
+    base_repo = base['repo']
+    out_p['base_repo_created_at'] = parse_timestamp(base_repo['created_at'])
+    out_p['base_repo_default_branch'] = base_repo['default_branch'] if 'default_branch' in base_repo else None
+    out_p['base_repo_description'] = base_repo['description']
+    out_p['base_repo_fork'] = base_repo['fork']
+    out_p['base_repo_forks'] = base_repo['forks']
+    out_p['base_repo_full_name'] = base_repo['full_name']
+    out_p['base_repo_id'] = base_repo['id']
+    out_p['base_repo_language'] = base_repo['language']
+    
+    license = base_repo['license'] if isinstance(base_repo['license'], dict) else {}
+    out_p['base_repo_license_key'] = license['key'] if 'key' in license else None
+    out_p['base_repo_license_name'] = license['name'] if 'name' in license else None
+    
+    out_p['base_repo_name'] = base_repo['name']
+    out_p['base_repo_open_issues'] = base_repo['open_issues']
+    
+    owner = base_repo['owner']
+    out_p['base_repo_owner_id'] = owner['id']
+    out_p['base_repo_owner_user_name'] = owner['login']
+    out_p['base_repo_owner_site_admin'] = owner['site_admin']
+    
+    out_p['base_repo_private'] = base_repo['private']
+    out_p['base_repo_pushed_at'] = parse_timestamp(base_repo['pushed_at'])
+    out_p['base_repo_size'] = base_repo['size']
+    out_p['base_repo_stargazers_count'] = base_repo['stargazers_count']
+    out_p['base_repo_updated_at'] = parse_timestamp(base_repo['updated_at'])
+    out_p['base_repo_watchers'] = base_repo['watchers']
+    
+    out_p['base_sha'] = base['sha']
+    
+    base_user = base['user']
+    out_p['base_user_id'] = base_user['id']
+    out_p['base_user_user_name'] = base_user['login']
+    out_p['base_user_site_admin'] = base_user['site_admin']
+    
+    out_p['body'] = pull_request['body']
+    out_p['changed_files'] = pull_request['changed_files']
+    out_p['closed_at'] = parse_timestamp(pull_request['closed_at']) if pull_request['closed_at'] else None
+    out_p['comments'] = pull_request['comments']
+    out_p['commits'] = pull_request['commits']
+    out_p['created_at'] = parse_timestamp(pull_request['created_at'])
+    out_p['deletions'] = pull_request['deletions']
+    
+    head = pull_request['head']
+    out_p['head_label'] = head['label']
+    out_p['head_ref'] = head['ref']
+    
+    head_repo = head['repo'] if 'repo' in head and isinstance(head['repo'], dict) else {}
+    out_p['head_repo_created_at'] = parse_timestamp(head_repo['created_at']) if 'created_at' in head_repo and head_repo['created_at'] else None
+    out_p['head_repo_default_branch'] = head_repo['default_branch'] if 'default_branch' in head_repo else None
+    out_p['head_repo_description'] = head_repo['description'] if 'description' in head_repo else None
+    out_p['head_repo_fork'] = head_repo['fork'] if 'fork' in head_repo else None
+    out_p['head_repo_forks'] = head_repo['forks'] if 'forks' in head_repo else None
+    out_p['head_repo_full_name'] = head_repo['full_name'] if 'full_name' in head_repo else None
+    out_p['head_repo_id'] = head_repo['id'] if 'id' in head_repo else None
+    out_p['head_repo_language'] = head_repo['language'] if 'language' in head_repo else None
+    out_p['head_repo_languages'] = head_repo['languages'] if 'languages' in head_repo else ''
+    
+    head_repo_license = head_repo['license'] if 'license' in head_repo and isinstance(head_repo['license'], dict) else {}
+    out_p['head_repo_license_key'] = head_repo_license['key'] if 'key' in head_repo_license else None
+    out_p['head_repo_license_name'] = head_repo_license['name'] if 'name' in head_repo_license else None
+    
+    out_p['head_repo_name'] = head_repo['name'] if 'name' in head_repo else None
+    out_p['head_repo_open_issues'] = head_repo['open_issues'] if 'open_issues' in head_repo else None
+    
+    head_repo_owner = head_repo['owner'] if 'owner' in head_repo else {}
+    out_p['head_repo_owner_id'] = head_repo_owner['id'] if 'id' in head_repo_owner else None
+    out_p['head_repo_owner_user_name'] = head_repo_owner['login'] if 'login' in head_repo_owner else None
+    out_p['head_repo_owner_site_admin'] = head_repo_owner['site_admin'] if 'site_admin' in head_repo_owner else None
+    
+    out_p['head_repo_private'] = head_repo['private'] if 'private' in head_repo else None
+    out_p['head_repo_pushed_at'] = parse_timestamp(head_repo['pushed_at']) if 'pushed_at' in head_repo else None
+    out_p['head_repo_size'] = head_repo['size'] if 'size' in head_repo else None
+    out_p['head_repo_stargazers_count'] = head_repo['stargazers_count'] if 'stargazers_count' in head_repo else None
+    out_p['head_repo_updated_at'] = parse_timestamp(head_repo['updated_at']) if 'updated_at' in head_repo else None
+    out_p['head_repo_watchers'] = head_repo['watchers'] if 'watchers' in head_repo else None
+    
+    out_p['head_sha'] = head['sha']
+    
+    head_user = head['user']
+    out_p['head_user_id'] = head_user['id']
+    out_p['head_user_name'] = head_user['login']
+    out_p['head_user_site_admin'] = head_user['site_admin']
+    
+    out_p['id'] = pull_request['id']
+    # out_p['labels'] = pull_request['labels']
+    out_p['locked'] = pull_request['locked']
+    out_p['merge_commit_sha'] = pull_request['merge_commit_sha']
+    out_p['mergeable'] = pull_request['mergeable']
+    out_p['merged'] = pull_request['merged']
+    out_p['merged_at'] = parse_timestamp(pull_request['merged_at']) if 'merged_at' in pull_request and pull_request['merged_at'] else None
+    out_p['merged_by'] = pull_request['merged_by']
+    out_p['milestone'] = pull_request['milestone']
+    out_p['number'] = pull_request['number']
+    out_p['rebaseable'] = pull_request['rebaseable']
+    out_p['requested_reviewers'] = pull_request['requested_reviewers']
+    out_p['requested_teams'] = pull_request['requested_teams']
+    out_p['review_comments'] = pull_request['review_comments']
+    out_p['state'] = pull_request['state']
+    out_p['title'] = pull_request['title']
+    out_p['updated_at'] = parse_timestamp(pull_request['updated_at']) if 'updated_at' in pull_request else None
+    
+    user = pull_request['user']
+    out_p['user_id'] = user['id']
+    out_p['user_name'] = user['login']
+    out_p['user_site_admin'] = user['site_admin']
+    
+    out_p['public'] = p['public']
+    
+    repo = p['repo']
+    out_p['repo_id'] = repo['id']
+    out_p['repo_name'] = repo['name']
+    
+    return out_p
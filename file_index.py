@@ -0,0 +1,245 @@
+"""A sidecar index of each table's row groups, so lookups of one repository or user only open the files holding it.
+
+For every row group of every file the index keeps its row count, the min and max of its timestamp (`created_at`, or
+`push_created_at` for Commits) and, for each of `repo_id`, `repo_name` and `actor_id` the table has, the min, max and a
+bloom filter of the values in it. Entries live as Parquet under `<table>/_index`, which Spark and pyarrow leave out
+when reading the table itself. Each run that writes a table adds one `<run id>-index.parquet` for the files it wrote,
+so an interrupted run's entries are removed along with its files, see manifest.py. The single machine engine writes
+one beside each hourly part file instead.
+
+FileIndex.row_groups() reads the index and returns the row groups that may hold a lookup's rows, and read_arrow() and
+read_spark() open only those, then filter the rows exactly. Bloom filters can have false positives but no false
+negatives, so a lookup never misses a row.
+"""
+import hashlib
+import math
+from collections import OrderedDict
+
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+import pyarrow.fs as pafs
+import pyarrow.parquet as pq
+
+INDEX_DIR = '_index'
+
+# The column whose range each entry keeps, the first a table has
+TIME_COLUMNS = ['created_at', 'push_created_at']
+
+# The columns lookups are by, with a range and a bloom filter each
+KEY_COLUMNS = [('repo_id', pa.int64()), ('repo_name', pa.string()), ('actor_id', pa.int64())]
+
+# The chance a bloom filter says a value is in a row group when it isn't
+FALSE_POSITIVE_RATE = 0.01
+
+INDEX_SCHEMA = pa.schema(
+    [('file', pa.string()), ('row_group', pa.int32()), ('num_rows', pa.int64()),
+     ('min_created_at', pa.timestamp('us')), ('max_created_at', pa.timestamp('us'))] +
+    [field for key, key_type in KEY_COLUMNS
+     for field in [('min_' + key, key_type), ('max_' + key, key_type), ('bloom_' + key, pa.binary())]]
+)
+
+
+class BloomFilter(object):
+    """A bloom filter over the string form of values, hashed alike in every process, unlike hash()"""
+
+    def __init__(self, bits, hashes):
+        self.bits = bytearray(bits)
+        self.hashes = hashes
+
+    @classmethod
+    def of(cls, values, false_positive_rate=FALSE_POSITIVE_RATE):
+        """A filter sized for a list of distinct values"""
+        n = max(len(values), 1)
+        bits = max(64, int(math.ceil(-n * math.log(false_positive_rate) / math.log(2) ** 2)))
+        bloom = cls(bytearray((bits + 7) // 8), max(1, int(round(float(bits) / n * math.log(2)))))
+        for value in values:
+            bloom.add(value)
+        return bloom
+
+    @classmethod
+    def from_bytes(cls, data):
+        return cls(data[1:], data[0])
+
+    def to_bytes(self):
+        return bytes([self.hashes]) + bytes(self.bits)
+
+    def positions(self, value):
+        # Double hashing: two 64 bit hashes from one digest make all the bit positions
+        digest = hashlib.blake2b(str(value).encode('utf-8'), digest_size=16).digest()
+        h1, h2 = int.from_bytes(digest[:8], 'little'), int.from_bytes(digest[8:], 'little') | 1
+        size = len(self.bits) * 8
+        return [(h1 + i * h2) % size for i in range(self.hashes)]
+
+    def add(self, value):
+        for position in self.positions(value):
+            self.bits[position // 8] |= 1 << (position % 8)
+
+    def __contains__(self, value):
+        return all(self.bits[position // 8] & (1 << (position % 8)) for position in self.positions(value))
+
+
+def time_column(names):
+    return next((name for name in TIME_COLUMNS if name in names), None)
+
+
+def index_row_groups(parquet_file, relative):
+    """Index entries for the row groups of an open ParquetFile, found at `relative` under its table"""
+    names = parquet_file.schema_arrow.names
+    timed = time_column(names)
+    keys = [key for key, _ in KEY_COLUMNS if key in names]
+
+    entries = []
+    for i in range(parquet_file.num_row_groups):
+        group = parquet_file.read_row_group(i, columns=([timed] if timed else []) + keys)
+        entry = {'file': relative, 'row_group': i, 'num_rows': group.num_rows}
+        if timed:
+            # Spark writes naive timestamps in UTC, the single machine engine may write them with a zone
+            times = pc.min_max(group[timed].cast(pa.timestamp('us', tz='UTC')).cast(pa.timestamp('us')))
+            entry['min_created_at'], entry['max_created_at'] = times['min'].as_py(), times['max'].as_py()
+        for key in keys:
+            values = pc.unique(group[key]).drop_null().to_pylist()
+            entry['min_' + key] = min(values) if values else None
+            entry['max_' + key] = max(values) if values else None
+            entry['bloom_' + key] = BloomFilter.of(values).to_bytes()
+        entries.append(entry)
+    return entries
+
+
+def index_file(table_path, relative):
+    """Index entries for one file of a table, given by its path relative to the table"""
+    fs, root = pafs.FileSystem.from_uri(table_path)
+    with fs.open_input_file(root + '/' + relative) as f:
+        return index_row_groups(pq.ParquetFile(f), relative)
+
+
+def write_index(table_path, entries, name):
+    """Write index entries to <table>/_index/<name>"""
+    fs, root = pafs.FileSystem.from_uri(table_path)
+    fs.create_dir(root + '/' + INDEX_DIR)
+    pq.write_table(pa.Table.from_pylist(entries, schema=INDEX_SCHEMA), root + '/' + INDEX_DIR + '/' + name,
+                   filesystem=fs)
+
+
+def table_files(sc, table_path):
+    """Paths of a table's Parquet files relative to it, leaving out _index and other underscored directories"""
+    from manifest import hadoop_path, list_files
+
+    _, path = hadoop_path(sc, table_path)
+    prefix = path.toUri().getPath().rstrip('/') + '/'
+    relatives = [status.getPath().toUri().getPath()[len(prefix):] for status in list_files(sc, table_path)]
+    return [r for r in relatives if r.endswith('.parquet') and not any(p.startswith('_') for p in r.split('/'))]
+
+
+def index_files(sc, table_path, relatives, run_id):
+    """Index a run's files of a table on the Spark workers, writing their entries to _index/<run id>-index.parquet"""
+    if not relatives:
+        return 0
+    entries = sc.parallelize(relatives, len(relatives)) \
+        .flatMap(lambda relative: index_file(table_path, relative)) \
+        .collect()
+    write_index(table_path, entries, '{}-index.parquet'.format(run_id))
+    return len(entries)
+
+
+def lookup_keys(keys):
+    """Key values of a lookup as the types of their columns, so repo_id='12' finds 12"""
+    types = dict(KEY_COLUMNS)
+    unknown = set(keys) - set(types)
+    if unknown:
+        raise ValueError('Lookups are by {}, not {}'.format(', '.join(k for k, _ in KEY_COLUMNS), sorted(unknown)))
+    return {key: int(value) if pa.types.is_integer(types[key]) else value for key, value in keys.items()}
+
+
+class FileIndex(object):
+    """The index entries of one table, answering which row groups may hold a lookup's rows"""
+
+    def __init__(self, table_path, entries):
+        self.table_path = table_path.rstrip('/')
+        self.entries = entries
+
+    @classmethod
+    def read(cls, table_path):
+        fs, root = pafs.FileSystem.from_uri(table_path.rstrip('/'))
+        if fs.get_file_info(root + '/' + INDEX_DIR).type == pafs.FileType.NotFound:
+            raise ValueError('{} has no index, see file_index.py'.format(table_path))
+        index = ds.dataset(root + '/' + INDEX_DIR, filesystem=fs, format='parquet', schema=INDEX_SCHEMA)
+        return cls(table_path, index.to_table().to_pylist())
+
+    def matches(self, entry, start, end, keys):
+        if start is not None and entry['max_created_at'] is not None and entry['max_created_at'] < start:
+            return False
+        if end is not None and entry['min_created_at'] is not None and entry['min_created_at'] >= end:
+            return False
+        for key, value in keys.items():
+            if entry['bloom_' + key] is None:
+                return False
+            if entry['min_' + key] is None or not entry['min_' + key] <= value <= entry['max_' + key]:
+                return False
+            if value not in BloomFilter.from_bytes(entry['bloom_' + key]):
+                return False
+        return True
+
+    def row_groups(self, start=None, end=None, **keys):
+        """Row groups per file that may hold rows with the given key values, created in [start, end) in UTC"""
+        keys = lookup_keys(keys)
+        groups = OrderedDict()
+        for entry in sorted(self.entries, key=lambda e: (e['file'], e['row_group'])):
+            if self.matches(entry, start, end, keys):
+                groups.setdefault(entry['file'], []).append(entry['row_group'])
+        return groups
+
+    def files(self, start=None, end=None, **keys):
+        """Paths of the files that may hold rows with the given key values, relative to the table"""
+        return list(self.row_groups(start, end, **keys))
+
+
+def read_arrow(table_path, start=None, end=None, **keys):
+    """A table's rows with the given key values as a pyarrow Table, reading only the row groups the index points at"""
+    keys = lookup_keys(keys)
+    index = FileIndex.read(table_path)
+    groups = index.row_groups(start, end, **keys)
+    fs, root = pafs.FileSystem.from_uri(index.table_path)
+
+    # With nothing to read, the schema still comes from one of the table's files
+    files = list(groups) or [e['file'] for e in index.entries[:1]]
+    dataset = ds.dataset([root + '/' + f for f in files], filesystem=fs, format='parquet', partitioning='hive',
+                         partition_base_dir=root)
+    if not groups:
+        return dataset.schema.empty_table()
+
+    condition = None
+    timed = time_column(dataset.schema.names)
+    conditions = [ds.field(key) == value for key, value in keys.items()]
+    conditions += [ds.field(timed) >= pa.scalar(start, dataset.schema.field(timed).type)] if start and timed else []
+    conditions += [ds.field(timed) < pa.scalar(end, dataset.schema.field(timed).type)] if end and timed else []
+    for c in conditions:
+        condition = c if condition is None else condition & c
+
+    tables = []
+    for fragment in dataset.get_fragments():
+        row_groups = groups[fragment.path[len(root) + 1:]]
+        tables.append(fragment.subset(row_group_ids=row_groups).to_table(schema=dataset.schema, filter=condition))
+    return pa.concat_tables(tables)
+
+
+def read_spark(spark, table_path, start=None, end=None, **keys):
+    """A table's rows with the given key values as a DataFrame, reading only the files the index points at"""
+    from pyspark.sql.functions import col, lit
+
+    # Spark skips the row groups within them using their statistics
+    keys = lookup_keys(keys)
+    index = FileIndex.read(table_path)
+    files = index.files(start, end, **keys)
+    reader = spark.read.option('basePath', index.table_path)
+    df = reader.parquet(*[index.table_path + '/' + f for f in files]) if files \
+        else reader.parquet(index.table_path).limit(0)
+
+    for key, value in keys.items():
+        df = df.where(col(key) == lit(value))
+    timed = time_column(df.columns)
+    if start is not None and timed:
+        df = df.where(col(timed) >= lit(start))
+    if end is not None and timed:
+        df = df.where(col(timed) < lit(end))
+    return df
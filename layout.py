@@ -0,0 +1,124 @@
+"""The on-disk layout of the output tables: partitioning, sort order and file sizes.
+
+Without a layout, a table's files are whatever the input partitioning produced, typically thousands of tiny files from
+thousands of small `.json.gz` inputs, in no particular order. An OutputLayout instead partitions each table by the date
+(or year and month) of its timestamp column, range partitions the rows so each task holds a contiguous slice of
+dates and repositories, sorts them within each file on `repo_id`/`repo_name` and caps files at about a target size.
+Readers filtering on dates then prune whole directories, and readers filtering on repositories skip row groups using
+the min/max statistics that sorting makes tight.
+"""
+import math
+import os
+
+from pyspark import StorageLevel
+from pyspark.sql.functions import col, month, to_date, year
+
+from manifest import list_files
+
+# Partitioning schemes and the partition columns they add
+PARTITION_COLUMNS = {
+    'none': [],
+    'date': ['created_date'],
+    'month': ['created_year', 'created_month'],
+}
+
+# Compressed bytes per row assumed for a table that has never been written before
+DEFAULT_ROW_BYTES = 200
+
+
+class OutputLayout(object):
+    """How the output tables are laid out on disk"""
+
+    def __init__(self, partition_by='none', sort_by=('repo_id', 'repo_name'), target_file_mb=256):
+        if partition_by not in PARTITION_COLUMNS:
+            raise ValueError('partition_by must be one of {}, not {!r}'.format(sorted(PARTITION_COLUMNS), partition_by))
+
+        self.partition_by = partition_by
+        self.sort_by = list(sort_by)
+        self.target_file_bytes = int(target_file_mb * 1024 * 1024)
+
+    @classmethod
+    def from_environ(cls, default_partition_by='none'):
+        """A layout configured by GITHUB_PARTITION_BY, GITHUB_SORT_BY and GITHUB_TARGET_FILE_MB"""
+        sort_by = os.environ.get('GITHUB_SORT_BY', 'repo_id,repo_name')
+        return cls(
+            partition_by=os.environ.get('GITHUB_PARTITION_BY', default_partition_by),
+            sort_by=[c.strip() for c in sort_by.split(',') if c.strip()],
+            target_file_mb=float(os.environ.get('GITHUB_TARGET_FILE_MB', '256'))
+        )
+
+    @property
+    def partition_columns(self):
+        return PARTITION_COLUMNS[self.partition_by]
+
+    def add_partition_columns(self, df, date_column):
+        """Add the partition columns derived from a table's timestamp column"""
+        if self.partition_by == 'date':
+            return df.withColumn('created_date', to_date(col(date_column)))
+        if self.partition_by == 'month':
+            return df \
+                .withColumn('created_year', year(col(date_column))) \
+                .withColumn('created_month', month(col(date_column)))
+        return df
+
+    def files_for(self, rows, row_bytes):
+        """How many files of about the target size `rows` rows of `row_bytes` each make"""
+        return max(1, int(math.ceil(float(rows) * row_bytes / self.target_file_bytes)))
+
+    def rows_per_file(self, row_bytes):
+        """The row cap per file that keeps files near the target size"""
+        return max(1, int(self.target_file_bytes // max(row_bytes, 1)))
+
+    def arrange(self, df, date_column, rows, row_bytes):
+        """Partition and sort a table for writing, returning it with the columns to partition the write by and the
+        DataFrame it persisted, if any, to unpersist once written
+
+        Range partitioning runs a job of its own sampling its input for the range bounds. Rather than computing the
+        table once for that job and again for the write, running Python extractors and counting into their
+        accumulators twice, the input is persisted first. Hash partitioning would need no sample but would scatter
+        each file's repositories over every file of the date.
+        """
+
+        df = self.add_partition_columns(df, date_column)
+        sort_columns = [c for c in self.sort_by if c in df.columns]
+        order = self.partition_columns + sort_columns
+
+        persisted = None
+        if order:
+            df = persisted = df.persist(StorageLevel.MEMORY_AND_DISK)
+            df = df.repartitionByRange(self.files_for(rows, row_bytes), *order).sortWithinPartitions(*order)
+        else:
+            df = df.coalesce(self.files_for(rows, row_bytes))
+        return df, self.partition_columns, persisted
+
+    def write(self, df, path, date_column, rows, row_bytes, compression=None, options=None):
+        """Write a table to path in this layout, replacing what is there, with Spark's Parquet codec by default and any
+        other Parquet writer options, like column_profiles.spark_options
+        """
+
+        df, partition_columns, persisted = self.arrange(df, date_column, rows, row_bytes)
+        writer = df.write.mode('overwrite').option('maxRecordsPerFile', self.rows_per_file(row_bytes))
+        if compression:
+            writer = writer.option('compression', compression)
+        if options:
+            writer = writer.options(**options)
+        if partition_columns:
+            writer = writer.partitionBy(*partition_columns)
+        writer.parquet(path)
+        if persisted is not None:
+            persisted.unpersist()
+
+
+def estimate_row_bytes(spark, path, default=DEFAULT_ROW_BYTES):
+    """Average compressed bytes per row of an existing table, from its file sizes and Parquet footers"""
+
+    files = list_files(spark.sparkContext, path)
+    size = sum(
+        status.getLen() for status in files
+        if status.getPath().getName().endswith('.parquet') and status.getPath().getParent().getName() != '_index'
+    )
+    if not size:
+        return default
+
+    rows = spark.read.parquet(path).count()
+    return float(size) / rows if rows else default
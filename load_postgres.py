@@ -0,0 +1,375 @@
+"""Bulk load the Parquet tables into PostgreSQL for Superset.
+
+Each table is read with pyarrow, one Parquet file (partition) per task, and streamed into Postgres with
+`COPY ... FROM STDIN` in CSV batches by a pool of worker threads sharing a connection pool. The CSV is written by
+pyarrow in C++, so the workers spend their time in Arrow and libpq rather than in Python. Tables are created from the
+Parquet schema, indexes are built once all rows are in, and rows/sec is reported per table.
+
+Usage: python load_postgres.py --dsn postgresql://localhost/github --source s3://github-superset-parquet
+
+Try it against a local Postgres with: createdb github && python load_postgres.py --dsn postgresql:///github \
+    --source /path/to/parquet
+"""
+import argparse
+import io
+import json
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.csv as pacsv
+import pyarrow.dataset as ds
+import pyarrow.fs as pafs
+from psycopg2 import sql
+from psycopg2.pool import ThreadedConnectionPool
+
+from dimensions import DIMENSION_KEYS, FACT_DIMENSIONS, attribute_columns
+from schemas import TABLE_FILES, columns
+
+# The Parquet tables written by build_parquet_tables.spark.py and the Postgres tables they load into
+TABLES = {
+    'Creates.parquet': 'creates',
+    'Deletes.parquet': 'deletes',
+    'ForkEvents.parquet': 'fork_events',
+    'PushEvents.Parquet': 'push_events',
+    'Commits.parquet': 'commits',
+    'CommitMessages.parquet': 'commit_messages',
+    'Issues.parquet': 'issues',
+    'IssueTexts.parquet': 'issue_texts',
+    'Members.parquet': 'members',
+    'PullRequests.parquet': 'pull_requests',
+    'PullRequestTexts.parquet': 'pull_request_texts',
+    'IssueComments.parquet': 'issue_comments',
+    'IssueCommentTexts.parquet': 'issue_comment_texts',
+    'Stars.parquet': 'stars',
+    'Gists.parquet': 'gists',
+    'PublicEvents.parquet': 'public_events',
+    'Repos.parquet': 'repos',
+    'Users.parquet': 'users',
+    'Orgs.parquet': 'orgs',
+    'RepoDaily.parquet': 'repo_daily',
+    'RepoMonthly.parquet': 'repo_monthly',
+}
+
+# The schemas.py table of each Parquet table
+TABLE_NAMES = {f: t for t, f in TABLE_FILES.items()}
+
+# Columns worth an index for Superset's filters and joins, where a table has them
+INDEX_COLUMNS = [
+    'id', 'repo_id', 'actor_id', 'created_at', 'push_id', 'sha', 'issue_id', 'comment_id', 'user_id', 'org_id', 'date',
+    'month'
+]
+
+
+def postgres_type(arrow_type):
+    """The Postgres column type for an Arrow type, nested types are stored as JSONB"""
+    if pa.types.is_boolean(arrow_type):
+        return 'BOOLEAN'
+    if pa.types.is_int8(arrow_type) or pa.types.is_int16(arrow_type):
+        return 'SMALLINT'
+    if pa.types.is_int32(arrow_type):
+        return 'INTEGER'
+    if pa.types.is_integer(arrow_type):
+        return 'BIGINT'
+    if pa.types.is_floating(arrow_type):
+        return 'DOUBLE PRECISION'
+    if pa.types.is_decimal(arrow_type):
+        return 'NUMERIC'
+    if pa.types.is_timestamp(arrow_type):
+        return 'TIMESTAMPTZ'
+    if pa.types.is_date(arrow_type):
+        return 'DATE'
+    if pa.types.is_binary(arrow_type) or pa.types.is_large_binary(arrow_type):
+        return 'BYTEA'
+    if pa.types.is_nested(arrow_type):
+        return 'JSONB'
+    return 'TEXT'
+
+
+def create_table_ddl(schema_name, table, arrow_schema, appending=False):
+    """CREATE TABLE for a Parquet schema, UNLOGGED until the load is done, or if it's missing when appending"""
+    columns = sql.SQL(', ').join(
+        sql.SQL('{} {}').format(sql.Identifier(field.name), sql.SQL(postgres_type(field.type)))
+        for field in arrow_schema
+    )
+    create = 'CREATE TABLE IF NOT EXISTS {} ({})' if appending else 'CREATE UNLOGGED TABLE {} ({})'
+    return sql.SQL(create).format(sql.Identifier(schema_name, table), columns)
+
+
+def copy_batches(cursor, target, columns, fragment, schema, batch_rows):
+    """COPY one Parquet file into a table in CSV batches on a cursor, returning (rows, bytes)"""
+    copy = sql.SQL('COPY {} ({}) FROM STDIN WITH (FORMAT csv)').format(
+        target, sql.SQL(', ').join(sql.Identifier(c) for c in columns)
+    )
+    rows = size = 0
+    for batch in fragment.to_batches(schema=schema, batch_size=batch_rows):
+        if not batch.num_rows:
+            continue
+        data = to_csv(batch.select(columns))
+        cursor.copy_expert(copy, io.BytesIO(data))
+        rows += batch.num_rows
+        size += len(data)
+    return rows, size
+
+
+def plain(value, arrow_type):
+    """A Python value from Arrow as plain JSON-able data, with maps as objects rather than lists of pairs and text
+    without NUL characters, which JSONB rejects"""
+    if value is None:
+        return None
+    if isinstance(value, str):
+        return value.replace('\x00', '')
+    if pa.types.is_map(arrow_type):
+        return {plain(k, arrow_type.key_type): plain(v, arrow_type.item_type) for k, v in value}
+    if pa.types.is_list(arrow_type) or pa.types.is_large_list(arrow_type):
+        return [plain(v, arrow_type.value_type) for v in value]
+    if pa.types.is_struct(arrow_type):
+        return {field.name: plain(value[field.name], field.type) for field in arrow_type}
+    return value
+
+
+def json_column(column):
+    """A nested Arrow column as JSON text, for a JSONB column"""
+    return pa.array(
+        [None if v is None else json.dumps(plain(v, column.type), default=str) for v in column.to_pylist()],
+        type=pa.string()
+    )
+
+
+def csv_column(column):
+    """An Arrow column as COPY can read it from CSV
+
+    Nested columns become JSON. Postgres text can't hold NUL characters, which the odd issue body has, so they are
+    dropped. Timestamps without a zone, like Spark's INT96 ones, are UTC and written with its offset, rather than read
+    in the session's time zone.
+    """
+    if pa.types.is_nested(column.type):
+        return json_column(column)
+    if pa.types.is_string(column.type) or pa.types.is_large_string(column.type):
+        return pc.replace_substring(column, '\x00', '')
+    if pa.types.is_timestamp(column.type) and column.type.tz is None:
+        return column.cast(pa.timestamp('us', tz='UTC'), safe=False)
+    return column
+
+
+def to_csv(batch):
+    """A record batch as CSV bytes for COPY, with nested columns as JSON"""
+    columns = [csv_column(column) for column in batch.columns]
+    batch = pa.RecordBatch.from_arrays(columns, names=batch.schema.names)
+
+    out = io.BytesIO()
+    pacsv.write_csv(batch, out, pacsv.WriteOptions(include_header=False))
+    return out.getvalue()
+
+
+class Loader(object):
+    """Loads Parquet tables into Postgres with parallel COPY workers over a connection pool"""
+
+    def __init__(self, dsn, source, schema_name='public', workers=8, batch_rows=100000, indexes=True):
+        self.source = source.rstrip('/')
+        self.schema_name = schema_name
+        self.workers = workers
+        self.batch_rows = batch_rows
+        self.indexes = indexes
+        self.pool = ThreadedConnectionPool(1, workers, dsn)
+
+    def dataset(self, table):
+        """A Parquet table as a pyarrow dataset, partition columns included"""
+        fs, path = pafs.FileSystem.from_uri(self.source + '/' + table)
+        return ds.dataset(path, filesystem=fs, format='parquet', partitioning='hive')
+
+    def exists(self, table):
+        """Whether a Parquet table was written, optional tables like CommitMessages may not be"""
+        fs, path = pafs.FileSystem.from_uri(self.source + '/' + table)
+        return fs.get_file_info(path).type != pafs.FileType.NotFound
+
+    def execute(self, statement):
+        """Run one statement on a pooled connection and commit"""
+        conn = self.pool.getconn()
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute(statement)
+            conn.commit()
+        finally:
+            self.pool.putconn(conn)
+
+    def copy_fragment(self, target, columns, fragment, schema):
+        """COPY one Parquet file into its table in CSV batches, returning (rows, bytes)"""
+        conn = self.pool.getconn()
+        try:
+            with conn.cursor() as cursor:
+                rows, size = copy_batches(cursor, target, columns, fragment, schema, self.batch_rows)
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            self.pool.putconn(conn)
+        return rows, size
+
+    def load(self, parquet_table, table):
+        """Replace one Postgres table with the contents of a Parquet table, returning its load stats"""
+        start = time.time()
+        dataset = self.dataset(parquet_table)
+        schema = dataset.schema
+        target = sql.Identifier(self.schema_name, table)
+
+        # Along with the <table>_wide views on it, which main() creates again
+        self.execute(sql.SQL('DROP TABLE IF EXISTS {} CASCADE').format(target))
+        self.execute(create_table_ddl(self.schema_name, table, schema))
+
+        fragments = list(dataset.get_fragments())
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            results = list(executor.map(
+                lambda fragment: self.copy_fragment(target, schema.names, fragment, schema), fragments
+            ))
+        rows = sum(r for r, _ in results)
+        size = sum(b for _, b in results)
+        loaded = time.time() - start
+
+        # Indexes and statistics after the data is in, then make the table crash safe
+        if self.indexes:
+            for column in INDEX_COLUMNS:
+                if column in schema.names:
+                    self.execute(sql.SQL('CREATE INDEX {} ON {} ({})').format(
+                        sql.Identifier('{}_{}_idx'.format(table, column)), target, sql.Identifier(column)
+                    ))
+        self.execute(sql.SQL('ALTER TABLE {} SET LOGGED').format(target))
+        self.execute(sql.SQL('ANALYZE {}').format(target))
+        total = time.time() - start
+
+        return {
+            'table': table,
+            'files': len(fragments),
+            'rows': rows,
+            'csv_bytes': size,
+            'load_seconds': round(loaded, 2),
+            'total_seconds': round(total, 2),
+            'rows_per_sec': round(rows / loaded) if loaded else None,
+            'mb_per_sec': round(size / loaded / 1e6, 2) if loaded else None,
+        }
+
+    def append(self, files, run_id):
+        """COPY a run's new Parquet files into their tables, in one transaction that only ever commits once per run
+
+        `files` maps each Parquet table to the paths of its new files, relative to the table. Tables missing from
+        Postgres are created. The run is recorded in loaded_runs, so a run replayed after a failure isn't loaded twice.
+        Returns the rows loaded per table, or None if the run was loaded before.
+        """
+        runs = sql.Identifier(self.schema_name, 'loaded_runs')
+        loaded = {}
+        conn = self.pool.getconn()
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute(sql.SQL(
+                    'CREATE TABLE IF NOT EXISTS {} (run_id TEXT PRIMARY KEY, loaded_at TIMESTAMPTZ DEFAULT now())'
+                ).format(runs))
+                cursor.execute(sql.SQL('INSERT INTO {} (run_id) VALUES (%s) ON CONFLICT DO NOTHING').format(runs),
+                               (run_id,))
+                if not cursor.rowcount:
+                    conn.rollback()
+                    return None
+
+                for parquet_table, paths in sorted(files.items()):
+                    if not paths:
+                        continue
+                    table = TABLES[parquet_table]
+                    fs, root = pafs.FileSystem.from_uri(self.source + '/' + parquet_table)
+                    dataset = ds.dataset([root + '/' + p for p in paths], filesystem=fs, format='parquet',
+                                         partitioning='hive', partition_base_dir=root)
+                    target = sql.Identifier(self.schema_name, table)
+                    cursor.execute(create_table_ddl(self.schema_name, table, dataset.schema, appending=True))
+                    for column in INDEX_COLUMNS if self.indexes else []:
+                        if column in dataset.schema.names:
+                            cursor.execute(sql.SQL('CREATE INDEX IF NOT EXISTS {} ON {} ({})').format(
+                                sql.Identifier('{}_{}_idx'.format(table, column)), target, sql.Identifier(column)
+                            ))
+                    loaded[table] = sum(
+                        copy_batches(cursor, target, dataset.schema.names, fragment, dataset.schema,
+                                     self.batch_rows)[0]
+                        for fragment in dataset.get_fragments()
+                    )
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            self.pool.putconn(conn)
+        return loaded
+
+    def create_wide_view(self, parquet_table, table):
+        """Create <table>_wide, joining a normalized table to the dimension tables to restore its wide columns"""
+        name = TABLE_NAMES[parquet_table]
+        names = self.dataset(parquet_table).schema.names
+        if name not in FACT_DIMENSIONS or not attribute_columns(name) - set(names):
+            return None
+
+        joins, sources = [], {}
+        for i, (key, dimension, attributes) in enumerate(FACT_DIMENSIONS[name]):
+            alias = sql.Identifier('d{}'.format(i))
+            joins.append(sql.SQL('LEFT JOIN {} {} ON {}.{} = f.{}').format(
+                sql.Identifier(self.schema_name, TABLES[TABLE_FILES[dimension]]), alias, alias,
+                sql.Identifier(DIMENSION_KEYS[dimension]), sql.Identifier(key)
+            ))
+            for column, dimension_column in attributes.items():
+                sources.setdefault(column, sql.SQL('{}.{}').format(alias, sql.Identifier(dimension_column)))
+
+        # The wide columns in order, then any the Parquet table adds, like partition columns
+        wide = columns(name) + [c for c in names if c not in columns(name)]
+        select = [
+            sql.SQL('f.{}').format(sql.Identifier(c)) if c in names
+            else sql.SQL('{} AS {}').format(sources[c], sql.Identifier(c))
+            for c in wide if c in names or c in sources
+        ]
+        view = table + '_wide'
+        self.execute(sql.SQL('CREATE OR REPLACE VIEW {} AS SELECT {} FROM {} f {}').format(
+            sql.Identifier(self.schema_name, view), sql.SQL(', ').join(select),
+            sql.Identifier(self.schema_name, table), sql.SQL(' ').join(joins)
+        ))
+        return view
+
+    def close(self):
+        self.pool.closeall()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--dsn', default=os.environ.get('DATABASE_URL'), help='libpq connection string or URL')
+    parser.add_argument('--source', default=os.environ.get('GITHUB_OUTPUT_PATH', 's3://github-superset-parquet'),
+                        help='directory holding the Parquet tables')
+    parser.add_argument('--schema', default='public', help='Postgres schema to load into')
+    parser.add_argument('--tables', nargs='*', default=None, choices=sorted(TABLES),
+                        help='Parquet tables to load, all of them written by default')
+    parser.add_argument('--workers', type=int, default=8, help='parallel COPY workers and connections')
+    parser.add_argument('--batch-rows', type=int, default=100000, help='rows per COPY batch')
+    parser.add_argument('--no-indexes', action='store_true', help="don't build indexes after loading")
+    parser.add_argument('--wide-views', action='store_true',
+                        help='create <table>_wide views joining normalized tables to repos, users and orgs, '
+                             'which replacing their tables drops')
+    args = parser.parse_args()
+
+    if not args.dsn:
+        parser.error('--dsn or DATABASE_URL is required')
+
+    loader = Loader(args.dsn, args.source, args.schema, args.workers, args.batch_rows, not args.no_indexes)
+    try:
+        tables = args.tables if args.tables is not None else [t for t in sorted(TABLES) if loader.exists(t)]
+        for parquet_table in tables:
+            stats = loader.load(parquet_table, TABLES[parquet_table])
+            sys.stdout.write(json.dumps(stats, sort_keys=True) + '\n')
+            sys.stdout.flush()
+        # Replacing a dimension table drops the views of every table joined to it, not just those loaded
+        if args.wide_views:
+            for parquet_table in [t for t in sorted(TABLES) if loader.exists(t)]:
+                view = loader.create_wide_view(parquet_table, TABLES[parquet_table])
+                if view:
+                    sys.stdout.write(json.dumps({'view': view}) + '\n')
+    finally:
+        loader.close()
+
+
+if __name__ == '__main__':
+    main()
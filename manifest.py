@@ -0,0 +1,192 @@
+"""A manifest of the gharchive.org hourly files already converted to Parquet, for incremental runs.
+
+An incremental run lists the `YYYY-MM-DD-H.json.gz` input files, skips the ones recorded in the manifest and writes
+the tables for the rest into a partitioned staging directory. Publishing the run then moves the staged files into the
+tables, each renamed with the run id, and records the run's input files in the manifest. A run that dies while
+publishing leaves a pending marker behind, and the next run deletes that run's files from the tables before it
+starts, so the same hours are never appended twice.
+
+Everything goes through the Hadoop FileSystem API, so the manifest works the same on S3, HDFS and local disk.
+"""
+import json
+import re
+import uuid
+from datetime import datetime
+
+# The gharchive.org hourly file names, i.e. 2019-06-01-13.json.gz
+HOURLY_FILE = re.compile(r'(\d{4})-(\d{2})-(\d{2})-(\d{1,2})\.json\.gz$')
+
+
+def hadoop_path(sc, path):
+    """A Hadoop Path and the FileSystem it lives on"""
+    path = sc._jvm.org.apache.hadoop.fs.Path(path)
+    return path.getFileSystem(sc._jsc.hadoopConfiguration()), path
+
+
+def glob_status(sc, pattern):
+    """FileStatuses matching a glob, empty when nothing matches"""
+    fs, path = hadoop_path(sc, pattern)
+    return list(fs.globStatus(path) or [])
+
+
+def list_files(sc, path):
+    """FileStatuses of every file under a directory, recursively, empty when it does not exist"""
+    fs, path = hadoop_path(sc, path)
+    if not fs.exists(path):
+        return []
+
+    statuses = []
+    files = fs.listFiles(path, True)
+    while files.hasNext():
+        statuses.append(files.next())
+    return statuses
+
+
+def has_parquet(sc, path):
+    """Whether a directory holds Parquet files, rather than nothing or just the _SUCCESS of an empty write"""
+    return any(
+        status.getPath().getName().endswith('.parquet') and status.getPath().getParent().getName() != '_index'
+        for status in list_files(sc, path)
+    )
+
+
+def hour_key(path):
+    """Sort key putting hourly files in chronological order, 2019-06-01-2 before 2019-06-01-10"""
+    match = HOURLY_FILE.search(path)
+    return tuple(int(g) for g in match.groups()) if match else (0, 0, 0, 0)
+
+
+def list_hourly_files(sc, pattern):
+    """The hourly files matching an input glob as (path, size) pairs, oldest first"""
+    files = [
+        (status.getPath().toString(), status.getLen())
+        for status in glob_status(sc, pattern)
+        if HOURLY_FILE.search(status.getPath().getName())
+    ]
+    return sorted(files, key=lambda f: hour_key(f[0]))
+
+
+def write_text(sc, path, text):
+    """Write a small text file, replacing it if it exists"""
+    fs, path = hadoop_path(sc, path)
+    out = fs.create(path, True)
+    try:
+        out.write(bytearray(text.encode('utf-8')))
+    finally:
+        out.close()
+
+
+def read_text(sc, path):
+    """Read a small text file"""
+    fs, path = hadoop_path(sc, path)
+    stream = fs.open(path)
+    reader = sc._jvm.java.io.BufferedReader(sc._jvm.java.io.InputStreamReader(stream, 'UTF-8'))
+    try:
+        lines = []
+        line = reader.readLine()
+        while line is not None:
+            lines.append(line)
+            line = reader.readLine()
+        return '\n'.join(lines)
+    finally:
+        reader.close()
+
+
+def delete(sc, path):
+    """Recursively delete a path if it exists"""
+    fs, path = hadoop_path(sc, path)
+    if fs.exists(path):
+        fs.delete(path, True)
+
+
+def exists(sc, path):
+    """Whether a path exists"""
+    fs, path = hadoop_path(sc, path)
+    return fs.exists(path)
+
+
+def replace(sc, staged_path, table_path):
+    """Swap a staged table in for a table that is rebuilt whole each run, rather than appended to"""
+    fs, staged = hadoop_path(sc, staged_path)
+    _, target = hadoop_path(sc, table_path)
+    if fs.exists(target):
+        fs.delete(target, True)
+    fs.mkdirs(target.getParent())
+    if not fs.rename(staged, target):
+        raise IOError('Could not move {} to {}'.format(staged.toString(), target.toString()))
+
+
+def new_run_id():
+    """A sortable, unique id for an incremental run"""
+    return '{}-{}'.format(datetime.utcnow().strftime('%Y%m%d%H%M%S'), uuid.uuid4().hex[:8])
+
+
+class Manifest(object):
+    """The set of input files converted by earlier runs, stored as one JSON file per run under a directory"""
+
+    def __init__(self, sc, path):
+        self.sc = sc
+        self.path = path.rstrip('/')
+
+    def processed(self):
+        """Paths of every input file recorded by a committed run"""
+        files = set()
+        for status in glob_status(self.sc, self.path + '/run-*.json'):
+            run = json.loads(read_text(self.sc, status.getPath().toString()))
+            files.update(run['files'])
+        return files
+
+    def committed(self, run_id):
+        """Whether a run has committed"""
+        return exists(self.sc, '{}/run-{}.json'.format(self.path, run_id))
+
+    def pending_runs(self):
+        """Ids of runs that started publishing but never committed"""
+        return [status.getPath().getName() for status in glob_status(self.sc, self.path + '/_pending/*')]
+
+    def recover(self, table_paths):
+        """Remove the files of interrupted runs from the tables, so their hours can be processed again"""
+        recovered = []
+        for run_id in self.pending_runs():
+            for table_path in table_paths:
+                for status in list_files(self.sc, table_path):
+                    if status.getPath().getName().startswith(run_id + '-'):
+                        delete(self.sc, status.getPath().toString())
+            delete(self.sc, '{}/_pending/{}'.format(self.path, run_id))
+            recovered.append(run_id)
+        return recovered
+
+    def begin(self, run_id, files):
+        """Mark a run as publishing, before any of its files land in the tables"""
+        write_text(self.sc, '{}/_pending/{}'.format(self.path, run_id), json.dumps({'files': files}))
+
+    def commit(self, run_id, files):
+        """Record a run's input files as processed once all its files are in the tables"""
+        record = {'run_id': run_id, 'committed_at': datetime.utcnow().isoformat() + 'Z', 'files': files}
+        write_text(self.sc, '{}/run-{}.json'.format(self.path, run_id), json.dumps(record))
+        delete(self.sc, '{}/_pending/{}'.format(self.path, run_id))
+
+
+def publish(sc, staged_path, table_path, run_id):
+    """Move a staged run's partition files into a table, prefixing their names with the run id
+
+    Returns the paths of the files moved, relative to the table.
+    """
+    fs, staged = hadoop_path(sc, staged_path)
+    staged_prefix = staged.toUri().getPath().rstrip('/') + '/'
+    moved = []
+    for status in list_files(sc, staged_path):
+        source = status.getPath()
+        if not source.getName().startswith('part-'):
+            continue
+
+        # The partition directories between the staged table and the file, i.e. created_date=2019-06-01
+        partition = source.getParent().toUri().getPath()[len(staged_prefix):]
+        name = '{}-{}'.format(run_id, source.getName())
+        relative = '/'.join(p for p in [partition, name] if p)
+        target = sc._jvm.org.apache.hadoop.fs.Path(table_path + '/' + relative)
+        fs.mkdirs(target.getParent())
+        if not fs.rename(source, target):
+            raise IOError('Could not move {} to {}'.format(source.toString(), target.toString()))
+        moved.append(relative)
+    return moved
@@ -0,0 +1,135 @@
+"""Run metrics for the extraction job: record counts, errors, CPU and wall time per stage and bytes written.
+
+Counts and Python CPU seconds are summed from the workers with Spark accumulators: `timed` wraps the functions run on
+each record, counting records in and out and exceptions by type and field. Wall time is measured on the driver around
+each stage, so for stages done in the JVM, like reading and gunzipping the input or writing Parquet, it is the wall time
+less the Python CPU time that is not spent in Python. With `profile` on, a sampling profiler on every Python worker
+counts the stacks it interrupts, written out as collapsed stacks for flamegraph.pl.
+"""
+import atexit
+import os
+import signal
+import time
+from contextlib import contextmanager
+
+from pyspark import AccumulatorParam
+
+# Seconds between profiler samples, of CPU time
+PROFILE_INTERVAL = 0.01
+
+# Frames kept of each sampled stack, innermost last
+PROFILE_DEPTH = 12
+
+
+class CountsParam(AccumulatorParam):
+    """Accumulates a dict of counts keyed by name, i.e. records per event type"""
+
+    def zero(self, value):
+        return {}
+
+    def addInPlace(self, a, b):
+        for k, v in b.items():
+            a[k] = a.get(k, 0) + v
+        return a
+
+
+def error_key(e):
+    """An exception's type and, for missing keys and indexes, what was missing, i.e. KeyError['pull_request']"""
+    if isinstance(e, (KeyError, IndexError)) and e.args:
+        return '{}[{!r}]'.format(type(e).__name__, e.args[0])
+    return type(e).__name__
+
+
+class Sampler(object):
+    """A sampling profiler counting the Python stacks it interrupts every PROFILE_INTERVAL of CPU time"""
+
+    def __init__(self):
+        self.samples = {}
+        signal.signal(signal.SIGPROF, self.sample)
+        signal.setitimer(signal.ITIMER_PROF, PROFILE_INTERVAL, PROFILE_INTERVAL)
+
+        # A SIGPROF arriving once the interpreter is shutting down would kill the process
+        atexit.register(signal.setitimer, signal.ITIMER_PROF, 0)
+
+    def sample(self, signum, frame):
+        stack = []
+        while frame is not None and len(stack) < PROFILE_DEPTH:
+            code = frame.f_code
+            stack.append('{}:{}'.format(os.path.basename(code.co_filename), code.co_name))
+            frame = frame.f_back
+        key = ';'.join(reversed(stack))
+        self.samples[key] = self.samples.get(key, 0) + 1
+
+    def drain(self):
+        samples, self.samples = self.samples, {}
+        return samples
+
+
+# The sampler of this Python worker, started by the first timed function to run with profiling on
+_sampler = None
+
+
+class RunMetrics(object):
+    """Accumulators and timers for one run, reported as a dict by `report`"""
+
+    def __init__(self, sc, profile=False):
+        self.counts = sc.accumulator({}, CountsParam())
+        self.cpu_seconds = sc.accumulator({}, CountsParam())
+        self.samples = sc.accumulator({}, CountsParam())
+        self.profile = profile
+        self.wall_seconds = {}
+        self.bytes_written = {}
+
+    def count(self, name, n=1):
+        self.counts.add({name: n})
+
+    def timed(self, stage, fn, flat=False):
+        """Wrap a function run per record to count its records in and out, its exceptions and its CPU time
+
+        With `flat` the function returns a list of records, as for flatMap.
+        """
+        counts, cpu_seconds, samples, profile = self.counts, self.cpu_seconds, self.samples, self.profile
+
+        def wrapper(record):
+            global _sampler
+            if profile and _sampler is None:
+                _sampler = Sampler()
+
+            start = time.process_time()
+            try:
+                out = fn(record)
+            except Exception as e:
+                counts.add({'{}.errors.{}'.format(stage, error_key(e)): 1})
+                raise
+            finally:
+                cpu_seconds.add({stage: time.process_time() - start})
+                if _sampler is not None and _sampler.samples:
+                    samples.add(_sampler.drain())
+
+            counts.add({stage + '.in': 1, stage + '.out': len(out) if flat else 1})
+            return out
+
+        return wrapper
+
+    @contextmanager
+    def stage(self, name):
+        """Time a stage run from the driver, adding up if it runs more than once"""
+        start = time.time()
+        try:
+            yield
+        finally:
+            self.wall_seconds[name] = self.wall_seconds.get(name, 0) + time.time() - start
+
+    def report(self):
+        counts = self.counts.value
+        return {
+            'records': {k: v for k, v in sorted(counts.items()) if '.errors.' not in k},
+            'errors': {k: v for k, v in sorted(counts.items()) if '.errors.' in k},
+            'cpu_seconds': {k: round(v, 2) for k, v in sorted(self.cpu_seconds.value.items())},
+            'wall_seconds': {k: round(v, 2) for k, v in sorted(self.wall_seconds.items())},
+            'bytes_written': dict(sorted(self.bytes_written.items())),
+        }
+
+    def collapsed_stacks(self):
+        """The profiler's samples in the collapsed stack format flamegraph.pl reads"""
+        return '\n'.join('{} {}'.format(stack, n) for stack, n in sorted(self.samples.value.items()))
@@ -0,0 +1,476 @@
+"""Native Spark extraction of the gharchive.org event tables.
+
+Rather than parsing every event into Python dicts and building Rows, the cached events of each type, see
+event_cache.py, have their payloads parsed with `from_json` against an explicit StructType and are mapped to the
+output columns with SQL column expressions, so the work stays inside the JVM. The output is column-for-column the
+same as the Python extractors in extractors.py, with the types declared in schemas.py.
+"""
+from pyspark.sql.functions import col
+from pyspark.sql.types import (
+    ArrayType, BooleanType, LongType, MapType, StringType, StructField, StructType
+)
+
+from event_cache import read_cached
+from schemas import push_commits_schema, spark_schema
+
+# Both timestamp shapes found in the archive: ISO-8601 for 2015+ events, slashes and an offset before that
+OLD_TIMESTAMP_FORMAT = 'yyyy/MM/dd HH:mm:ss Z'
+
+
+def ts(field):
+    """SQL expression parsing a gharchive timestamp string into a TimestampType, like duparse does"""
+    return "coalesce(to_timestamp({0}), to_timestamp({0}, '{1}'))".format(field, OLD_TIMESTAMP_FORMAT)
+
+
+def license_field(field, key, default='NULL'):
+    """SQL expression for license.key/name, which are only present when the license is a JSON object"""
+    return "coalesce(get_json_object({}, '$.{}'), {})".format(field, key, default)
+
+
+def fields(*names, **types):
+    """StructType of string fields by name, plus other typed fields by keyword"""
+    return StructType(
+        [StructField(name, StringType()) for name in names] +
+        [StructField(name, t) for name, t in sorted(types.items())]
+    )
+
+
+# Objects we keep whole, like issue assignees, come out of the Row path as map<string,string>. Declaring them that
+# way makes the JSON reader hand back every value as a string, nested objects as their JSON text.
+STRING_MAP = MapType(StringType(), StringType())
+STRING_MAPS = ArrayType(STRING_MAP)
+
+USER = fields('login', id=LongType(), site_admin=BooleanType())
+
+# license is a string for its JSON text, see license_field
+REPO = fields(
+    'created_at', 'updated_at', 'pushed_at', 'default_branch', 'description', 'full_name', 'language', 'languages',
+    'license', 'name',
+    id=LongType(),
+    fork=BooleanType(),
+    forks=LongType(),
+    forks_count=LongType(),
+    open_issues=LongType(),
+    owner=USER,
+    private=BooleanType(),
+    size=LongType(),
+    stargazers_count=LongType(),
+    watchers=LongType(),
+    watchers_count=LongType(),
+)
+
+
+def event_schema(payload):
+    """The gharchive.org event envelope around an event type's payload"""
+    return fields(
+        'id', 'type', 'created_at',
+        public=BooleanType(),
+        actor=fields('login', id=LongType()),
+        repo=fields('name', id=LongType()),
+        org=fields('login', id=LongType()),
+        payload=payload
+    )
+
+
+# See https://developer.github.com/v3/activity/events/types/
+EVENT_SCHEMAS = {
+    'CreateEvent': event_schema(fields('ref', 'ref_type')),
+    'DeleteEvent': event_schema(fields('ref', 'ref_type')),
+    'ForkEvent': event_schema(fields(forkee=REPO)),
+    'IssuesEvent': event_schema(fields(
+        'action',
+        issue=fields(
+            'body', 'closed_at', 'title', 'updated_at',
+            assignee=STRING_MAP,
+            assignees=STRING_MAPS,
+            comments=LongType(),
+            id=LongType(),
+            labels=STRING_MAPS,
+            locked=BooleanType(),
+            number=LongType(),
+            user=USER
+        )
+    )),
+    'MemberEvent': event_schema(fields('action', member=USER)),
+    'PushEvent': event_schema(fields(
+        'ref', 'head', 'before',
+        push_id=LongType(),
+        size=LongType(),
+        commits=ArrayType(fields('sha', 'url', 'message', author=fields('name', 'email')))
+    )),
+    'PullRequestEvent': event_schema(fields(
+        'action',
+        number=LongType(),
+        pull_request=fields(
+            'author_association', 'body', 'closed_at', 'created_at', 'merge_commit_sha', 'merged_at', 'state',
+            'title', 'updated_at',
+            additions=LongType(),
+            assignee=STRING_MAP,
+            assignees=STRING_MAPS,
+            base=fields('label', 'ref', 'sha', repo=REPO, user=USER),
+            changed_files=LongType(),
+            comments=LongType(),
+            commits=LongType(),
+            deletions=LongType(),
+            head=fields('label', 'ref', 'sha', repo=REPO, user=USER),
+            id=LongType(),
+            locked=BooleanType(),
+            mergeable=BooleanType(),
+            merged=BooleanType(),
+            merged_by=STRING_MAP,
+            milestone=STRING_MAP,
+            number=LongType(),
+            rebaseable=BooleanType(),
+            requested_reviewers=STRING_MAPS,
+            requested_teams=STRING_MAPS,
+            review_comments=LongType(),
+            user=USER
+        )
+    )),
+    'IssueCommentEvent': event_schema(fields(
+        'action',
+        issue=fields('title', 'state', id=LongType(), number=LongType(), pull_request=STRING_MAP),
+        comment=fields('author_association', 'body', 'created_at', 'updated_at', id=LongType(), user=USER)
+    )),
+    'WatchEvent': event_schema(fields('action')),
+    # Gists before 2012 have their fields in the payload itself, later ones in payload.gist
+    'GistEvent': event_schema(fields(
+        'action', 'desc', 'id', 'url',
+        gist=fields('id', 'html_url', 'description', public=BooleanType())
+    )),
+    # PublicEvent payloads are empty
+    'PublicEvent': event_schema(STRING_MAP),
+}
+
+
+def pull_repo_columns(side, ts, license_field):
+    """Columns describing the base or head repository of a pull request, with the given expression builders"""
+    repo = 'payload.pull_request.{}.repo'.format(side)
+    prefix = side + '_repo_'
+    return [
+        ts(repo + '.created_at') + ' AS {}created_at'.format(prefix),
+        repo + '.default_branch AS {}default_branch'.format(prefix),
+        repo + '.description AS {}description'.format(prefix),
+        repo + '.fork AS {}fork'.format(prefix),
+        repo + '.forks AS {}forks'.format(prefix),
+        repo + '.full_name AS {}full_name'.format(prefix),
+        repo + '.id AS {}id'.format(prefix),
+        repo + '.language AS {}language'.format(prefix),
+        license_field(repo + '.license', 'key') + ' AS {}license_key'.format(prefix),
+        license_field(repo + '.license', 'name') + ' AS {}license_name'.format(prefix),
+        repo + '.name AS {}name'.format(prefix),
+        repo + '.open_issues AS {}open_issues'.format(prefix),
+        repo + '.owner.id AS {}owner_id'.format(prefix),
+        repo + '.owner.login AS {}owner_user_name'.format(prefix),
+        repo + '.owner.site_admin AS {}owner_site_admin'.format(prefix),
+        repo + '.private AS {}private'.format(prefix),
+        ts(repo + '.pushed_at') + ' AS {}pushed_at'.format(prefix),
+        repo + '.size AS {}size'.format(prefix),
+        repo + '.stargazers_count AS {}stargazers_count'.format(prefix),
+        ts(repo + '.updated_at') + ' AS {}updated_at'.format(prefix),
+        repo + '.watchers AS {}watchers'.format(prefix),
+    ]
+
+
+# Each table: the event type it comes from, an optional array to explode into one row per element (available to
+# the expressions as `element`) and a function of the timestamp and license expression builders, like ts() and
+# license_field(), returning its columns as SQL expressions in the order the Python path writes them
+NATIVE_TABLES = {
+    'ForkEvents': ('ForkEvent', None, lambda ts, license_field: [
+        'id',
+        "'ForkEvent' AS type",
+        ts('created_at') + ' AS created_at',
+        'actor.id AS actor_user_id',
+        'actor.login AS actor_user_name',
+        'org.id AS from_org_id',
+        "coalesce(org.login, '') AS from_org_login",
+        'payload.forkee.owner.id AS to_user_id',
+        'payload.forkee.owner.login AS to_user_name',
+        ts('payload.forkee.created_at') + ' AS to_repo_created_at',
+        ts('payload.forkee.updated_at') + ' AS to_repo_updated_at',
+        ts('payload.forkee.pushed_at') + ' AS to_repo_pushed_at',
+        'payload.forkee.size AS to_repo_size',
+        'payload.forkee.stargazers_count AS to_repo_stargazer_count',
+        'payload.forkee.watchers_count AS to_repo_watcher_count',
+        'payload.forkee.forks_count AS to_repo_forks_count',
+        license_field('payload.forkee.license', 'key', "''") + ' AS to_license_key',
+        license_field('payload.forkee.license', 'name', "''") + ' AS to_license_name',
+        'public',
+        'repo.id AS from_repo_id',
+        'repo.name AS from_repo_name',
+    ]),
+    'PushEvents': ('PushEvent', None, lambda ts, license_field: [
+        'id',
+        "'PushEvent' AS type",
+        'actor.id AS actor_id',
+        'actor.login AS actor_user_name',
+        'repo.id AS repo_id',
+        'repo.name AS repo_name',
+        'payload.push_id AS push_id',
+        'payload.size AS push_size',
+        'payload.ref AS push_ref',
+        'payload.head AS push_head',
+        'payload.before AS push_before',
+        ts('created_at') + ' AS created_at',
+        'public',
+    ]),
+    'Commits': ('PushEvent', 'payload.commits', lambda ts, license_field: [
+        'element.sha AS sha',
+        "'Commit' AS type",
+        'payload.push_id AS push_id',
+        'actor.id AS actor_id',
+        'repo.id AS repo_id',
+        'repo.name AS repo_name',
+        'actor.login AS actor_user_name',
+        'element.author.name AS author_name',
+        'element.url AS url',
+        'element.message AS message',
+        ts('created_at') + ' AS push_created_at',
+        'public',
+    ]),
+    'Creates': ('CreateEvent', None, lambda ts, license_field: [
+        'id',
+        "'CreateEvent' AS type",
+        ts('created_at') + ' AS created_at',
+        'actor.id AS actor_id',
+        'actor.login AS actor_user_name',
+        'repo.id AS repo_id',
+        'repo.name AS repo_name',
+        'public',
+    ]),
+    'Deletes': ('DeleteEvent', None, lambda ts, license_field: [
+        'id',
+        "'DeleteEvent' AS type",
+        ts('created_at') + ' AS created_at',
+        'actor.id AS actor_id',
+        'actor.login AS actor_user_name',
+        'repo.id AS repo_id',
+        'repo.name AS repo_name',
+        'org.id AS org_id',
+        "coalesce(org.login, '') AS org_name",
+        'public',
+    ]),
+    'Issues': ('IssuesEvent', None, lambda ts, license_field: [
+        'id',
+        "'IssuesEvent' AS type",
+        ts('created_at') + ' AS created_at',
+        'payload.issue.updated_at AS updated_at',
+        ts('payload.issue.closed_at') + ' AS closed_at',
+        'actor.id AS actor_id',
+        'actor.login AS actor_user_name',
+        'repo.id AS repo_id',
+        'repo.name AS repo_name',
+        'payload.issue.user.id AS user_id',
+        'payload.issue.user.login AS user_name',
+        'payload.action AS action',
+        'payload.issue.assignee AS assignee',
+        'payload.issue.assignees AS assignees',
+        'payload.issue.title AS title',
+        'payload.issue.body AS body',
+        'payload.issue.comments AS comments',
+        'payload.issue.id AS issue_id',
+        'payload.issue.labels AS labels',
+        'payload.issue.locked AS locked',
+        'payload.issue.number AS number',
+        'public',
+    ]),
+    'Members': ('MemberEvent', None, lambda ts, license_field: [
+        'id',
+        "'MemberEvent' AS type",
+        ts('created_at') + ' AS created_at',
+        'actor.id AS actor_id',
+        'actor.login AS actor_user_name',
+        'payload.action AS action',
+        'payload.member.id AS member_id',
+        'payload.member.login AS member_name',
+        'payload.member.site_admin AS site_admin',
+        'repo.id AS repo_id',
+        'repo.name AS repo_name',
+        'public',
+    ]),
+    # PullRequests keeps the sorted column order it got when its schema was inferred from Rows
+    'PullRequests': ('PullRequestEvent', None, lambda ts, license_field: sorted([
+        'payload.pull_request.id AS id',
+        "'PullRequestEvent' AS type",
+        ts('payload.pull_request.created_at') + ' AS created_at',
+        'public',
+        'actor.id AS actor_id',
+        'actor.login AS actor_user_name',
+        'org.id AS org_id',
+        'org.login AS org_name',
+        'payload.action AS action',
+        'payload.pull_request.number AS number',
+        'payload.pull_request.additions AS additions',
+        'payload.pull_request.assignee AS assignee',
+        'payload.pull_request.assignees AS assignees',
+        'payload.pull_request.author_association AS author_association',
+        'payload.pull_request.base.label AS base_label',
+        'payload.pull_request.base.ref AS base_ref',
+        'payload.pull_request.base.sha AS base_sha',
+        'payload.pull_request.base.user.id AS base_user_id',
+        'payload.pull_request.base.user.login AS base_user_user_name',
+        'payload.pull_request.base.user.site_admin AS base_user_site_admin',
+        'payload.pull_request.body AS body',
+        'payload.pull_request.changed_files AS changed_files',
+        ts('payload.pull_request.closed_at') + ' AS closed_at',
+        'payload.pull_request.comments AS comments',
+        'payload.pull_request.commits AS commits',
+        'payload.pull_request.deletions AS deletions',
+        'payload.pull_request.head.label AS head_label',
+        'payload.pull_request.head.ref AS head_ref',
+        "coalesce(payload.pull_request.head.repo.languages, '') AS head_repo_languages",
+        'payload.pull_request.head.sha AS head_sha',
+        'payload.pull_request.head.user.id AS head_user_id',
+        'payload.pull_request.head.user.login AS head_user_name',
+        'payload.pull_request.head.user.site_admin AS head_user_site_admin',
+        'payload.pull_request.locked AS locked',
+        'payload.pull_request.merge_commit_sha AS merge_commit_sha',
+        'payload.pull_request.mergeable AS mergeable',
+        'payload.pull_request.merged AS merged',
+        ts('payload.pull_request.merged_at') + ' AS merged_at',
+        'payload.pull_request.merged_by AS merged_by',
+        'payload.pull_request.milestone AS milestone',
+        'payload.pull_request.rebaseable AS rebaseable',
+        'payload.pull_request.requested_reviewers AS requested_reviewers',
+        'payload.pull_request.requested_teams AS requested_teams',
+        'payload.pull_request.review_comments AS review_comments',
+        'payload.pull_request.state AS state',
+        'payload.pull_request.title AS title',
+        ts('payload.pull_request.updated_at') + ' AS updated_at',
+        'payload.pull_request.user.id AS user_id',
+        'payload.pull_request.user.login AS user_name',
+        'payload.pull_request.user.site_admin AS user_site_admin',
+        'repo.id AS repo_id',
+        'repo.name AS repo_name',
+    ] + pull_repo_columns('base', ts, license_field) + pull_repo_columns('head', ts, license_field),
+        key=lambda e: e.rsplit(' AS ', 1)[-1])),
+    'IssueComments': ('IssueCommentEvent', None, lambda ts, license_field: [
+        'id',
+        "'IssueCommentEvent' AS type",
+        ts('created_at') + ' AS created_at',
+        'actor.id AS actor_id',
+        'actor.login AS actor_user_name',
+        'repo.id AS repo_id',
+        'repo.name AS repo_name',
+        'org.id AS org_id',
+        'payload.action AS action',
+        'payload.issue.id AS issue_id',
+        'payload.issue.number AS issue_number',
+        'payload.issue.title AS issue_title',
+        'payload.issue.state AS issue_state',
+        'payload.issue.pull_request IS NOT NULL AS is_pull_request',
+        'payload.comment.id AS comment_id',
+        'payload.comment.user.id AS comment_user_id',
+        'payload.comment.user.login AS comment_user_name',
+        'payload.comment.author_association AS author_association',
+        'payload.comment.body AS body',
+        ts('payload.comment.created_at') + ' AS comment_created_at',
+        ts('payload.comment.updated_at') + ' AS comment_updated_at',
+        'public',
+    ]),
+    'Stars': ('WatchEvent', None, lambda ts, license_field: [
+        'id',
+        "'WatchEvent' AS type",
+        ts('created_at') + ' AS created_at',
+        'actor.id AS actor_id',
+        'actor.login AS actor_user_name',
+        'repo.id AS repo_id',
+        'repo.name AS repo_name',
+        'org.id AS org_id',
+        'payload.action AS action',
+        'public',
+    ]),
+    'Gists': ('GistEvent', None, lambda ts, license_field: [
+        'id',
+        "'GistEvent' AS type",
+        ts('created_at') + ' AS created_at',
+        'actor.id AS actor_id',
+        'actor.login AS actor_user_name',
+        'payload.action AS action',
+        'coalesce(payload.gist.id, payload.id) AS gist_id',
+        'coalesce(payload.gist.html_url, payload.url) AS gist_url',
+        'coalesce(payload.gist.description, payload.desc) AS description',
+        'payload.gist.public AS gist_public',
+        'public',
+    ]),
+    'PublicEvents': ('PublicEvent', None, lambda ts, license_field: [
+        'id',
+        "'PublicEvent' AS type",
+        ts('created_at') + ' AS created_at',
+        'actor.id AS actor_id',
+        'actor.login AS actor_user_name',
+        'repo.id AS repo_id',
+        'repo.name AS repo_name',
+        'org.id AS org_id',
+        'org.login AS org_name',
+        'public',
+    ]),
+}
+
+# The tables only ever extracted natively: IssueCommentEvent and WatchEvent are among the busiest event types, and
+# Python extractors for them would take as long as all the others together
+NATIVE_ONLY_TABLES = ['IssueComments', 'Stars', 'Gists', 'PublicEvents']
+
+
+def read_events(spark, events_path, event_type):
+    """Read the cached events of one type with their payloads against the declared schema, with no inference pass"""
+    return read_cached(spark, events_path, event_type, EVENT_SCHEMAS[event_type]['payload'].dataType)
+
+
+def table_columns(spark, table, vectorized):
+    """A table's column expressions, with vectorized_extract's UDFs for timestamps and licenses if `vectorized`"""
+    columns = NATIVE_TABLES[table][2]
+    if not vectorized:
+        return columns(ts, license_field)
+
+    import vectorized_extract
+    vectorized_extract.register(spark)
+    return columns(vectorized_extract.ts, vectorized_extract.license_field)
+
+
+def extract_table(spark, events_path, table, vectorized=False):
+    """Extract one output table from the cached events of its type with native column expressions"""
+
+    event_type, explode, _ = NATIVE_TABLES[table]
+    columns = table_columns(spark, table, vectorized)
+    events = read_events(spark, events_path, event_type)
+    if explode:
+        events = events.selectExpr('*', 'explode({}) AS element'.format(explode))
+    return events.selectExpr(*columns).select([col(f.name).cast(f.dataType) for f in spark_schema(table)])
+
+
+# Each push's commits as PUSH_COMMIT_FIELDS structs, see schemas.py
+PUSH_COMMITS = (
+    "transform(payload.commits, c -> named_struct('sha', c.sha, 'author_name', c.author.name, 'url', c.url, "
+    "'message', c.message)) AS commits"
+)
+
+# Commits from the exploded `commit` of a push, the rest of each row comes from the push
+COMMIT_COLUMNS = [
+    'commit.sha AS sha',
+    "'Commit' AS type",
+    'push_id',
+    'actor_id',
+    'repo_id',
+    'repo_name',
+    'actor_user_name',
+    'commit.author_name AS author_name',
+    'commit.url AS url',
+    'commit.message AS message',
+    'created_at AS push_created_at',
+    'public',
+]
+
+
+def extract_push_commits(spark, events_path, vectorized=False):
+    """PushEvents with their commits nested, as in schemas.push_commits_schema, from one read of the cached pushes"""
+
+    columns = table_columns(spark, 'PushEvents', vectorized)
+    events = read_events(spark, events_path, 'PushEvent')
+    return events.selectExpr(*(columns + [PUSH_COMMITS])) \
+        .select([col(f.name).cast(f.dataType) for f in push_commits_schema()])
+
+
+def explode_commits(pushes):
+    """The Commits table from PushEvents with their commits nested, one row per commit"""
+    return pushes.selectExpr('*', 'explode(commits) AS commit').selectExpr(*COMMIT_COLUMNS)
@@ -0,0 +1,66 @@
+"""A repository allowlist applied before events are parsed, i.e. to keep just the Apache projects.
+
+The allowlist is a list of `owner/name` patterns, like `apache/*` or `apache/superset`, and/or explicit repository
+ids. It is checked twice: first on the raw line with a cheap substring test that can only rule events out, so most
+lines are dropped without running `json.loads`, and then on the parsed event's `repo.name`, `org.login` and `repo.id`,
+or the `repository` object's `owner/name`, `organization` and `id` in events from 2011-2014.
+"""
+import os
+from fnmatch import fnmatchcase
+
+
+class RepoAllowlist(object):
+    """Repository name patterns and ids whose events are kept, everything else is dropped"""
+
+    def __init__(self, patterns=(), repo_ids=()):
+        self.patterns = [p.lower() for p in patterns]
+        self.repo_ids = set(int(i) for i in repo_ids)
+
+        # An owner pattern like apache/* also keeps events whose org is apache
+        self.orgs = set(p.split('/', 1)[0] for p in self.patterns if p.endswith('/*') and '*' not in p[:-2])
+
+        # Lowercase substrings at least one of which any kept line must contain
+        self.needles = [p.split('*', 1)[0] for p in self.patterns] + [str(i) for i in self.repo_ids]
+        if any(not needle for needle in self.needles):
+            self.needles = []
+
+    @classmethod
+    def from_environ(cls):
+        """An allowlist from GITHUB_REPO_ALLOWLIST patterns and GITHUB_REPO_IDS, both comma separated"""
+        split = lambda v: [x.strip() for x in v.split(',') if x.strip()]
+        return cls(
+            patterns=split(os.environ.get('GITHUB_REPO_ALLOWLIST', '')),
+            repo_ids=split(os.environ.get('GITHUB_REPO_IDS', ''))
+        )
+
+    @property
+    def enabled(self):
+        return bool(self.patterns or self.repo_ids)
+
+    def line_may_match(self, line):
+        """Cheap check on a raw JSON line: False means the event certainly isn't allowed"""
+        if not self.needles:
+            return True
+        line = line.lower()
+        return any(needle in line for needle in self.needles)
+
+    def record_matches(self, record):
+        """Whether a parsed gharchive.org event belongs to an allowed repository or org"""
+        repo = record['repo'] if 'repo' in record and isinstance(record['repo'], dict) else {}
+        name = repo['name'] if isinstance(repo.get('name'), str) else ''
+        org = record['org'] if 'org' in record and isinstance(record['org'], dict) else {}
+        login = org['login'] if isinstance(org.get('login'), str) else ''
+
+        # 2011-2014 events have a repository object with its owner and organization instead
+        repository = record['repository'] if 'repository' in record and isinstance(record['repository'], dict) else {}
+        if not repo and repository:
+            repo = repository
+            if isinstance(repository.get('owner'), str) and isinstance(repository.get('name'), str):
+                name = repository['owner'] + '/' + repository['name']
+            login = login or (repository['organization'] if isinstance(repository.get('organization'), str) else '')
+
+        if 'id' in repo and repo['id'] in self.repo_ids:
+            return True
+        if name and any(fnmatchcase(name.lower(), pattern) for pattern in self.patterns):
+            return True
+        return login.lower() in self.orgs
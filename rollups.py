@@ -0,0 +1,119 @@
+"""Daily and monthly rollups of the event tables per repository, for Superset dashboards.
+
+RepoDaily and RepoMonthly hold, for each repo_id and day or month: the count of each kind of event, the distinct
+actors, pull requests opened, closed and merged with the lines merged and percentiles of the hours from opening to
+merging, and issues opened, closed and reopened. Their columns are declared in schemas.py. Incremental runs recompute
+only the months their hours fall in, reading just those partitions of the event tables where they can, and overwrite
+those months' partitions of the rollups.
+"""
+from schemas import TABLE_SCHEMAS, spark_schema
+
+# Each table rolled up: the SQL expression for when an event happened, the repository and actor columns, the count
+# column its events add to and whether the table is partitioned on the date of that expression
+ROLLUP_SOURCES = {
+    'PushEvents': ('created_at', 'repo_id', 'actor_id', 'pushes', True),
+    'Commits': ('push_created_at', 'repo_id', 'actor_id', 'commits', True),
+    'Creates': ('created_at', 'repo_id', 'actor_id', 'creates', True),
+    'Deletes': ('created_at', 'repo_id', 'actor_id', 'deletes', True),
+    'ForkEvents': ('created_at', 'from_repo_id', 'actor_user_id', 'forks', True),
+    'Issues': ('created_at', 'repo_id', 'actor_id', 'issue_events', True),
+    'Members': ('created_at', 'repo_id', 'actor_id', 'member_events', True),
+    # A pull request's created_at is when it was opened, its latest event shows in updated_at
+    'PullRequests': ('coalesce(updated_at, created_at)', 'repo_id', 'actor_id', 'pull_request_events', False),
+}
+
+# The rollup tables and the period column each is keyed and partitioned by
+ROLLUP_TABLES = [('RepoDaily', 'date'), ('RepoMonthly', 'month')]
+
+
+def period_of(at, period):
+    """SQL expression for the day or month, as the date of its first day, an event time expression falls in"""
+    return 'to_date({})'.format(at) if period == 'date' else "trunc({}, 'MM')".format(at)
+
+
+def in_months(df, table, months):
+    """The rows of a table with events in any of `months`, given as 'YYYY-MM'"""
+    from pyspark.sql.functions import col, date_format, expr, format_string
+
+    at, _, _, _, partitioned = ROLLUP_SOURCES[table]
+    df = df.where(date_format(expr(at), 'yyyy-MM').isin(months))
+
+    # The same condition on the partition columns, so only those months' partitions are read
+    if partitioned and 'created_date' in df.columns:
+        df = df.where(date_format(col('created_date'), 'yyyy-MM').isin(months))
+    elif partitioned and 'created_month' in df.columns:
+        df = df.where(format_string('%04d-%02d', col('created_year'), col('created_month')).isin(months))
+    return df
+
+
+def event_counts(tables, period):
+    """Events of each kind and distinct actors per repository and period"""
+    from pyspark.sql.functions import col, countDistinct, expr, lit, sum as sum_, when
+
+    events = None
+    for table, (at, repo, actor, count_column, _) in sorted(ROLLUP_SOURCES.items()):
+        if table not in tables:
+            continue
+        selected = tables[table].select(
+            col(repo).alias('repo_id'), expr(period_of(at, period)).alias(period), col(actor).alias('actor_id'),
+            lit(count_column).alias('kind')
+        )
+        events = selected if events is None else events.union(selected)
+
+    return events.where(col('repo_id').isNotNull()).groupBy('repo_id', period).agg(*(
+        [sum_(when(col('kind') == c, 1).otherwise(0)).alias(c) for _, _, _, c, _ in ROLLUP_SOURCES.values()] +
+        [countDistinct('actor_id').alias('distinct_actors')]
+    ))
+
+
+def pull_request_stats(pull_requests, period):
+    """Pull requests opened, closed and merged per repository and period, with merged lines and hours to merge"""
+    from pyspark.sql.functions import col, expr, sum as sum_, unix_timestamp, when
+
+    at = ROLLUP_SOURCES['PullRequests'][0]
+    closed = col('action') == 'closed'
+    merged = closed & col('merged')
+    return pull_requests \
+        .withColumn(period, expr(period_of(at, period))) \
+        .withColumn('merge_hours', when(merged, (unix_timestamp('merged_at') - unix_timestamp('created_at')) / 3600.0)) \
+        .groupBy('repo_id', period).agg(
+            sum_(when(col('action') == 'opened', 1).otherwise(0)).alias('prs_opened'),
+            sum_(when(closed, 1).otherwise(0)).alias('prs_closed'),
+            sum_(when(merged, 1).otherwise(0)).alias('prs_merged'),
+            sum_(when(merged, col('additions'))).alias('merged_additions'),
+            sum_(when(merged, col('deletions'))).alias('merged_deletions'),
+            expr('percentile_approx(merge_hours, 0.5)').alias('merge_hours_p50'),
+            expr('percentile_approx(merge_hours, 0.9)').alias('merge_hours_p90'),
+        )
+
+
+def issue_stats(issues, period):
+    """Issues opened, closed and reopened per repository and period"""
+    from pyspark.sql.functions import col, expr, sum as sum_, when
+
+    at = ROLLUP_SOURCES['Issues'][0]
+    return issues.withColumn(period, expr(period_of(at, period))).groupBy('repo_id', period).agg(*[
+        sum_(when(col('action') == action, 1).otherwise(0)).alias('issues_' + action)
+        for action in ['opened', 'closed', 'reopened']
+    ])
+
+
+def rollup(tables, table):
+    """A rollup table from the event tables, given as DataFrames by name"""
+    from pyspark.sql.functions import coalesce, col, lit
+
+    period = dict(ROLLUP_TABLES)[table]
+    df = event_counts(tables, period)
+    if 'PullRequests' in tables:
+        df = df.join(pull_request_stats(tables['PullRequests'], period), ['repo_id', period], 'left')
+    if 'Issues' in tables:
+        df = df.join(issue_stats(tables['Issues'], period), ['repo_id', period], 'left')
+
+    # Counts are zero where a repository had none of a table's events, percentiles stay null
+    columns = []
+    for field in spark_schema(table):
+        value = col(field.name) if field.name in df.columns else lit(None)
+        if dict(TABLE_SCHEMAS[table])[field.name] == 'long' and field.name != 'repo_id':
+            value = coalesce(value, lit(0))
+        columns.append(value.cast(field.dataType).alias(field.name))
+    return df.select(columns)
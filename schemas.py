@@ -0,0 +1,576 @@
+"""The columns and types of every output table.
+
+Types are Spark SQL type strings. Every writer builds its tables from these schemas rather than inferring them from the
+data: the Spark job gets StructTypes from spark_schema and the single-node engine in build_parquet_tables.local.py gets
+pyarrow schemas from arrow_schema, so both write the same tables. coerce_row fits an extractor's row dict to a schema
+and violations reports the values that don't fit.
+"""
+import json
+from datetime import datetime
+
+# The directory each table is written to under the output path
+TABLE_FILES = {
+    'Creates': 'Creates.parquet',
+    'Deletes': 'Deletes.parquet',
+    'ForkEvents': 'ForkEvents.parquet',
+    'PushEvents': 'PushEvents.Parquet',
+    'Commits': 'Commits.parquet',
+    'CommitMessages': 'CommitMessages.parquet',
+    'Issues': 'Issues.parquet',
+    'IssueTexts': 'IssueTexts.parquet',
+    'Members': 'Members.parquet',
+    'PullRequests': 'PullRequests.parquet',
+    'PullRequestTexts': 'PullRequestTexts.parquet',
+    'IssueComments': 'IssueComments.parquet',
+    'IssueCommentTexts': 'IssueCommentTexts.parquet',
+    'Stars': 'Stars.parquet',
+    'Gists': 'Gists.parquet',
+    'PublicEvents': 'PublicEvents.parquet',
+    'Repos': 'Repos.parquet',
+    'Users': 'Users.parquet',
+    'Orgs': 'Orgs.parquet',
+    'RepoDaily': 'RepoDaily.parquet',
+    'RepoMonthly': 'RepoMonthly.parquet',
+    'DeadLetters': 'DeadLetters.parquet',
+}
+
+# Objects kept whole, like issue assignees, are maps of their fields' JSON text
+STRING_MAP = 'map<string,string>'
+STRING_MAPS = 'array<map<string,string>>'
+
+
+def repo_columns(prefix, languages=False):
+    """The columns describing a pull request's base or head repository"""
+    columns = [
+        (prefix + 'created_at', 'timestamp'),
+        (prefix + 'default_branch', 'string'),
+        (prefix + 'description', 'string'),
+        (prefix + 'fork', 'boolean'),
+        (prefix + 'forks', 'long'),
+        (prefix + 'full_name', 'string'),
+        (prefix + 'id', 'long'),
+        (prefix + 'language', 'string'),
+        (prefix + 'license_key', 'string'),
+        (prefix + 'license_name', 'string'),
+        (prefix + 'name', 'string'),
+        (prefix + 'open_issues', 'long'),
+        (prefix + 'owner_id', 'long'),
+        (prefix + 'owner_user_name', 'string'),
+        (prefix + 'owner_site_admin', 'boolean'),
+        (prefix + 'private', 'boolean'),
+        (prefix + 'pushed_at', 'timestamp'),
+        (prefix + 'size', 'long'),
+        (prefix + 'stargazers_count', 'long'),
+        (prefix + 'updated_at', 'timestamp'),
+        (prefix + 'watchers', 'long'),
+    ]
+    if languages:
+        columns.append((prefix + 'languages', 'string'))
+    return columns
+
+
+def rollup_columns(period):
+    """The columns of the per repository rollups, for a period column of `date` or `month`"""
+    return [
+        ('repo_id', 'long'),
+        (period, 'date'),
+        ('pushes', 'long'),
+        ('commits', 'long'),
+        ('creates', 'long'),
+        ('deletes', 'long'),
+        ('forks', 'long'),
+        ('issue_events', 'long'),
+        ('member_events', 'long'),
+        ('pull_request_events', 'long'),
+        ('distinct_actors', 'long'),
+        ('prs_opened', 'long'),
+        ('prs_closed', 'long'),
+        ('prs_merged', 'long'),
+        ('merged_additions', 'long'),
+        ('merged_deletions', 'long'),
+        ('merge_hours_p50', 'double'),
+        ('merge_hours_p90', 'double'),
+        ('issues_opened', 'long'),
+        ('issues_closed', 'long'),
+        ('issues_reopened', 'long'),
+    ]
+
+
+# Columns in the order each table is written
+TABLE_SCHEMAS = {
+    'ForkEvents': [
+        ('id', 'string'),
+        ('type', 'string'),
+        ('created_at', 'timestamp'),
+        ('actor_user_id', 'long'),
+        ('actor_user_name', 'string'),
+        ('from_org_id', 'long'),
+        ('from_org_login', 'string'),
+        ('to_user_id', 'long'),
+        ('to_user_name', 'string'),
+        ('to_repo_created_at', 'timestamp'),
+        ('to_repo_updated_at', 'timestamp'),
+        ('to_repo_pushed_at', 'timestamp'),
+        ('to_repo_size', 'long'),
+        ('to_repo_stargazer_count', 'long'),
+        ('to_repo_watcher_count', 'long'),
+        ('to_repo_forks_count', 'long'),
+        ('to_license_key', 'string'),
+        ('to_license_name', 'string'),
+        ('public', 'boolean'),
+        ('from_repo_id', 'long'),
+        ('from_repo_name', 'string'),
+    ],
+    'PushEvents': [
+        ('id', 'string'),
+        ('type', 'string'),
+        ('actor_id', 'long'),
+        ('actor_user_name', 'string'),
+        ('repo_id', 'long'),
+        ('repo_name', 'string'),
+        ('push_id', 'long'),
+        ('push_size', 'long'),
+        ('push_ref', 'string'),
+        ('push_head', 'string'),
+        ('push_before', 'string'),
+        ('created_at', 'timestamp'),
+        ('public', 'boolean'),
+    ],
+    'Commits': [
+        ('sha', 'string'),
+        ('type', 'string'),
+        ('push_id', 'long'),
+        ('actor_id', 'long'),
+        ('repo_id', 'long'),
+        ('repo_name', 'string'),
+        ('actor_user_name', 'string'),
+        ('author_name', 'string'),
+        ('url', 'string'),
+        ('message', 'string'),
+        ('push_created_at', 'timestamp'),
+        ('public', 'boolean'),
+    ],
+    # Whole commit messages, issue and pull request bodies and repository descriptions, when the main tables keep only
+    # a prefix of them or none, see column_profiles.py
+    'CommitMessages': [
+        ('sha', 'string'),
+        ('push_id', 'long'),
+        ('repo_id', 'long'),
+        ('message', 'string'),
+        ('push_created_at', 'timestamp'),
+    ],
+    'IssueTexts': [
+        ('id', 'string'),
+        ('created_at', 'timestamp'),
+        ('repo_id', 'long'),
+        ('body', 'string'),
+    ],
+    'IssueCommentTexts': [
+        ('id', 'string'),
+        ('comment_id', 'long'),
+        ('created_at', 'timestamp'),
+        ('repo_id', 'long'),
+        ('body', 'string'),
+    ],
+    'PullRequestTexts': [
+        ('id', 'long'),
+        ('action', 'string'),
+        ('updated_at', 'timestamp'),
+        ('created_at', 'timestamp'),
+        ('repo_id', 'long'),
+        ('body', 'string'),
+        ('base_repo_description', 'string'),
+        ('head_repo_description', 'string'),
+    ],
+    'Creates': [
+        ('id', 'string'),
+        ('type', 'string'),
+        ('created_at', 'timestamp'),
+        ('actor_id', 'long'),
+        ('actor_user_name', 'string'),
+        ('repo_id', 'long'),
+        ('repo_name', 'string'),
+        ('public', 'boolean'),
+    ],
+    'Deletes': [
+        ('id', 'string'),
+        ('type', 'string'),
+        ('created_at', 'timestamp'),
+        ('actor_id', 'long'),
+        ('actor_user_name', 'string'),
+        ('repo_id', 'long'),
+        ('repo_name', 'string'),
+        ('org_id', 'long'),
+        ('org_name', 'string'),
+        ('public', 'boolean'),
+    ],
+    'Issues': [
+        ('id', 'string'),
+        ('type', 'string'),
+        ('created_at', 'timestamp'),
+        ('updated_at', 'string'),
+        ('closed_at', 'timestamp'),
+        ('actor_id', 'long'),
+        ('actor_user_name', 'string'),
+        ('repo_id', 'long'),
+        ('repo_name', 'string'),
+        ('user_id', 'long'),
+        ('user_name', 'string'),
+        ('action', 'string'),
+        ('assignee', STRING_MAP),
+        ('assignees', STRING_MAPS),
+        ('title', 'string'),
+        ('body', 'string'),
+        ('comments', 'long'),
+        ('issue_id', 'long'),
+        ('labels', STRING_MAPS),
+        ('locked', 'boolean'),
+        ('number', 'long'),
+        ('public', 'boolean'),
+    ],
+    'Members': [
+        ('id', 'string'),
+        ('type', 'string'),
+        ('created_at', 'timestamp'),
+        ('actor_id', 'long'),
+        ('actor_user_name', 'string'),
+        ('action', 'string'),
+        ('member_id', 'long'),
+        ('member_name', 'string'),
+        ('site_admin', 'boolean'),
+        ('repo_id', 'long'),
+        ('repo_name', 'string'),
+        ('public', 'boolean'),
+    ],
+    'IssueComments': [
+        ('id', 'string'),
+        ('type', 'string'),
+        ('created_at', 'timestamp'),
+        ('actor_id', 'long'),
+        ('actor_user_name', 'string'),
+        ('repo_id', 'long'),
+        ('repo_name', 'string'),
+        ('org_id', 'long'),
+        ('action', 'string'),
+        ('issue_id', 'long'),
+        ('issue_number', 'long'),
+        ('issue_title', 'string'),
+        ('issue_state', 'string'),
+        ('is_pull_request', 'boolean'),
+        ('comment_id', 'long'),
+        ('comment_user_id', 'long'),
+        ('comment_user_name', 'string'),
+        ('author_association', 'string'),
+        ('body', 'string'),
+        ('comment_created_at', 'timestamp'),
+        ('comment_updated_at', 'timestamp'),
+        ('public', 'boolean'),
+    ],
+    # From WatchEvents, which are starring a repository
+    'Stars': [
+        ('id', 'string'),
+        ('type', 'string'),
+        ('created_at', 'timestamp'),
+        ('actor_id', 'long'),
+        ('actor_user_name', 'string'),
+        ('repo_id', 'long'),
+        ('repo_name', 'string'),
+        ('org_id', 'long'),
+        ('action', 'string'),
+        ('public', 'boolean'),
+    ],
+    'Gists': [
+        ('id', 'string'),
+        ('type', 'string'),
+        ('created_at', 'timestamp'),
+        ('actor_id', 'long'),
+        ('actor_user_name', 'string'),
+        ('action', 'string'),
+        ('gist_id', 'string'),
+        ('gist_url', 'string'),
+        ('description', 'string'),
+        ('gist_public', 'boolean'),
+        ('public', 'boolean'),
+    ],
+    # Repositories made public
+    'PublicEvents': [
+        ('id', 'string'),
+        ('type', 'string'),
+        ('created_at', 'timestamp'),
+        ('actor_id', 'long'),
+        ('actor_user_name', 'string'),
+        ('repo_id', 'long'),
+        ('repo_name', 'string'),
+        ('org_id', 'long'),
+        ('org_name', 'string'),
+        ('public', 'boolean'),
+    ],
+    # PullRequests keeps the sorted column order it got when its schema was inferred from Rows
+    'PullRequests': sorted([
+        ('id', 'long'),
+        ('type', 'string'),
+        ('created_at', 'timestamp'),
+        ('public', 'boolean'),
+        ('actor_id', 'long'),
+        ('actor_user_name', 'string'),
+        ('org_id', 'long'),
+        ('org_name', 'string'),
+        ('action', 'string'),
+        ('number', 'long'),
+        ('additions', 'long'),
+        ('assignee', STRING_MAP),
+        ('assignees', STRING_MAPS),
+        ('author_association', 'string'),
+        ('base_label', 'string'),
+        ('base_ref', 'string'),
+        ('base_sha', 'string'),
+        ('base_user_id', 'long'),
+        ('base_user_user_name', 'string'),
+        ('base_user_site_admin', 'boolean'),
+        ('body', 'string'),
+        ('changed_files', 'long'),
+        ('closed_at', 'timestamp'),
+        ('comments', 'long'),
+        ('commits', 'long'),
+        ('deletions', 'long'),
+        ('head_label', 'string'),
+        ('head_ref', 'string'),
+        ('head_sha', 'string'),
+        ('head_user_id', 'long'),
+        ('head_user_name', 'string'),
+        ('head_user_site_admin', 'boolean'),
+        ('locked', 'boolean'),
+        ('merge_commit_sha', 'string'),
+        ('mergeable', 'boolean'),
+        ('merged', 'boolean'),
+        ('merged_at', 'timestamp'),
+        ('merged_by', STRING_MAP),
+        ('milestone', STRING_MAP),
+        ('rebaseable', 'boolean'),
+        ('requested_reviewers', STRING_MAPS),
+        ('requested_teams', STRING_MAPS),
+        ('review_comments', 'long'),
+        ('state', 'string'),
+        ('title', 'string'),
+        ('updated_at', 'timestamp'),
+        ('user_id', 'long'),
+        ('user_name', 'string'),
+        ('user_site_admin', 'boolean'),
+        ('repo_id', 'long'),
+        ('repo_name', 'string'),
+    ] + repo_columns('base_repo_') + repo_columns('head_repo_', languages=True)),
+    # The dimension tables, see dimensions.py
+    'Repos': [
+        ('repo_id', 'long'),
+        ('name', 'string'),
+        ('short_name', 'string'),
+        ('owner_id', 'long'),
+        ('owner_user_name', 'string'),
+        ('owner_site_admin', 'boolean'),
+        ('description', 'string'),
+        ('language', 'string'),
+        ('languages', 'string'),
+        ('default_branch', 'string'),
+        ('fork', 'boolean'),
+        ('private', 'boolean'),
+        ('license_key', 'string'),
+        ('license_name', 'string'),
+        ('created_at', 'timestamp'),
+        ('updated_at', 'timestamp'),
+        ('pushed_at', 'timestamp'),
+        ('size', 'long'),
+        ('stargazers_count', 'long'),
+        ('forks', 'long'),
+        ('open_issues', 'long'),
+        ('watchers', 'long'),
+        ('first_seen_at', 'timestamp'),
+        ('last_seen_at', 'timestamp'),
+    ],
+    'Users': [
+        ('user_id', 'long'),
+        ('user_name', 'string'),
+        ('site_admin', 'boolean'),
+        ('first_seen_at', 'timestamp'),
+        ('last_seen_at', 'timestamp'),
+    ],
+    'Orgs': [
+        ('org_id', 'long'),
+        ('org_name', 'string'),
+        ('first_seen_at', 'timestamp'),
+        ('last_seen_at', 'timestamp'),
+    ],
+    # The rollups, see rollups.py
+    'RepoDaily': rollup_columns('date'),
+    'RepoMonthly': rollup_columns('month'),
+    # The cache of raw events the extractors read, see event_cache.py
+    'Events': [
+        ('id', 'string'),
+        ('type', 'string'),
+        ('created_at', 'string'),
+        ('created_date', 'date'),
+        ('actor_id', 'long'),
+        ('actor_login', 'string'),
+        ('repo_id', 'long'),
+        ('repo_name', 'string'),
+        ('org_id', 'long'),
+        ('org_login', 'string'),
+        ('public', 'boolean'),
+        ('payload', 'string'),
+        ('extra', 'string'),
+        ('source_file', 'string'),
+        ('source_line', 'long'),
+    ],
+    # Events no extractor could make a row of, with the error and the raw event
+    'DeadLetters': [
+        ('table', 'string'),
+        ('event_type', 'string'),
+        ('id', 'string'),
+        ('created_at', 'timestamp'),
+        ('source_file', 'string'),
+        ('source_line', 'long'),
+        ('error', 'string'),
+        ('event', 'string'),
+    ],
+}
+
+# The fields of each commit nested in a push, before Commits is exploded from PushEvents
+PUSH_COMMIT_FIELDS = [
+    ('sha', 'string'),
+    ('author_name', 'string'),
+    ('url', 'string'),
+    ('message', 'string'),
+]
+
+
+def columns(table):
+    """A table's column names, in order"""
+    return [name for name, _ in TABLE_SCHEMAS[table]]
+
+
+def arrow_type(type_string):
+    """The pyarrow type for one of our Spark SQL type strings, as Spark writes it to Parquet"""
+    import pyarrow as pa
+
+    if type_string.startswith('array<'):
+        return pa.list_(arrow_type(type_string[len('array<'):-1]))
+    if type_string.startswith('map<'):
+        key, value = type_string[len('map<'):-1].split(',', 1)
+        return pa.map_(arrow_type(key), arrow_type(value))
+    return {
+        'string': pa.string(),
+        'long': pa.int64(),
+        'integer': pa.int32(),
+        'double': pa.float64(),
+        'boolean': pa.bool_(),
+        'timestamp': pa.timestamp('us', tz='UTC'),
+        'date': pa.date32(),
+        'binary': pa.binary(),
+    }[type_string]
+
+
+def arrow_schema(table):
+    """A table's schema as a pyarrow Schema"""
+    import pyarrow as pa
+    return pa.schema([pa.field(name, arrow_type(t)) for name, t in TABLE_SCHEMAS[table]])
+
+
+def spark_type(type_string):
+    """The pyspark DataType for one of our Spark SQL type strings"""
+    from pyspark.sql import types
+
+    if type_string.startswith('array<'):
+        return types.ArrayType(spark_type(type_string[len('array<'):-1]))
+    if type_string.startswith('map<'):
+        key, value = type_string[len('map<'):-1].split(',', 1)
+        return types.MapType(spark_type(key), spark_type(value))
+    return {
+        'string': types.StringType(),
+        'long': types.LongType(),
+        'integer': types.IntegerType(),
+        'double': types.DoubleType(),
+        'boolean': types.BooleanType(),
+        'timestamp': types.TimestampType(),
+        'date': types.DateType(),
+        'binary': types.BinaryType(),
+    }[type_string]
+
+
+def spark_schema(table):
+    """A table's schema as a pyspark StructType"""
+    from pyspark.sql.types import StructField, StructType
+    return StructType([StructField(name, spark_type(t)) for name, t in TABLE_SCHEMAS[table]])
+
+
+def push_commits_schema():
+    """PushEvents as a pyspark StructType, plus each push's commits as an array of PUSH_COMMIT_FIELDS structs"""
+    from pyspark.sql.types import ArrayType, StructField, StructType
+
+    commit = StructType([StructField(name, spark_type(t)) for name, t in PUSH_COMMIT_FIELDS])
+    return StructType(spark_schema('PushEvents').fields + [StructField('commits', ArrayType(commit))])
+
+
+def fits(value, type_string):
+    """Whether a row dict value already has the Python type a column type needs, None always fits"""
+    if value is None:
+        return True
+    if type_string.startswith('array<'):
+        return isinstance(value, list) and all(fits(v, type_string[len('array<'):-1]) for v in value)
+    if type_string.startswith('map<'):
+        return isinstance(value, dict)
+    if type_string in ('long', 'integer'):
+        return isinstance(value, int) and not isinstance(value, bool)
+    return isinstance(value, {
+        'string': str,
+        'double': (int, float),
+        'boolean': bool,
+        'timestamp': datetime,
+        'binary': (bytes, bytearray),
+    }.get(type_string, object))
+
+
+def json_text(value):
+    """A value as Spark's JSON reader gives it for a string field: strings as is, anything else as JSON"""
+    if value is None or isinstance(value, str):
+        return value
+    return json.dumps(value)
+
+
+def coerce(value, type_string, map_items=False):
+    """A row dict value converted to a column type, or None if it can't be. Maps are dicts, or lists of (key,
+    value) pairs for pyarrow with map_items."""
+    if value is None:
+        return None
+    if type_string == 'string':
+        return json_text(value)
+    if type_string.startswith('array<'):
+        element = type_string[len('array<'):-1]
+        return [coerce(v, element, map_items) for v in value] if isinstance(value, list) else None
+    if type_string.startswith('map<'):
+        if not isinstance(value, dict):
+            return None
+        items = [(k, json_text(v)) for k, v in value.items()]
+        return items if map_items else dict(items)
+    if fits(value, type_string):
+        return value
+    if type_string in ('long', 'integer') and isinstance(value, str):
+        try:
+            return int(value)
+        except ValueError:
+            return None
+    return None
+
+
+def coerce_row(table, row, map_items=False):
+    """A row dict as a tuple of values fitting a table's schema, in column order"""
+    return tuple(coerce(row.get(name), t, map_items) for name, t in TABLE_SCHEMAS[table])
+
+
+def coerce_push_commits(row):
+    """A push row dict with nested commits as a tuple fitting push_commits_schema"""
+    commits = [tuple(coerce(c.get(name), t) for name, t in PUSH_COMMIT_FIELDS) for c in row.get('commits') or []]
+    return coerce_row('PushEvents', row) + (commits,)
+
+
+def violations(table, row):
+    """Columns of a table whose values in a row dict don't fit the schema, including columns the row lacks"""
+    return [name for name, t in TABLE_SCHEMAS[table] if name not in row or not fits(row[name], t)]
@@ -0,0 +1,267 @@
+"""Convert hourly gharchive.org files to the Parquet tables as they land, with Spark Structured Streaming.
+
+Usage: python stream_parquet_tables.py --landing s3://github-landing --output s3://github-superset-parquet [--dsn ...]
+
+New `.json.gz` files in the landing directory are picked up in micro-batches. Each batch is routed into the event
+cache and extracted into every table with the native column expressions, exactly as an incremental run of
+build_parquet_tables.spark.py would, then published into tables partitioned by created_date through the same
+manifest. Structured Streaming's checkpoint remembers which files each batch read, and a batch replayed after a
+failure has the same run id, so it is skipped if it committed and its half published files are removed if it didn't.
+A stream whose checkpoint is lost would number its batches from 0 again, so it refuses to start under a name that has
+committed runs.
+With --dsn each batch's new files are also appended to Postgres, recorded there by run id so none is loaded twice.
+
+Dimension tables, rollups and dead letters are left to the batch job.
+"""
+import argparse
+import json
+import os
+import sys
+
+import column_profiles
+import dedupe
+import decoder
+import event_cache
+import file_index
+import native_extract
+import prefilter
+import schemas
+import timestamps
+import vectorized_extract
+from column_profiles import TEXT_COLUMNS, side_tables, spark_options, split_text, text_policies
+from decoder import Decoder, json_library
+from dedupe import dedupe_events, new_events, overlapping_dates
+from event_cache import cache_row, numbered_lines
+from file_index import index_files
+from layout import OutputLayout, estimate_row_bytes
+from manifest import Manifest, delete, exists, glob_status, has_parquet, hour_key, publish
+from native_extract import NATIVE_TABLES, extract_table
+from prefilter import RepoAllowlist
+from schemas import TABLE_FILES, coerce_row, spark_schema
+
+OUTPUT_PATH = os.environ.get('GITHUB_OUTPUT_PATH', 's3://github-superset-parquet')
+
+# The same event types the batch job caches by default, see GITHUB_EVENT_TYPES there
+EVENT_TYPES = os.environ.get('GITHUB_EVENT_TYPES', ','.join(sorted(set(t for t, _, _ in NATIVE_TABLES.values()))))
+EVENT_TYPES = None if EVENT_TYPES == '*' else EVENT_TYPES.split(',')
+
+# Every table with native column expressions, Commits partitioned by the time of its push
+TABLES = sorted(NATIVE_TABLES)
+DATE_COLUMNS = {'Commits': 'push_created_at'}
+
+
+def router(decoder, allowlist):
+    """A function routing a raw line, with its file and line number, into rows of the event cache, like route_event"""
+
+    def route(numbered):
+        source_file, source_line, line = numbered
+        if allowlist.enabled and not allowlist.line_may_match(line):
+            return []
+
+        event_type, record, error = decoder.decode(line)
+        if error is not None:
+            return [coerce_row('Events', dict(cache_row({}, 'ParseError', source_file, source_line), payload=line))]
+        if record is None or (allowlist.enabled and not allowlist.record_matches(record)):
+            return []
+        return [coerce_row('Events', cache_row(record, event_type, source_file, source_line))]
+
+    return route
+
+
+class MicroBatchWriter(object):
+    """Converts and publishes each micro-batch of raw lines, tagged with the file each came from"""
+
+    def __init__(self, spark, output, name, layout, route, loader=None, dedupe=True, vectorized=False,
+                 file_index=True, policies=None):
+        self.spark = spark
+        self.sc = spark.sparkContext
+        self.output = output.rstrip('/')
+        self.name = name
+        self.layout = layout
+        self.route = route
+        self.loader = loader
+        self.dedupe = dedupe
+        self.vectorized = vectorized
+        self.file_index = file_index
+        self.policies = policies or {}
+        self.tables = TABLES + side_tables(self.policies)
+        self.cache_path = os.environ.get('GITHUB_EVENT_CACHE_PATH', self.output + '/_events')
+        self.manifest = Manifest(self.sc, os.environ.get('GITHUB_MANIFEST_PATH', self.output + '/_manifest'))
+
+    def table_path(self, table):
+        return self.output + '/' + TABLE_FILES[table]
+
+    def __call__(self, batch, batch_id):
+        """foreachBatch: publish one micro-batch, once, whatever replays Structured Streaming makes"""
+
+        # A batch is replayed with the same id after a failure, and a committed one needs nothing more
+        run_id = '{}-{:010d}'.format(self.name, batch_id)
+        if self.manifest.committed(run_id):
+            return
+        recovered = self.manifest.recover([self.table_path(table) for table in self.tables] + [self.cache_path])
+
+        batch = batch.persist()
+        try:
+            input_files = sorted(row['file'] for row in batch.select('file').distinct().collect())
+            if input_files:
+                summary = self.convert(batch, run_id, input_files)
+                summary['recovered_runs'] = recovered
+                sys.stdout.write(json.dumps(summary, sort_keys=True) + '\n')
+                sys.stdout.flush()
+        finally:
+            batch.unpersist()
+
+    def convert(self, batch, run_id, input_files):
+        """Route, extract and publish the lines of a batch's input files, returning a summary of the run"""
+
+        staging = '{}/_staging/{}'.format(self.output, run_id)
+        events_path = staging + '/_events'
+
+        # Only the routing function goes to the workers, not the writer with its Spark session and connections
+        route = self.route
+        routed = batch.select('file', 'value').rdd.mapPartitions(numbered_lines).flatMap(route)
+        events = self.spark.createDataFrame(routed, spark_schema('Events'), verifySchema=False) \
+            .repartition('type', 'created_date')
+        if self.dedupe:
+            events = dedupe_events(events)
+        if self.dedupe and exists(self.sc, self.cache_path):
+            dates = overlapping_dates(hour_key(f) for f in input_files)
+            events = new_events(events, self.spark.read.parquet(self.cache_path), dates) \
+                .repartition('type', 'created_date')
+        events.write.partitionBy('type', 'created_date').mode('overwrite').parquet(events_path)
+
+        # Files whose events were all skipped or filtered leave nothing to extract, only hours to record
+        counts = {}
+        if has_parquet(self.sc, events_path):
+            counts = self.spark.read.parquet(events_path).groupBy('type').count().collect()
+            counts = {row['type']: row['count'] for row in counts}
+
+        for table in TABLES:
+            event_type = NATIVE_TABLES[table][0]
+            if event_type not in counts:
+                continue
+            df = extract_table(self.spark, events_path, table, self.vectorized)
+            date_column = DATE_COLUMNS.get(table, 'created_at')
+
+            # Offload or trim the free text, extracting once for both when offloading, see column_profiles.py
+            side = persisted = None
+            policy = self.policies.get(table)
+            if policy is not None:
+                if policy.offloads:
+                    df = persisted = df.persist()
+                df, side = split_text(df, table, policy)
+            if side is not None:
+                side_table = TEXT_COLUMNS[table][1]
+                self.layout.write(side, staging + '/' + TABLE_FILES[side_table], date_column, counts[event_type],
+                                  estimate_row_bytes(self.spark, self.table_path(side_table)), policy.codec)
+
+            row_bytes = estimate_row_bytes(self.spark, self.table_path(table))
+            self.layout.write(df, staging + '/' + TABLE_FILES[table], date_column, counts[event_type], row_bytes,
+                              options=spark_options(df.columns))
+            if persisted is not None:
+                persisted.unpersist()
+
+        # Publish the tables and the events, then load them into Postgres, before recording the hours as done
+        self.manifest.begin(run_id, input_files)
+        published = {}
+        for table in self.tables:
+            files = publish(self.sc, staging + '/' + TABLE_FILES[table], self.table_path(table), run_id)
+            if files:
+                published[TABLE_FILES[table]] = files
+            if files and self.file_index:
+                index_files(self.sc, self.table_path(table), files, run_id)
+        publish(self.sc, events_path, self.cache_path, run_id)
+        loaded = self.loader.append(published, run_id) if self.loader is not None else None
+
+        self.manifest.commit(run_id, input_files)
+        delete(self.sc, staging)
+
+        return {
+            'run_id': run_id,
+            'input_files': len(input_files),
+            'records_per_type': counts,
+            'files_published': {table: len(files) for table, files in published.items()},
+            'rows_loaded': loaded,
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--landing', required=True, help='directory the hourly .json.gz files land in')
+    parser.add_argument('--output', default=OUTPUT_PATH, help='directory holding the Parquet tables')
+    parser.add_argument('--checkpoint', default=None,
+                        help='Structured Streaming checkpoint, <output>/_checkpoints/<name> by default')
+    parser.add_argument('--name', default='stream', help='name of the stream, prefixing its run ids')
+    parser.add_argument('--trigger', default='5 minutes', help='processing time between micro-batches')
+    parser.add_argument('--once', action='store_true', help='process what has landed in one batch, then stop')
+    parser.add_argument('--max-files', type=int, default=24, help='hourly files per micro-batch at most')
+    parser.add_argument('--master', default=None, help="Spark master, i.e. 'local[*]' to try it on one machine")
+    parser.add_argument('--dsn', default=os.environ.get('DATABASE_URL'), help='also append each batch to Postgres')
+    parser.add_argument('--schema', default='public', help='Postgres schema to append into')
+    args = parser.parse_args()
+
+    from pyspark.sql import SparkSession
+    from pyspark.sql.functions import input_file_name
+
+    builder = SparkSession.builder.appName('stream_parquet_tables')
+    if args.master:
+        builder = builder.master(args.master)
+    spark = builder.getOrCreate()
+
+    # Ship our modules to the Python workers
+    modules = [
+        column_profiles, decoder, dedupe, event_cache, file_index, native_extract, prefilter, schemas, timestamps,
+        vectorized_extract
+    ]
+    for module in modules:
+        spark.sparkContext.addPyFile(module.__file__)
+
+    # Appends go into partitions, as in incremental runs
+    layout = OutputLayout.from_environ(default_partition_by='date')
+    if not layout.partition_columns:
+        parser.error('Streaming appends into partitions, set GITHUB_PARTITION_BY to date or month')
+
+    extraction_mode = os.environ.get('GITHUB_EXTRACTION_MODE', 'native')
+    if extraction_mode not in ('native', 'vectorized'):
+        parser.error('Streaming extracts natively, GITHUB_EXTRACTION_MODE must be native or vectorized')
+
+    loader = None
+    if args.dsn:
+        from load_postgres import Loader
+        loader = Loader(args.dsn, args.output, args.schema, workers=1)
+
+    route = router(Decoder(EVENT_TYPES, os.environ.get('GITHUB_JSON_LIBRARY')), RepoAllowlist.from_environ())
+    writer = MicroBatchWriter(spark, args.output, args.name, layout, route, loader,
+                              dedupe=os.environ.get('GITHUB_DEDUPE', '1') != '0',
+                              vectorized=extraction_mode == 'vectorized',
+                              file_index=os.environ.get('GITHUB_FILE_INDEX', '1') != '0',
+                              policies=text_policies())
+    print('Streaming {}/*.json.gz to {}, parsing with {}'.format(
+        args.landing.rstrip('/'), args.output, json_library(os.environ.get('GITHUB_JSON_LIBRARY'))[0]
+    ))
+
+    lines = spark.readStream.format('text') \
+        .option('maxFilesPerTrigger', args.max_files) \
+        .load(args.landing.rstrip('/') + '/*.json.gz') \
+        .withColumn('file', input_file_name())
+    checkpoint = args.checkpoint or '{}/_checkpoints/{}'.format(args.output.rstrip('/'), args.name)
+
+    # A new checkpoint numbers its batches from 0 again, and they would be skipped as this name's committed runs
+    if not exists(spark.sparkContext, checkpoint + '/metadata') and \
+            glob_status(spark.sparkContext, '{}/run-{}-{}.json'.format(writer.manifest.path, args.name, '?' * 10)):
+        parser.error('{} has committed runs of stream {!r} but no checkpoint at {}, start it under a new --name'.format(
+            writer.manifest.path, args.name, checkpoint
+        ))
+    query = lines.writeStream.foreachBatch(writer).option('checkpointLocation', checkpoint)
+    query = query.trigger(once=True) if args.once else query.trigger(processingTime=args.trigger)
+
+    try:
+        query.start().awaitTermination()
+    finally:
+        if loader is not None:
+            loader.close()
+        spark.stop()
+
+
+if __name__ == '__main__':
+    main()
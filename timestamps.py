@@ -0,0 +1,60 @@
+"""Fast parsing of the timestamps found in gharchive.org events.
+
+gharchive.org timestamps come in a couple of fixed shapes: ISO-8601 like `2019-06-01T13:04:05Z` from 2015 on, and
+`2012/03/10 22:04:48 -0800` before that. Those are matched with precompiled regular expressions instead of dateutil's
+generic parser, repeated strings (repository `created_at` values recur across many events) are memoized, and anything
+else falls back to `dateutil.parser.parse`.
+"""
+import re
+from datetime import datetime, timedelta, timezone
+from functools import lru_cache
+
+from dateutil.parser import parse as duparse
+
+# Distinct timestamp strings remembered per worker
+CACHE_SIZE = 65536
+
+ISO_TIMESTAMP = re.compile(
+    r'^(\d{4})-(\d{2})-(\d{2})[T ](\d{2}):(\d{2}):(\d{2})(?:\.(\d{1,6})\d*)?(Z|[+-]\d{2}:?\d{2})?$'
+)
+OLD_TIMESTAMP = re.compile(r'^(\d{4})/(\d{2})/(\d{2}) (\d{2}):(\d{2}):(\d{2}) ([+-]\d{2}:?\d{2})$')
+
+
+@lru_cache(maxsize=256)
+def offset_timezone(offset):
+    """A tzinfo for a `Z`, `+HHMM` or `+HH:MM` UTC offset, or None for a naive timestamp as duparse does"""
+    if offset is None:
+        return None
+    if offset == 'Z':
+        return timezone.utc
+
+    offset = offset.replace(':', '')
+    minutes = int(offset[1:3]) * 60 + int(offset[3:5])
+    if minutes == 0:
+        return timezone.utc
+    return timezone(timedelta(minutes=-minutes if offset[0] == '-' else minutes))
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def parse_timestamp(value):
+    """Parse a gharchive.org timestamp string into a timezone aware datetime, like duparse but much faster. Missing
+    and empty timestamps parse to None."""
+
+    if not value or not isinstance(value, str):
+        return None
+
+    match = ISO_TIMESTAMP.match(value)
+    if match:
+        year, month, day, hour, minute, second, fraction, offset = match.groups()
+        microsecond = int(fraction.ljust(6, '0')) if fraction else 0
+    else:
+        match = OLD_TIMESTAMP.match(value)
+        if not match:
+            return duparse(value)
+        year, month, day, hour, minute, second, offset = match.groups()
+        microsecond = 0
+
+    return datetime(
+        int(year), int(month), int(day), int(hour), int(minute), int(second), microsecond,
+        tzinfo=offset_timezone(offset)
+    )
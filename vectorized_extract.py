@@ -0,0 +1,75 @@
+"""Vectorized extraction: native column expressions, with the Python-only logic applied to whole columns in batches.
+
+The native expressions in native_extract.py parse timestamps with `to_timestamp` in the two shapes the archive mostly
+uses and read licenses with `get_json_object`. The Python extractors parse timestamps with timestamps.parse_timestamp,
+which falls back to dateutil for any other shape, and keep a license only when it is an object. In the vectorized mode
+native_extract builds those columns with ts() and license_field() from here instead, which call pandas UDFs doing what
+the Python extractors do over Arrow record batches of just those columns, and everything else stays in the JVM. Each
+batch parses its distinct timestamp strings once.
+"""
+import json
+
+from timestamps import parse_timestamp
+
+# The SQL names the UDFs are registered under
+TIMESTAMP_FUNCTION = 'gharchive_timestamp'
+LICENSE_FUNCTION = 'gharchive_license'
+
+
+def parse_timestamps(values):
+    """A pandas Series of gharchive timestamp strings as UTC timestamps, like the Python extractors parse them"""
+    import pandas as pd
+
+    parsed = {}
+    for value in values.dropna().unique():
+        try:
+            at = parse_timestamp(value)
+        except (TypeError, ValueError, OverflowError):
+            at = None
+        if at is not None and at.tzinfo is None:
+            at = pd.Timestamp(at).tz_localize('UTC')
+        parsed[value] = at
+    return pd.to_datetime(values.map(parsed), utc=True)
+
+
+def license_values(licenses, keys):
+    """The key or name of each license, from a pandas Series of their JSON text, None unless it is an object"""
+    import pandas as pd
+
+    def value(text, key):
+        if not isinstance(text, str) or not text.startswith('{'):
+            return None
+        try:
+            license = json.loads(text)
+        except ValueError:
+            return None
+        return license.get(key) if isinstance(license, dict) else None
+
+    return pd.Series([value(text, key) for text, key in zip(licenses, keys)], dtype=object)
+
+
+def ts(field):
+    """SQL expression parsing a gharchive timestamp string with the UDF, in place of native_extract.ts"""
+    return '{}({})'.format(TIMESTAMP_FUNCTION, field)
+
+
+def license_field(field, key, default='NULL'):
+    """SQL expression for license.key/name with the UDF, in place of native_extract.license_field"""
+    return "coalesce({}({}, '{}'), {})".format(LICENSE_FUNCTION, field, key, default)
+
+
+def register(spark):
+    """Register the UDFs as the SQL functions ts() and license_field() call"""
+    import pandas as pd
+    from pyspark.sql.functions import pandas_udf
+
+    @pandas_udf('timestamp')
+    def timestamps(values: pd.Series) -> pd.Series:
+        return parse_timestamps(values)
+
+    @pandas_udf('string')
+    def licenses(values: pd.Series, keys: pd.Series) -> pd.Series:
+        return license_values(values, keys)
+
+    spark.udf.register(TIMESTAMP_FUNCTION, timestamps)
+    spark.udf.register(LICENSE_FUNCTION, licenses)